@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compare the array forest engine against the joblib/sklearn model.
+Checks predict_proba parity, then measures cold start (a fresh predictor.py
+process per call) and in-process batch throughput for both engines.
+
+Usage: python3 benchmark_forest.py [--runs 5] [--batch-sizes 1,100,10000]
+Requires soil_fertility_model.joblib, .npz and .forest
+(all written by train_model.py).
+"""
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+from pathlib import Path
+
+import joblib
+from forest_engine import ArrayForest
+
+BACKEND_DIR = Path(__file__).parent
+SAMPLE = {"N": 45.0, "P": 18.0, "K": 120.0, "pH": 6.5, "EC": 0.8, "OC": 2.1,
+          "S": 10.0, "Zn": 0.6, "Fe": 3.2, "Cu": 0.25, "Mn": 2.5, "B": 0.4}
+
+def random_samples(n, seed=0):
+    """Draw feature rows around the sample point"""
+    rng = np.random.default_rng(seed)
+    base = np.array(list(SAMPLE.values()))
+    return np.abs(base * rng.normal(1.0, 0.5, size=(n, len(base))))
+
+def check_parity(sk_model, array_model, n=20000):
+    """Return the max absolute predict_proba difference between engines"""
+    X = random_samples(n, seed=1)
+    expected = sk_model.predict_proba(X)
+    actual = array_model.predict_proba(X)
+    if list(sk_model.classes_) != list(array_model.classes_):
+        raise SystemExit("Class labels differ between engines")
+    return float(np.max(np.abs(expected - actual)))
+
+def cold_start(engine, runs):
+    """Time a fresh predictor.py process per call"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, str(BACKEND_DIR / 'predictor.py'), '--engine', engine, json.dumps(SAMPLE)],
+            check=True, capture_output=True
+        )
+        times.append(time.perf_counter() - start)
+    return {"median_s": round(float(np.median(times)), 4), "min_s": round(min(times), 4)}
+
+def throughput(model, batch_size, runs):
+    """Rows per second for predict_proba at a given batch size"""
+    X = random_samples(batch_size)
+    model.predict_proba(X)  # warm up
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict_proba(X)
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {"batch_s": round(best, 6), "rows_per_s": round(batch_size / best, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark array forest engine vs joblib')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--batch-sizes', default='1,100,10000')
+    args = parser.parse_args()
+
+    sk_model = joblib.load(BACKEND_DIR / 'soil_fertility_model.joblib')
+    array_model = ArrayForest.load(BACKEND_DIR / 'soil_fertility_model.npz')
+
+    max_diff = check_parity(sk_model, array_model)
+    results = {
+        "parity_max_abs_diff": max_diff,
+        "cold_start": {engine: cold_start(engine, args.runs) for engine in ('joblib', 'arrays', 'mmap')},
+        "throughput": {}
+    }
+    for batch_size in (int(b) for b in args.batch_sizes.split(',')):
+        results["throughput"][batch_size] = {
+            "joblib": throughput(sk_model, batch_size, args.runs),
+            "arrays": throughput(array_model, batch_size, args.runs),
+        }
+
+    print(json.dumps(results, indent=2))
+    if max_diff > 1e-9:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
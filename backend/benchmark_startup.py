@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Startup-time budget for the short-lived Python entry points.
+Runs each scenario under `python -X importtime`, sums the cumulative time of
+the top-level imports and fails if it exceeds the scenario's budget or if a
+module the code path should not need (pandas on an input error, sklearn when
+serving the array engine, ...) was imported.
+
+Usage: python3 benchmark_startup.py [--runs 3] [--json]
+Exit status is 1 when any scenario is over budget.
+"""
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+REPORT_PAYLOAD = {
+    "reportId": "startup_budget",
+    "prediction": {"fertility_level": "High", "fertility_score": 0.85,
+                   "fertilizer_recommendations": [], "crop_recommendations": []},
+    "soil_features": {"ph": 6.5, "nitrogen": 45, "phosphorus": 18, "potassium": 130,
+                      "organic_matter": 3.2, "moisture": 28, "ec": 0.9, "temperature": 22}
+}
+SAMPLE = {"N": 45.0, "P": 18.0, "K": 120.0, "pH": 6.5, "EC": 0.8, "OC": 2.1,
+          "S": 10.0, "Zn": 0.6, "Fe": 3.2, "Cu": 0.25, "Mn": 2.5, "B": 0.4}
+REPORT_MODULES = ['pandas', 'matplotlib', 'seaborn', 'reportlab']
+MODEL_MODULES = ['sklearn', 'joblib']
+
+# name: (argv after the interpreter, stdin, import budget in ms, forbidden modules, required file)
+SCENARIOS = {
+    'predictor_import': (['-c', 'import predictor'], '', 80, ['numpy'] + MODEL_MODULES, None),
+    'predictor_bad_input': (['predictor.py', 'not json'], '', 120, ['numpy'] + MODEL_MODULES, None),
+    'predictor_predict_mmap': (['predictor.py', '--engine', 'mmap', json.dumps(SAMPLE)], '', 350,
+                               MODEL_MODULES + REPORT_MODULES, 'soil_fertility_model.forest'),
+    'report_bad_input': (['generate_report.py'], '', 80, ['numpy'] + REPORT_MODULES, None),
+    'report_csv_only': (['generate_report.py', '--formats', 'csv,json'], json.dumps(REPORT_PAYLOAD), 80,
+                        ['numpy'] + REPORT_MODULES, None),
+}
+
+def parse_importtime(stderr):
+    """Return (total top-level import time in ms, set of imported modules)"""
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        # Nested imports are indented; only count top-level ones
+        if not name.startswith('  '):
+            total_us += int(cumulative)
+    return total_us / 1000.0, modules
+
+def run_scenario(argv, stdin):
+    """Run one scenario under -X importtime"""
+    with tempfile.TemporaryDirectory() as reports_dir:
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime'] + argv,
+            input=stdin, capture_output=True, text=True, cwd=BACKEND_DIR,
+            env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1', REPORTS_DIR=reports_dir)
+        )
+    return parse_importtime(proc.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import-time budget of the Python entry points')
+    parser.add_argument('--runs', type=int, default=3, help='Runs per scenario (the fastest counts)')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+
+    results = {}
+    for name, (argv, stdin, budget_ms, forbidden, required) in SCENARIOS.items():
+        if required and not (BACKEND_DIR / required).exists():
+            results[name] = {'skipped': f'{required} not found (run train_model.py)'}
+            continue
+
+        runs = [run_scenario(argv, stdin) for _ in range(args.runs)]
+        import_ms = min(ms for ms, _ in runs)
+        leaked = sorted(m for m in forbidden if any(m in modules for _, modules in runs))
+        results[name] = {
+            'import_ms': round(import_ms, 1),
+            'budget_ms': budget_ms,
+            'forbidden_imported': leaked,
+            'ok': import_ms <= budget_ms and not leaked,
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            if 'skipped' in result:
+                print(f"SKIP {name}: {result['skipped']}")
+                continue
+            status = 'OK  ' if result['ok'] else 'FAIL'
+            line = f"{status} {name}: {result['import_ms']:.1f} ms (budget {result['budget_ms']} ms)"
+            if result['forbidden_imported']:
+                line += f", imported {', '.join(result['forbidden_imported'])}"
+            print(line)
+
+    if not all(result.get('ok', True) for result in results.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
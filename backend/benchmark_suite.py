@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark suite for the Python backend.
+Each scenario runs in a fresh child process, so peak RSS is per scenario
+and one scenario's imports and caches do not warm up the next:
+
+  predictor_cold_start    a fresh predictor.py process per call
+  predict_warm_b{N}       in-process predict_batch at batch size N
+  synthetic_data_n{N}     generate_synthetic_data with N rows
+  train_model_n{N}        train_model with N rows (in a scratch directory)
+  report_charts / report_pdf / report_csv
+                          one report's charts, PDF and CSV
+
+Results are JSON: ops/s (rows/s where an op is a batch), p50/p95/p99 in
+milliseconds and peak RSS in MB. --save-baseline stores them. --baseline
+compares p50 and peak RSS against a stored run and exits 1 on any
+regression beyond --tolerance.
+
+Usage: python3 benchmark_suite.py [--only predict,report] [--save-baseline FILE] [--baseline FILE]
+The predictor scenarios need a trained model (run train_model.py).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+SAMPLE = {"N": 45.0, "P": 18.0, "K": 120.0, "pH": 6.5, "EC": 0.8, "OC": 2.1,
+          "S": 10.0, "Zn": 0.6, "Fe": 3.2, "Cu": 0.25, "Mn": 2.5, "B": 0.4}
+REPORT_PAYLOAD = {
+    "reportId": "benchmark",
+    "prediction": {
+        "fertility_level": "High", "fertility_score": 0.85,
+        "fertilizer_recommendations": [{"name": "Urea", "dose_kg_per_hectare": 50, "explanation": "Nitrogen boost"}],
+        "crop_recommendations": [{"crop": "Maize", "reason": "Suited to the soil", "expected_yield_t_ha": 8}]
+    },
+    "soil_features": {"ph": 6.5, "nitrogen": 45, "phosphorus": 18, "potassium": 130,
+                      "organic_matter": 3.2, "moisture": 28, "ec": 0.9, "temperature": 22},
+    "location": {"lat": 12.97, "lon": 77.59},
+    "metadata": {},
+    "timestamp": "2026-01-01T00:00:00Z"
+}
+PREDICT_BATCH_SIZES = (1, 100, 10000)
+SYNTHETIC_SIZES = (10000, 100000, 1000000)
+TRAIN_SIZES = (2000, 10000)
+DEFAULT_TOLERANCE = 0.2
+
+def random_samples(n, seed=0):
+    """Feature dicts scattered around the sample point"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    base = np.array(list(SAMPLE.values()))
+    rows = np.abs(base * rng.normal(1.0, 0.3, size=(n, len(base))))
+    return [dict(zip(SAMPLE, map(float, row))) for row in rows]
+
+def bench_predictor_cold_start(runs):
+    """Time a fresh predictor.py process per call"""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, str(BACKEND_DIR / 'predictor.py'), json.dumps(SAMPLE)],
+                       check=True, capture_output=True)
+        times.append(time.perf_counter() - started)
+    return times, 1
+
+def bench_predict_warm(runs, batch_size):
+    """Time predict_batch in a process that has already loaded the model"""
+    import predictor
+    samples = random_samples(batch_size)
+    predictor.predict_batch(samples)
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        predictor.predict_batch(samples)
+        times.append(time.perf_counter() - started)
+    return times, batch_size
+
+def bench_synthetic_data(runs, n_samples):
+    """Time generate_synthetic_data"""
+    from train_model import generate_synthetic_data
+    times = []
+    for run in range(runs):
+        started = time.perf_counter()
+        generate_synthetic_data(n_samples, seed=run)
+        times.append(time.perf_counter() - started)
+    return times, n_samples
+
+def bench_train_model(runs, n_samples):
+    """Time train_model end to end, writing its artifacts to a scratch directory"""
+    import contextlib
+    from train_model import train_model
+    times = []
+    with tempfile.TemporaryDirectory() as scratch, open(os.devnull, 'w') as devnull:
+        os.chdir(scratch)
+        for _ in range(runs):
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(devnull):
+                # Never publish: a throwaway model must not reach the live registry
+                train_model(n_samples, publish=False)
+            times.append(time.perf_counter() - started)
+        os.chdir(BACKEND_DIR)
+    return times, n_samples
+
+def bench_report(runs, stage):
+    """Time one report stage (charts, pdf or csv) after a warm-up call"""
+    import generate_report
+    generate = {
+        'charts': generate_report.generate_charts,
+        'pdf': generate_report.generate_pdf_report,
+        'csv': generate_report.generate_csv_report,
+    }[stage]
+    generate(REPORT_PAYLOAD, 'benchmark')
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        generate(REPORT_PAYLOAD, 'benchmark')
+        times.append(time.perf_counter() - started)
+    return times, 1
+
+def scenarios():
+    """name: (function, argument, default runs, required file)"""
+    table = {'predictor_cold_start': (bench_predictor_cold_start, None, 10, 'soil_fertility_model.joblib')}
+    for size in PREDICT_BATCH_SIZES:
+        table[f'predict_warm_b{size}'] = (bench_predict_warm, size, 50 if size < 10000 else 10,
+                                          'soil_fertility_model.joblib')
+    for size in SYNTHETIC_SIZES:
+        table[f'synthetic_data_n{size}'] = (bench_synthetic_data, size, 5, None)
+    for size in TRAIN_SIZES:
+        table[f'train_model_n{size}'] = (bench_train_model, size, 2, None)
+    for stage in ('charts', 'pdf', 'csv'):
+        table[f'report_{stage}'] = (bench_report, stage, 10, None)
+    return table
+
+def run_child(name, runs):
+    """Run one scenario in this process and print its raw timings"""
+    import resource
+    function, argument, _, _ = scenarios()[name]
+    times, rows = function(runs) if argument is None else function(runs, argument)
+    # Cold-start scenarios do their work in child processes
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({'times_s': times, 'rows': rows, 'peak_rss_mb': peak_kb / 1024}))
+
+def summarize(raw):
+    """ops/s, latency percentiles and peak RSS from one child's output"""
+    import numpy as np
+    times = np.array(raw['times_s'])
+    p50, p95, p99 = np.percentile(times, [50, 95, 99]) * 1000
+    summary = {
+        'runs': len(times),
+        'ops_per_s': round(len(times) / times.sum(), 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'peak_rss_mb': round(raw['peak_rss_mb'], 1),
+    }
+    if raw['rows'] > 1:
+        summary['rows_per_s'] = round(raw['rows'] * len(times) / times.sum(), 1)
+    return summary
+
+def compare(results, baseline, tolerance):
+    """List the metrics that got worse than baseline by more than tolerance"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or 'p50_ms' not in result or 'p50_ms' not in before:
+            continue
+        for metric in ('p50_ms', 'peak_rss_mb'):
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance):
+                regressions.append({
+                    'scenario': name,
+                    'metric': metric,
+                    'baseline': before[metric],
+                    'current': result[metric],
+                    'change': round(result[metric] / before[metric] - 1, 3)
+                })
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the predictor, training and report generation')
+    parser.add_argument('--only', help='Comma-separated scenario name prefixes to run')
+    parser.add_argument('--runs', type=int, help='Override the runs per scenario')
+    parser.add_argument('--baseline', help='Compare against results saved with --save-baseline')
+    parser.add_argument('--save-baseline', metavar='PATH', help='Write the results as a baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative slowdown / RSS growth before a regression is reported')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_child(args.scenario, args.runs)
+        return
+
+    prefixes = args.only.split(',') if args.only else None
+    results = {}
+    with tempfile.TemporaryDirectory() as reports_dir:
+        # Fresh renders and predictions on every run
+        env = dict(os.environ, REPORTS_DIR=reports_dir, REPORT_STORE='off')
+        env.pop('PREDICTION_CACHE', None)
+        for name, (_, _, default_runs, required) in scenarios().items():
+            if prefixes and not any(name.startswith(prefix) for prefix in prefixes):
+                continue
+            if required and not (BACKEND_DIR / required).exists():
+                results[name] = {'skipped': f'{required} not found (run train_model.py)'}
+                continue
+            proc = subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), '--scenario', name,
+                 '--runs', str(args.runs or default_runs)],
+                capture_output=True, text=True, cwd=BACKEND_DIR, env=env
+            )
+            if proc.returncode != 0:
+                results[name] = {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'}
+                continue
+            results[name] = summarize(json.loads(proc.stdout.strip().splitlines()[-1]))
+            print(f"{name}: {results[name]}", file=sys.stderr, flush=True)
+
+    output = {'results': results}
+    if args.baseline:
+        with open(args.baseline) as f:
+            output['regressions'] = compare(results, json.load(f)['results'], args.tolerance)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+
+    print(json.dumps(output, indent=2))
+    if output.get('regressions') or any('error' in result for result in results.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
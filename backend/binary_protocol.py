@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Binary framing for high-volume predictor traffic (predictor.py --binary).
+Rows travel as raw float32 instead of JSON objects, and results as class
+indices plus a probability matrix instead of per-class dicts.
+
+Every message is one frame:
+  MAGIC        4 bytes  b'SOIL'
+  header_len   uint32   little-endian
+  header       JSON     header_len bytes
+  payload      raw little-endian arrays, sized from the header
+
+Request header: {"rows": n, "schema": SCHEMA_VERSION} plus an optional
+"id" that is echoed back. Payload: n x len(FEATURE_ORDER) float32 values,
+row-major in FEATURE_ORDER; the server reads it zero-copy with np.frombuffer.
+
+Response header: {"rows": n, "schema": ..., "classes": [...], "errors":
+{"<row>": [...]}}. Payload: n int32 class indices (-1 for rows that failed
+validation), then an n x len(classes) float32 probability matrix (NaN rows
+where validation failed). A frame that cannot be scored at all gets a
+header with only "error" (and "id") and no payload.
+"""
+
+import json
+import struct
+
+MAGIC = b'SOIL'
+PREFIX = struct.Struct('<4sI')
+MAX_HEADER_BYTES = 1024 * 1024
+# Largest request payload accepted; rows beyond it are refused before allocating
+MAX_PAYLOAD_BYTES = 256 * 1024 * 1024
+INDEX_DTYPE = '<i4'
+VALUE_DTYPE = '<f4'
+
+def _read_exact(stream, size):
+    """Read exactly size bytes into a new bytearray; None at a clean end of stream"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    done = 0
+    while done < size:
+        n = stream.readinto(view[done:])
+        if not n:
+            if done == 0:
+                return None
+            raise EOFError(f"Frame truncated after {done} of {size} bytes")
+        done += n
+    return buffer
+
+def read_header(stream):
+    """Read a frame's prefix and JSON header; None at end of stream"""
+    prefix = _read_exact(stream, PREFIX.size)
+    if prefix is None:
+        return None
+    magic, header_len = PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        raise ValueError("Not a binary predictor frame (bad magic)")
+    if header_len > MAX_HEADER_BYTES:
+        raise ValueError(f"Frame header too large ({header_len} bytes)")
+    encoded = _read_exact(stream, header_len)
+    if encoded is None:
+        raise EOFError("Frame truncated after its prefix")
+    header = json.loads(encoded)
+    if not isinstance(header, dict):
+        raise ValueError("Frame header must be a JSON object")
+    return header
+
+def encode_frame(header, *arrays):
+    """The bytes of one frame: header, then each array's raw bytes"""
+    encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    # tobytes() of a zero-length array is empty, so empty frames need no special case
+    return b''.join([PREFIX.pack(MAGIC, len(encoded)), encoded] + [array.tobytes() for array in arrays])
+
+def write_frame(stream, header, *arrays):
+    """Write one frame with a single write, so a failed write never leaves half a frame followed by another"""
+    stream.write(encode_frame(header, *arrays))
+    stream.flush()
+
+def read_request(stream, n_features, schema_version):
+    """Read one request frame; returns (header, X) with X a read-only float32 view, or None at end of stream"""
+    import numpy as np
+    header = read_header(stream)
+    if header is None:
+        return None
+    rows = header.get('rows')
+    if not isinstance(rows, int) or isinstance(rows, bool) or rows < 0:
+        raise ValueError(f"Frame header needs a non-negative integer 'rows', got {rows!r}")
+    if rows * n_features * 4 > MAX_PAYLOAD_BYTES:
+        raise ValueError(f"Frame of {rows} rows exceeds the {MAX_PAYLOAD_BYTES} byte payload limit")
+    payload = _read_exact(stream, rows * n_features * 4) if rows else bytearray()
+    if payload is None:
+        raise EOFError("Frame payload missing")
+    if header.get('schema') != schema_version:
+        # The payload has been consumed, so the stream stays in sync
+        header['error'] = (f"Feature schema version {header.get('schema')!r} does not match "
+                           f"the predictor's version {schema_version}")
+        return header, None
+    X = np.frombuffer(payload, dtype=VALUE_DTYPE, count=rows * n_features).reshape(rows, n_features)
+    return header, X
+
+def encode_response(header, classes, indices, proba, errors, schema_version):
+    """The bytes of the response frame for a scored request"""
+    import numpy as np
+    response = {
+        'rows': len(indices),
+        'schema': schema_version,
+        'classes': [str(c) for c in classes],
+        'errors': {str(row): messages for row, messages in errors.items()},
+    }
+    if 'id' in header:
+        response['id'] = header['id']
+    return encode_frame(response,
+                        np.ascontiguousarray(indices, dtype=INDEX_DTYPE),
+                        np.ascontiguousarray(proba, dtype=VALUE_DTYPE))
+
+def encode_error(header, message):
+    """The bytes of a frame that only carries an error"""
+    response = {'error': message}
+    if header and 'id' in header:
+        response['id'] = header['id']
+    return encode_frame(response)
+
+def write_error(stream, header, message):
+    """Write a frame that only carries an error"""
+    stream.write(encode_error(header, message))
+    stream.flush()
+
+def encode_request(X, schema_version, request_id=None):
+    """Client side: the bytes of a request frame for a matrix in FEATURE_ORDER"""
+    import io
+    import numpy as np
+    X = np.ascontiguousarray(X, dtype=VALUE_DTYPE)
+    header = {'rows': len(X), 'schema': schema_version}
+    if request_id is not None:
+        header['id'] = request_id
+    buffer = io.BytesIO()
+    write_frame(buffer, header, X)
+    return buffer.getvalue()
+
+def read_response(stream):
+    """Client side: read a response frame; returns (header, indices, proba), or None at end of stream"""
+    import numpy as np
+    header = read_header(stream)
+    if header is None:
+        return None
+    if 'error' in header:
+        return header, None, None
+    rows, n_classes = header['rows'], len(header['classes'])
+    payload = _read_exact(stream, rows * 4 * (1 + n_classes)) if rows else bytearray()
+    indices = np.frombuffer(payload, dtype=INDEX_DTYPE, count=rows)
+    proba = np.frombuffer(payload, dtype=VALUE_DTYPE, count=rows * n_classes,
+                          offset=rows * 4).reshape(rows, n_classes)
+    return header, indices, proba
+
+def serve_binary(infile, outfile, predict_matrix, n_features, schema_version):
+    """Answer request frames from infile until it ends
+
+    predict_matrix(X) returns (classes, indices, proba, errors). A frame
+    that cannot be parsed ends the stream, since the next frame boundary
+    is unknown. Each response is built in full before it is written; if
+    the write fails the stream is abandoned, as the peer may have received
+    part of a frame.
+    """
+    while True:
+        try:
+            request = read_request(infile, n_features, schema_version)
+        except (ValueError, EOFError) as e:
+            try:
+                write_error(outfile, None, f"Invalid frame: {str(e)}")
+            except OSError:
+                pass
+            return
+        if request is None:
+            return
+        header, X = request
+        if X is None:
+            frame = encode_error(header, header['error'])
+        else:
+            try:
+                classes, indices, proba, errors = predict_matrix(X)
+                frame = encode_response(header, classes, indices, proba, errors, schema_version)
+            except Exception as e:
+                frame = encode_error(header, f"Prediction failed: {str(e)}")
+        try:
+            outfile.write(frame)
+            outfile.flush()
+        except OSError:
+            return
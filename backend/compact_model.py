@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Post-training compaction of the exported forest.
+Works on the node arrays written by forest_engine.export_forest and offers
+three latency/size trade-offs:
+
+  prune-K     keep the K trees with the largest marginal contribution
+              (greedy forward selection on a selection split)
+  quantized   thresholds stored as float16, leaf probabilities as uint8
+  distilled   a smaller forest trained on the full forest's labels
+
+Every variant is scored against the full forest on a held-out evaluation
+split: accuracy delta, artifact size and per-sample inference time.
+"""
+
+import io
+import time
+import numpy as np
+
+from forest_engine import ArrayForest, export_forest
+
+DEFAULT_KEEP_TREES = (10, 25, 50)
+DISTILL_PARAMS = {'n_estimators': 10, 'max_depth': 8, 'min_samples_leaf': 2}
+LEAF_VALUE_SCALE = 255
+
+def per_tree_proba(arrays, X):
+    """Leaf class probabilities of every tree, shape (n_samples, n_trees, n_classes)"""
+    forest = ArrayForest.from_arrays(arrays)
+    leaves = forest.apply(X)
+    proba = np.stack([np.take(class_value, leaves) for class_value in forest._value_by_class], axis=2)
+    return proba / forest.value_scale if forest.value_scale is not None else proba
+
+def rank_trees(arrays, X, y):
+    """Order trees by marginal contribution, most useful first
+
+    Greedy forward selection: each step adds the tree that gives the
+    ensemble-so-far the lowest log loss on (X, y).
+    """
+    proba = per_tree_proba(arrays, X)
+    classes = list(arrays['classes'])
+    target = np.array([classes.index(label) for label in y])
+    rows = np.arange(len(target))
+
+    # Only the probability of the true class matters for log loss
+    true_proba = proba[rows, :, target]
+    remaining = list(range(proba.shape[1]))
+    total = np.zeros(len(target))
+    order = []
+    while remaining:
+        candidates = (total[:, None] + true_proba[:, remaining]) / (len(order) + 1)
+        losses = -np.log(np.clip(candidates, 1e-12, None)).mean(axis=0)
+        best = remaining.pop(int(np.argmin(losses)))
+        total += true_proba[:, best]
+        order.append(best)
+    return order
+
+def select_trees(arrays, tree_ids):
+    """Build node arrays containing only the given trees"""
+    roots = arrays['roots']
+    ends = np.append(roots[1:], len(arrays['feature']))
+
+    parts = {name: [] for name in ('feature', 'threshold', 'children_left', 'children_right', 'value')}
+    new_roots = []
+    offset = 0
+    for tree in tree_ids:
+        start, end = int(roots[tree]), int(ends[tree])
+        shift = offset - start
+        for name in ('feature', 'threshold', 'value'):
+            parts[name].append(arrays[name][start:end])
+        for name in ('children_left', 'children_right'):
+            children = arrays[name][start:end]
+            parts[name].append(np.where(children < 0, children, children + shift))
+        new_roots.append(offset)
+        offset += end - start
+
+    selected = {name: np.concatenate(values) for name, values in parts.items()}
+    selected.update({
+        'roots': np.array(new_roots, dtype=np.int32),
+        'max_depth': arrays['max_depth'],
+        'classes': arrays['classes'],
+        'feature_order': arrays['feature_order'],
+    })
+    return selected
+
+def quantize_forest(arrays):
+    """Store thresholds as float16 and leaf probabilities as uint8
+
+    Each leaf row is rounded so its counts sum to exactly LEAF_VALUE_SCALE
+    (largest remainders round up), so forest_engine only has to divide by
+    the scale. The narrow dtypes are kept in the .npz, the mmap artifact and
+    the traversal tables.
+    """
+    scaled = arrays['value'] * LEAF_VALUE_SCALE
+    value = np.floor(scaled)
+    totals = arrays['value'].sum(axis=1)
+    short = np.where(totals > 0, np.rint(LEAF_VALUE_SCALE - value.sum(axis=1)), 0).astype(np.int64)
+    # Rank of each class's remainder within its row, largest first
+    ranks = np.argsort(np.argsort(value - scaled, axis=1, kind='stable'), axis=1)
+    value += ranks < short[:, None]
+    
+    quantized = dict(arrays)
+    quantized['threshold'] = arrays['threshold'].astype(np.float16)
+    quantized['value'] = value.astype(np.uint8)
+    quantized['value_scale'] = np.float64(LEAF_VALUE_SCALE)
+    return quantized
+
+def distill_forest(teacher, X_transfer, feature_order, params=None):
+    """Train a smaller forest on the teacher's predicted labels"""
+    from sklearn.ensemble import RandomForestClassifier
+
+    labels = teacher.predict(X_transfer)
+    student = RandomForestClassifier(random_state=42, **(params or DISTILL_PARAMS))
+    student.fit(X_transfer, labels)
+    return export_forest(student, feature_order)
+
+def artifact_size(arrays):
+    """Size in bytes of the arrays saved as .npz"""
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.tell()
+
+def per_sample_latency(forest, X, runs=200):
+    """Median single-row predict_proba time in microseconds"""
+    rows = X[:runs]
+    times = []
+    for i in range(len(rows)):
+        started = time.perf_counter()
+        forest.predict_proba(rows[i:i + 1])
+        times.append(time.perf_counter() - started)
+    return float(np.median(times)) * 1e6
+
+def evaluate_variant(arrays, X_eval, y_eval):
+    """Accuracy, artifact size and latency of one variant"""
+    forest = ArrayForest.from_arrays(arrays)
+    accuracy = float(np.mean(forest.predict(X_eval) == np.asarray(y_eval)))
+    return {
+        'n_trees': int(len(arrays['roots'])),
+        'n_nodes': int(len(arrays['feature'])),
+        'accuracy': round(accuracy, 4),
+        'size_kb': round(artifact_size(arrays) / 1024, 1),
+        'latency_us': round(per_sample_latency(forest, X_eval), 1),
+    }
+
+def compaction_report(model, arrays, X_select, y_select, X_eval, y_eval,
+                      keep_trees=DEFAULT_KEEP_TREES, X_transfer=None):
+    """Build every compaction variant and score it against the full forest
+
+    Returns {name: (arrays, metrics)}; metrics include accuracy_delta
+    relative to the 'full' variant.
+    """
+    X_select = np.asarray(X_select, dtype=np.float64)
+    X_eval = np.asarray(X_eval, dtype=np.float64)
+
+    variants = {'full': arrays}
+    order = rank_trees(arrays, X_select, y_select)
+    for k in keep_trees:
+        if k < len(order):
+            variants[f'prune-{k}'] = select_trees(arrays, order[:k])
+    variants['quantized'] = quantize_forest(arrays)
+    if X_transfer is not None:
+        variants['distilled'] = distill_forest(model, X_transfer, list(arrays['feature_order']))
+
+    report = {name: (variant, evaluate_variant(variant, X_eval, y_eval)) for name, variant in variants.items()}
+    baseline = report['full'][1]['accuracy']
+    for _, metrics in report.values():
+        metrics['accuracy_delta'] = round(metrics['accuracy'] - baseline, 4)
+    return report
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Soil feature schema shared by train_model.py and predictor.py.
+FEATURES fixes the model's feature order (FEATURE_ORDER is derived from
+it) and the range each feature must fall in to be scored.
+
+Validation is vectorized: samples are packed into a float matrix (NaN where
+a value is missing or not a number) and every range/finiteness check runs
+as one NumPy mask over the whole batch. Only rows that fail get error
+messages built for them.
+
+Importing this module does not import numpy; the validation functions do.
+"""
+
+from itertools import chain
+from collections import namedtuple
+
+FeatureSpec = namedtuple('FeatureSpec', ['name', 'dtype', 'min', 'max', 'required', 'unit'])
+
+# Order matters: it is the column order the model is trained and scored on
+FEATURES = (
+    FeatureSpec('N', 'float64', 0.0, None, True, ''),
+    FeatureSpec('P', 'float64', 0.0, None, True, ''),
+    FeatureSpec('K', 'float64', 0.0, None, True, ''),
+    FeatureSpec('pH', 'float64', 3.0, 10.0, True, ''),
+    FeatureSpec('EC', 'float64', 0.0, 10.0, True, 'dS/m'),
+    FeatureSpec('OC', 'float64', 0.0, None, True, ''),
+    FeatureSpec('S', 'float64', 0.0, None, True, ''),
+    FeatureSpec('Zn', 'float64', 0.0, None, True, ''),
+    FeatureSpec('Fe', 'float64', 0.0, None, True, ''),
+    FeatureSpec('Cu', 'float64', 0.0, None, True, ''),
+    FeatureSpec('Mn', 'float64', 0.0, None, True, ''),
+    FeatureSpec('B', 'float64', 0.0, None, True, ''),
+)
+FEATURE_ORDER = [spec.name for spec in FEATURES]
+# Bump when FEATURES changes order or meaning; binary clients send it with every frame
+SCHEMA_VERSION = 1
+_NUMBER_TYPES = {int, float}
+
+def range_message(spec):
+    """Error message for a value outside spec's range"""
+    if spec.max is None:
+        return f"{spec.name} cannot be negative" if spec.min == 0 else f"{spec.name} must be at least {spec.min}"
+    unit = f" {spec.unit}" if spec.unit else ''
+    return f"{spec.name} must be between {spec.min} and {spec.max}{unit}"
+
+def check_matrix(X):
+    """Schema checks on a (n_samples, n_features) matrix in FEATURE_ORDER (float32 is not copied)
+
+    Returns boolean masks of X's shape: 'nonfinite' (NaN or +/-inf, which
+    includes values packed as NaN because they were missing), 'below' and
+    'above' the feature's range.
+    """
+    import numpy as np
+    X = np.asarray(X)
+    if X.dtype.kind != 'f':
+        X = X.astype(np.float64)
+    lower = np.array([-np.inf if spec.min is None else spec.min for spec in FEATURES])
+    upper = np.array([np.inf if spec.max is None else spec.max for spec in FEATURES])
+    # NaN compares False, so non-finite values only show up in 'nonfinite'
+    with np.errstate(invalid='ignore'):
+        return {
+            'nonfinite': ~np.isfinite(X),
+            'below': X < lower,
+            'above': X > upper,
+        }
+
+def valid_rows(X):
+    """Boolean mask of the rows of X that pass every schema check"""
+    masks = check_matrix(X)
+    return ~(masks['nonfinite'] | masks['below'] | masks['above']).any(axis=1)
+
+def matrix_errors(X):
+    """Error messages for the rows of a matrix in FEATURE_ORDER that fail the schema, by row index"""
+    import numpy as np
+    masks = check_matrix(X)
+    out_of_range = masks['below'] | masks['above']
+    errors = {}
+    for i in np.flatnonzero((masks['nonfinite'] | out_of_range).any(axis=1)):
+        messages = []
+        if masks['nonfinite'][i].any():
+            messages.append(f"Features must be finite: {[FEATURE_ORDER[j] for j in np.flatnonzero(masks['nonfinite'][i])]}")
+        for j in np.flatnonzero(out_of_range[i]):
+            messages.append(range_message(FEATURES[j]))
+        errors[int(i)] = messages
+    return errors
+
+def pack_samples(samples):
+    """Pack feature dicts into a float matrix in FEATURE_ORDER
+
+    Returns (X, missing, non_numeric, not_object): missing/non_numeric are
+    (n, n_features) masks (NaN in X at those cells), not_object flags rows
+    that are not dicts. Missing optional features are left as NaN too.
+    """
+    import numpy as np
+    n_features = len(FEATURES)
+    not_object = np.array([not isinstance(sample, dict) for sample in samples], dtype=bool)
+    empty = [float('nan')] * n_features
+    rows = [empty if skip else [sample.get(name) for name in FEATURE_ORDER]
+            for sample, skip in zip(samples, not_object)]
+    missing = np.zeros((len(rows), n_features), dtype=bool)
+    non_numeric = np.zeros_like(missing)
+
+    # Usually every value is a plain JSON number and the batch converts in one call.
+    # Exact types: bool is an int subclass but never a valid reading.
+    if not set(map(type, chain.from_iterable(rows))) <= _NUMBER_TYPES:
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                if type(value) in _NUMBER_TYPES:
+                    continue
+                if value is None:
+                    missing[i, j] = FEATURES[j].required
+                else:
+                    non_numeric[i, j] = True
+                row[j] = float('nan')
+    try:
+        X = np.array(rows, dtype=np.float64)
+    except OverflowError:
+        # An integer beyond float range becomes +-inf, so only its row fails the finiteness check
+        X = np.array([[_to_float(value) for value in row] for row in rows], dtype=np.float64)
+    return X.reshape(len(rows), n_features), missing, non_numeric, not_object
+
+def _to_float(value):
+    """float(value), with integers too large for a float mapped to +-inf"""
+    try:
+        return float(value)
+    except OverflowError:
+        return float('inf') if value > 0 else float('-inf')
+
+def validate_batch(samples):
+    """Validate a batch of feature dicts against FEATURES
+
+    Returns (X, errors): X is the packed float matrix and errors holds one
+    list of messages per sample, empty for samples that can be scored.
+    """
+    import numpy as np
+    X, missing, non_numeric, not_object = pack_samples(samples)
+    masks = check_matrix(X)
+    optional = np.array([not spec.required for spec in FEATURES])
+    # Missing and non-numeric cells are NaN in X; report them as such, not as non-finite
+    nonfinite = masks['nonfinite'] & ~missing & ~non_numeric & ~(np.isnan(X) & optional)
+    out_of_range = masks['below'] | masks['above']
+
+    errors = [[] for _ in range(len(samples))]
+    bad = not_object | (missing | non_numeric | nonfinite | out_of_range).any(axis=1)
+    for i in np.flatnonzero(bad):
+        if not_object[i]:
+            errors[i].append("Sample must be a JSON object")
+            continue
+        if missing[i].any():
+            errors[i].append(f"Missing features: {[FEATURE_ORDER[j] for j in np.flatnonzero(missing[i])]}")
+        if non_numeric[i].any():
+            errors[i].append(f"Features must be numeric: {[FEATURE_ORDER[j] for j in np.flatnonzero(non_numeric[i])]}")
+        if nonfinite[i].any():
+            errors[i].append(f"Features must be finite: {[FEATURE_ORDER[j] for j in np.flatnonzero(nonfinite[i])]}")
+        for j in np.flatnonzero(out_of_range[i]):
+            errors[i].append(range_message(FEATURES[j]))
+    return X, errors
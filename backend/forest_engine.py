@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Array-backed random forest inference.
+Evaluates a forest exported by train_model.py as flat NumPy node arrays,
+so a serving process only needs numpy (no sklearn, no joblib).
+
+Exported .npz layout (all trees concatenated, child indices are global):
+  feature         int32   (n_nodes,)   split feature, -2 for leaves
+  threshold       float64 (n_nodes,)   split threshold (go left if x <= t)
+  children_left   int32   (n_nodes,)   left child node, -1 for leaves
+  children_right  int32   (n_nodes,)   right child node, -1 for leaves
+  value           float64 (n_nodes, n_classes)  leaf class probabilities
+  roots           int32   (n_trees,)   root node of each tree
+  max_depth       int32   scalar       deepest tree in the forest
+  classes         str     (n_classes,)
+  feature_order   str     (n_features,)
+  value_scale     float64 scalar       optional; present when value is quantized
+
+Quantized forests (compact_model.quantize_forest) keep threshold as float16
+and value as uint8 counts out of value_scale, in the .npz and in the mmap
+artifact alike; leaf values are scaled back as they are looked up.
+
+save_forest_mmap() writes the traversal tables derived from these arrays in
+a raw, memory-mappable layout with a JSON header (see its docstring);
+ArrayForest.load_mmap() opens it zero-copy.
+"""
+
+import json
+import struct
+import hashlib
+import numpy as np
+
+MMAP_MAGIC = b'SOILFRST'
+# Version 2 adds the optional value_scale header field and narrow quantized tables
+MMAP_FORMAT_VERSION = 2
+MMAP_READABLE_VERSIONS = (1, 2)
+MMAP_ALIGNMENT = 64
+
+def export_forest(model, feature_order):
+    """Flatten a fitted RandomForestClassifier into node arrays"""
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+
+    feature, threshold, left, right, value = [], [], [], [], []
+    for tree, offset in zip(trees, offsets):
+        is_leaf = tree.children_left == -1
+        feature.append(np.where(is_leaf, -2, tree.feature))
+        threshold.append(tree.threshold)
+        left.append(np.where(is_leaf, -1, tree.children_left + offset))
+        right.append(np.where(is_leaf, -1, tree.children_right + offset))
+
+        # Same normalisation as DecisionTreeClassifier.predict_proba
+        counts = tree.value[:, 0, :]
+        totals = counts.sum(axis=1, keepdims=True)
+        totals[totals == 0.0] = 1.0
+        value.append(counts / totals)
+
+    return {
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold).astype(np.float64),
+        'children_left': np.concatenate(left).astype(np.int32),
+        'children_right': np.concatenate(right).astype(np.int32),
+        'value': np.concatenate(value).astype(np.float64),
+        'roots': offsets[:-1].astype(np.int32),
+        'max_depth': np.int32(max(tree.max_depth for tree in trees)),
+        'classes': np.asarray(model.classes_).astype(str),
+        'feature_order': np.asarray(feature_order).astype(str),
+    }
+
+def save_forest(arrays, path):
+    """Write exported node arrays to a single .npz file"""
+    np.savez(path, **arrays)
+
+def traversal_tables(arrays):
+    """Build the tables ArrayForest walks from exported node arrays
+
+    Leaves loop back to themselves so every tree can take exactly max_depth
+    steps without masking, and both children of node i sit at 2*i and
+    2*i + 1 so one gather picks the branch. Quantized thresholds and leaf
+    values keep their narrow dtypes (see value_scale()).
+    """
+    is_leaf = arrays['children_left'] < 0
+    node_ids = np.arange(len(arrays['feature']), dtype=np.int64)
+    
+    quantized = 'value_scale' in arrays
+    value = np.asarray(arrays['value'], dtype='<u1' if quantized else '<f8')
+    threshold = np.asarray(arrays['threshold'], dtype='<f2' if quantized else '<f8')
+    
+    return {
+        'split_feature': np.where(is_leaf, 0, arrays['feature']).astype('<i8'),
+        'threshold': threshold,
+        'children': np.stack([
+            np.where(is_leaf, node_ids, arrays['children_left']),
+            np.where(is_leaf, node_ids, arrays['children_right']),
+        ], axis=1).ravel().astype('<i8'),
+        'value_by_class': np.ascontiguousarray(value.T),
+        'roots': np.asarray(arrays['roots'], dtype='<i8'),
+    }
+
+def value_scale(arrays):
+    """Leaf value scale of quantized node arrays, or None"""
+    return float(arrays['value_scale']) if 'value_scale' in arrays else None
+
+def _data_checksum(buffer):
+    """SHA-256 of the table data section"""
+    return hashlib.sha256(buffer).hexdigest()
+
+def save_forest_mmap(arrays, path):
+    """Write a memory-mappable forest artifact
+
+    Layout: MMAP_MAGIC, a little-endian uint64 header length, a JSON header
+    (format version, feature order, classes, max depth, table offsets and a
+    SHA-256 of the data section), then the traversal tables as raw
+    little-endian arrays, each aligned to MMAP_ALIGNMENT bytes.
+    """
+    tables = traversal_tables(arrays)
+    
+    layout = {}
+    data = bytearray()
+    for name, table in tables.items():
+        data.extend(b'\0' * (-len(data) % MMAP_ALIGNMENT))
+        layout[name] = {
+            'dtype': table.dtype.str,
+            'shape': list(table.shape),
+            'offset': len(data),
+        }
+        data.extend(table.tobytes())
+    
+    header = json.dumps({
+        'format_version': MMAP_FORMAT_VERSION,
+        'feature_order': [str(f) for f in arrays['feature_order']],
+        'classes': [str(c) for c in arrays['classes']],
+        'max_depth': int(arrays['max_depth']),
+        'value_scale': value_scale(arrays),
+        'tables': layout,
+        'checksum': _data_checksum(data),
+    }).encode('utf-8')
+    
+    # Pad the header so the data section starts aligned
+    prefix_len = len(MMAP_MAGIC) + 8
+    header += b' ' * (-(prefix_len + len(header)) % MMAP_ALIGNMENT)
+    
+    with open(path, 'wb') as f:
+        f.write(MMAP_MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(data)
+
+def read_mmap_header(path):
+    """Read the JSON header of a memory-mappable forest artifact"""
+    with open(path, 'rb') as f:
+        if f.read(len(MMAP_MAGIC)) != MMAP_MAGIC:
+            raise ValueError(f"{path} is not a forest artifact")
+        (header_len,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len))
+    header['data_offset'] = len(MMAP_MAGIC) + 8 + header_len
+    return header
+
+class ArrayForest:
+    """Random forest evaluated with vectorized NumPy traversal
+
+    Exposes the parts of the sklearn interface used by predictor.py:
+    classes_ and predict_proba().
+    """
+
+    def __init__(self, tables, classes, feature_order, max_depth, value_scale=None):
+        self._split_feature = tables['split_feature']
+        self.threshold = tables['threshold']
+        self._children = tables['children']
+        self._value_by_class = tables['value_by_class']
+        self.roots = tables['roots']
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes).astype(object)
+        self.feature_order = [str(f) for f in feature_order]
+        self.n_features_in_ = len(self.feature_order)
+        # Quantized leaves hold counts out of value_scale
+        self.value_scale = value_scale
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Build a forest from exported node arrays"""
+        return cls(traversal_tables(arrays), arrays['classes'], arrays['feature_order'], arrays['max_depth'],
+                   value_scale(arrays))
+
+    @classmethod
+    def load(cls, path):
+        """Load an exported forest from a .npz file"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls.from_arrays({key: data[key] for key in data.files})
+
+    @classmethod
+    def load_mmap(cls, path, feature_order=None, verify=True):
+        """Open a forest artifact written by save_forest_mmap without copying it
+        
+        The tables are read-only views of one shared mapping, so every worker
+        on a host uses the same page-cached copy. The artifact is refused if
+        its checksum does not match or its feature order differs from
+        feature_order.
+        """
+        header = read_mmap_header(path)
+        if header.get('format_version') not in MMAP_READABLE_VERSIONS:
+            raise ValueError(f"Unsupported forest artifact version: {header.get('format_version')}")
+        if feature_order is not None and header['feature_order'] != list(feature_order):
+            raise ValueError(
+                f"Forest artifact feature order {header['feature_order']} does not match {list(feature_order)}"
+            )
+        if not header['classes']:
+            raise ValueError("Forest artifact has no class labels")
+        
+        data = np.memmap(path, dtype=np.uint8, mode='r', offset=header['data_offset'])
+        if verify and _data_checksum(data) != header['checksum']:
+            raise ValueError("Forest artifact checksum mismatch")
+        
+        tables = {}
+        for name, spec in header['tables'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            tables[name] = np.frombuffer(
+                data, dtype=dtype, count=count, offset=spec['offset']
+            ).reshape(spec['shape'])
+        
+        forest = cls(tables, header['classes'], header['feature_order'], header['max_depth'],
+                     header.get('value_scale'))
+        forest.checksum = header['checksum']
+        return forest
+
+    def apply(self, X):
+        """Return the leaf node reached in every tree, shape (n_samples, n_trees)"""
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected input of shape (n, {self.n_features_in_}), got {X.shape}")
+
+        flat_X = X.ravel()
+        row_offsets = (np.arange(X.shape[0], dtype=np.intp) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots.astype(np.intp), (X.shape[0], len(self.roots))).copy()
+
+        # Every tree advances one level per step; leaves stay where they are
+        for _ in range(self.max_depth):
+            values = np.take(flat_X, row_offsets + np.take(self._split_feature, nodes))
+            go_right = ~(values <= np.take(self.threshold, nodes))
+            nodes = np.take(self._children, 2 * nodes + go_right)
+
+        return nodes
+
+    def predict_proba(self, X, chunk_size=8192):
+        """Average leaf class probabilities over all trees"""
+        X = np.asarray(X)
+        chunks = []
+        # Chunk large batches so the (rows, trees) node matrix stays small
+        for start in range(0, max(len(X), 1), chunk_size):
+            leaves = self.apply(X[start:start + chunk_size])
+            chunks.append(np.stack([
+                np.take(class_value, leaves).mean(axis=1)
+                for class_value in self._value_by_class
+            ], axis=1))
+        proba = np.concatenate(chunks)
+        if self.value_scale is not None:
+            proba /= self.value_scale
+        return proba
+
+    def predict(self, X):
+        """Predict the most probable class"""
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
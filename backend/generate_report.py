@@ -2,21 +2,112 @@
 """
 Soil Fertility Report Generator
 Generates PDF and CSV reports from soil prediction data
+
+Batch mode (--batch SOURCE) generates a report for every payload in an NDJSON
+file or a directory of JSON files over a process pool, optionally writing
+one combined PDF and one tidy CSV, with progress on stderr.
+
+Stream mode (--stream DEST) builds the PDF in memory, chart included, and
+writes it to stdout ('-') or to a listening Unix socket; no files are
+written.
+
+Daemon mode (--serve) keeps a pool of warm worker processes that import the
+plotting/PDF libraries and build the styles once. Report payloads are read
+as newline-delimited JSON on stdin and each result (the same object main()
+prints, plus the payload's "id" if given) is written as one line on stdout.
+The job queue is bounded, so a full queue stops reading stdin, and a job that
+exceeds --timeout gets an error result and its worker is replaced.
 """
 
 import json
 import sys
 import os
 from datetime import datetime
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import seaborn as sns
+
+# matplotlib, seaborn and reportlab are imported inside the functions
+# that use them, so input errors fail fast without paying for them
+
+# Chart rendering: 'fast' (prebuilt Agg figure), 'classic' (pyplot, 300 dpi PNG)
+# or 'vector' (reportlab drawing embedded in the PDF, no matplotlib)
+CHART_MODES = ('fast', 'classic', 'vector')
+CHART_MODE = os.environ.get('REPORT_CHART_MODE', 'fast')
+# Size of the chart in the PDF (inches) and the resolution it is rendered for
+CHART_EMBED_SIZE = (6, 5)
+CHART_DPI = int(os.environ.get('REPORT_CHART_DPI', '150'))
+# Raster charts: 'file' ({report_id}_charts.png in REPORTS_DIR, kept and stored)
+# or 'memory' (rendered into a buffer and embedded, nothing written)
+CHART_OUTPUTS = ('file', 'memory')
+CHART_OUTPUT = os.environ.get('REPORT_CHART_OUTPUT', 'file')
+# Outputs written per report
+REPORT_FORMATS = ('pdf', 'csv', 'json')
+FORMATS = [f for f in os.environ.get('REPORT_FORMATS', 'pdf,csv,json').split(',') if f]
+# Per-report CSV: 'report' (sectioned, human-readable) or 'tidy' (one typed row per sample)
+CSV_LAYOUTS = ('report', 'tidy')
+CSV_LAYOUT = os.environ.get('REPORT_CSV_LAYOUT', 'report')
+
+# Columns of the tidy CSV, one row per sample, and the type each value is written as
+TIDY_CSV_SCHEMA = [
+    ('report_id', str), ('timestamp', str), ('fertility_level', str), ('fertility_score', float),
+    ('ph', float), ('nitrogen', float), ('phosphorus', float), ('potassium', float),
+    ('organic_matter', float), ('moisture', float), ('temperature', float), ('ec', float),
+    ('lat', float), ('lon', float), ('top_fertilizer', str), ('top_crop', str)
+]
+TIDY_CSV_FIELDS = [name for name, _ in TIDY_CSV_SCHEMA]
+
+# Rendered once in memory by warm_up() so a worker's first real chart and PDF are not cold
+WARM_UP_PAYLOAD = {
+    'reportId': 'warm-up',
+    'prediction': {
+        'fertility_level': 'Medium', 'fertility_score': 0.6,
+        'fertilizer_recommendations': [{'name': 'Urea', 'dose_kg_per_hectare': 50, 'explanation': 'Nitrogen boost'}],
+        'crop_recommendations': [{'crop': 'Maize', 'reason': 'Suited to the soil', 'expected_yield_t_ha': 6}]
+    },
+    'soil_features': {'ph': 6.5, 'nitrogen': 45, 'phosphorus': 18, 'potassium': 130,
+                      'organic_matter': 3.2, 'moisture': 28, 'ec': 0.9, 'temperature': 22},
+    'location': {'lat': 0.0, 'lon': 0.0},
+    'metadata': {},
+    'timestamp': '2026-01-01T00:00:00Z'
+}
+
+_chart_style_ready = False
+_chart_template = None
+_report_styles = None
+_report_store = None
+_spatial_index = None
+
+def setup_chart_style():
+    """Apply the matplotlib/seaborn chart style (once per process)"""
+    global _chart_style_ready
+    if _chart_style_ready:
+        return
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    
+    # Set style for better looking plots
+    plt.style.use('seaborn-v0_8')
+    sns.set_palette("husl")
+    _chart_style_ready = True
+
+def get_report_styles():
+    """Return the reportlab style sheet and custom title style (built once per process)"""
+    global _report_styles
+    if _report_styles is None:
+        from reportlab.lib import colors
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        
+        styles = getSampleStyleSheet()
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            alignment=1,  # Center
+            textColor=colors.HexColor('#2E86AB')
+        )
+        _report_styles = (styles, title_style)
+    return _report_styles
 
 def read_input():
     """Read JSON input from stdin"""
@@ -27,12 +118,10 @@ def read_input():
         print(f"Error reading input: {e}", file=sys.stderr)
         sys.exit(1)
 
-def generate_charts(report_data, report_id):
-    """Generate charts for the report"""
-    
-    # Set style for better looking plots
-    plt.style.use('seaborn-v0_8')
-    sns.set_palette("husl")
+def generate_charts_classic(report_data, report_id, out=None):
+    """Generate charts for the report through pyplot at 300 dpi, into out if given"""
+    setup_chart_style()
+    import matplotlib.pyplot as plt
     
     soil_features = report_data['soil_features']
     prediction = report_data['prediction']
@@ -93,34 +182,305 @@ def generate_charts(report_data, report_id):
     
     plt.tight_layout()
     
-    chart_path = os.path.join(os.environ.get('REPORTS_DIR', './reports'), f'{report_id}_charts.png')
-    plt.savefig(chart_path, dpi=300, bbox_inches='tight')
+    chart_path = out if out is not None else os.path.join(os.environ.get('REPORTS_DIR', './reports'), f'{report_id}_charts.png')
+    plt.savefig(chart_path, format='png', dpi=300, bbox_inches='tight')
     plt.close()
     
     return chart_path
 
-def generate_pdf_report(report_data, report_id):
-    """Generate PDF report"""
+class ChartTemplate:
+    """Prebuilt 2x2 chart figure whose artists are updated in place per report
     
-    reports_dir = os.environ.get('REPORTS_DIR', './reports')
-    pdf_path = os.path.join(reports_dir, f'{report_id}.pdf')
+    Drawn through the Agg canvas directly (no pyplot state) and rendered at
+    CHART_DPI for the size the chart is embedded at in the PDF. One template
+    per process; not thread-safe.
+    """
+    
+    FIGSIZE = (12, 10)
+    
+    def __init__(self):
+        from matplotlib import style
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        
+        # Ticks are created lazily at draw time from rcParams, so the style
+        # has to stay applied rather than be scoped to building the template
+        style.use('seaborn-v0_8')
+        
+        self.figure = Figure(figsize=self.FIGSIZE)
+        FigureCanvasAgg(self.figure)
+        self.figure.suptitle('Soil Analysis Report - Visual Summary', fontsize=16, fontweight='bold')
+        (self.ax_npk, self.ax_ph), (self.ax_score, self.ax_env) = self.figure.subplots(2, 2)
+        
+        # Nutrient levels
+        self.npk_bars = self.ax_npk.bar(['Nitrogen', 'Phosphorus', 'Potassium'], [1, 1, 1],
+                                        color=['#FF6B6B', '#4ECDC4', '#45B7D1'])
+        self.ax_npk.set_title('Primary Nutrients (NPK)', fontweight='bold')
+        self.ax_npk.set_ylabel('Concentration (ppm)')
+        self.npk_labels = [
+            self.ax_npk.text(bar.get_x() + bar.get_width()/2, 0, '', ha='center', va='bottom', fontweight='bold')
+            for bar in self.npk_bars
+        ]
+        
+        # pH gauge
+        (self.ph_bar,) = self.ax_ph.bar(['pH Level'], [7], width=0.5)
+        self.ax_ph.set_title('Soil pH Level', fontweight='bold')
+        self.ax_ph.set_ylabel('pH Scale')
+        self.ax_ph.set_ylim(0, 14)
+        self.ax_ph.axhline(y=6.0, color='orange', linestyle='--', alpha=0.7, label='Acidic')
+        self.ax_ph.axhline(y=7.0, color='green', linestyle='--', alpha=0.7, label='Neutral')
+        self.ax_ph.axhline(y=8.0, color='orange', linestyle='--', alpha=0.7, label='Alkaline')
+        self.ph_label = self.ax_ph.text(0, 0, '', ha='center', va='bottom', fontweight='bold', fontsize=14)
+        
+        # Fertility score
+        (self.score_wedge,), (self.score_label,) = self.ax_score.pie([1], labels=[''], startangle=90)
+        self.ax_score.set_title('Fertility Assessment', fontweight='bold')
+        
+        # Environmental factors
+        self.env_bars = self.ax_env.barh(['Temperature', 'Moisture', 'Organic Matter', 'EC'], [1, 1, 1, 1],
+                                         color=['#FF9999', '#66B2FF', '#99FF99', '#FFCC99'])
+        self.ax_env.set_title('Environmental Factors', fontweight='bold')
+        self.ax_env.set_xlabel('Values (°C, %, dS/m)')
+        
+        # Output resolution that gives CHART_DPI at the embedded width
+        self.dpi = CHART_DPI * CHART_EMBED_SIZE[0] / self.FIGSIZE[0]
+    
+    def render(self, report_data, path):
+        """Update the template with one report's values and write it as a PNG to path (or a file object)"""
+        soil_features = report_data['soil_features']
+        prediction = report_data['prediction']
+        
+        values = [soil_features['nitrogen'], soil_features['phosphorus'], soil_features['potassium']]
+        for bar, label, value in zip(self.npk_bars, self.npk_labels, values):
+            bar.set_height(value)
+            label.set_position((bar.get_x() + bar.get_width()/2, value + 1))
+            label.set_text(f'{value}')
+        self.ax_npk.relim()
+        self.ax_npk.autoscale_view()
+        
+        ph_value = soil_features['ph']
+        self.ph_bar.set_height(ph_value)
+        self.ph_bar.set_color('red' if ph_value < 6.0 else 'orange' if ph_value < 7.0 else 'green' if ph_value < 8.0 else 'red')
+        self.ph_label.set_position((0, ph_value + 0.2))
+        self.ph_label.set_text(f'{ph_value}')
+        
+        fertility_score = prediction.get('fertility_score', 0) * 100
+        self.score_wedge.set_facecolor('#FF6B6B' if fertility_score < 50 else '#FFE66D' if fertility_score < 75 else '#4ECDC4')
+        self.score_label.set_text(f'Fertility Score\n{fertility_score:.1f}%')
+        
+        env_values = [soil_features['temperature'], soil_features['moisture'],
+                      soil_features['organic_matter'], soil_features['ec']]
+        for bar, value in zip(self.env_bars, env_values):
+            bar.set_width(value)
+        self.ax_env.relim()
+        self.ax_env.autoscale_view()
+        
+        # Tick labels change width with the data, so lay out again
+        self.figure.tight_layout()
+        self.figure.savefig(path, format='png', dpi=self.dpi)
+
+def get_chart_template():
+    """Return this process's chart template, building it on first use"""
+    global _chart_template
+    if _chart_template is None:
+        _chart_template = ChartTemplate()
+    return _chart_template
+
+def generate_charts(report_data, report_id, chart_mode=None, out=None):
+    """Generate the chart PNG for the report into out, or into REPORTS_DIR, and return where it went"""
+    if (chart_mode or CHART_MODE) == 'classic':
+        return generate_charts_classic(report_data, report_id, out)
+    
+    chart_path = out if out is not None else os.path.join(os.environ.get('REPORTS_DIR', './reports'), f'{report_id}_charts.png')
+    get_chart_template().render(report_data, chart_path)
+    return chart_path
+
+def render_chart_png(report_data, report_id, chart_mode=None):
+    """Render the chart PNG into memory and return the buffer, rewound"""
+    import io
+    buffer = io.BytesIO()
+    generate_charts(report_data, report_id, chart_mode, out=buffer)
+    buffer.seek(0)
+    return buffer
+
+def build_chart_drawing(report_data):
+    """Draw the report charts as reportlab vector graphics (no matplotlib)"""
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    from reportlab.graphics.shapes import Drawing, String, Line
+    from reportlab.graphics.charts.barcharts import VerticalBarChart, HorizontalBarChart
+    from reportlab.graphics.charts.piecharts import Pie
+    
+    soil_features = report_data['soil_features']
+    prediction = report_data['prediction']
+    
+    width, height = CHART_EMBED_SIZE[0] * inch, CHART_EMBED_SIZE[1] * inch
+    drawing = Drawing(width, height)
+    drawing.add(String(width/2, height - 12, 'Soil Analysis Report - Visual Summary',
+                       fontName='Helvetica-Bold', fontSize=11, textAnchor='middle'))
+    panel_w, panel_h = width / 2, (height - 20) / 2
+    
+    def add_title(x0, y0, text):
+        drawing.add(String(x0 + panel_w/2, y0 + panel_h - 12, text,
+                           fontName='Helvetica-Bold', fontSize=8, textAnchor='middle'))
+    
+    def bar_chart(chart_cls, x0, y0, data, names, bar_colors):
+        chart = chart_cls()
+        chart.x, chart.y = x0 + 45, y0 + 20
+        chart.width, chart.height = panel_w - 60, panel_h - 45
+        chart.data = [data]
+        chart.categoryAxis.categoryNames = names
+        chart.categoryAxis.labels.fontSize = 6
+        chart.valueAxis.labels.fontSize = 6
+        chart.valueAxis.valueMin = 0
+        chart.barLabelFormat = '%s'
+        chart.barLabels.fontName = 'Helvetica-Bold'
+        chart.barLabels.fontSize = 6
+        for i, color in enumerate(bar_colors):
+            chart.bars[(0, i)].fillColor = colors.HexColor(color) if color.startswith('#') else getattr(colors, color)
+        drawing.add(chart)
+        return chart
+    
+    # Nutrient levels
+    x0, y0 = 0, panel_h
+    add_title(x0, y0, 'Primary Nutrients (NPK)')
+    chart = bar_chart(VerticalBarChart, x0, y0,
+                      [soil_features['nitrogen'], soil_features['phosphorus'], soil_features['potassium']],
+                      ['Nitrogen', 'Phosphorus', 'Potassium'], ['#FF6B6B', '#4ECDC4', '#45B7D1'])
+    chart.barLabels.nudge = 6
+    
+    # pH gauge
+    ph_value = soil_features['ph']
+    ph_color = 'red' if ph_value < 6.0 else 'orange' if ph_value < 7.0 else 'green' if ph_value < 8.0 else 'red'
+    x0, y0 = panel_w, panel_h
+    add_title(x0, y0, 'Soil pH Level')
+    chart = bar_chart(VerticalBarChart, x0, y0, [ph_value], ['pH Level'], [ph_color])
+    chart.valueAxis.valueMax = 14
+    chart.valueAxis.valueStep = 2
+    chart.barLabels.nudge = 6
+    for level, color in ((6.0, colors.orange), (7.0, colors.green), (8.0, colors.orange)):
+        y = chart.y + chart.height * level / 14
+        drawing.add(Line(chart.x, y, chart.x + chart.width, y, strokeColor=color,
+                         strokeDashArray=[3, 2], strokeWidth=0.8))
+    
+    # Fertility score
+    fertility_score = prediction.get('fertility_score', 0) * 100
+    x0, y0 = 0, 0
+    add_title(x0, y0, 'Fertility Assessment')
+    pie = Pie()
+    size = panel_h - 60
+    pie.x, pie.y = x0 + (panel_w - size) / 2, y0 + 30
+    pie.width = pie.height = size
+    pie.data = [1]
+    pie.slices.strokeColor = colors.white
+    pie.slices[0].fillColor = colors.HexColor(
+        '#FF6B6B' if fertility_score < 50 else '#FFE66D' if fertility_score < 75 else '#4ECDC4'
+    )
+    drawing.add(pie)
+    drawing.add(String(x0 + panel_w/2, y0 + 12, f'Fertility Score {fertility_score:.1f}%',
+                       fontName='Helvetica', fontSize=8, textAnchor='middle'))
+    
+    # Environmental factors
+    x0, y0 = panel_w, 0
+    add_title(x0, y0, 'Environmental Factors')
+    chart = bar_chart(HorizontalBarChart, x0 + 20, y0,
+                      [soil_features['temperature'], soil_features['moisture'],
+                       soil_features['organic_matter'], soil_features['ec']],
+                      ['Temperature', 'Moisture', 'Organic Matter', 'EC'],
+                      ['#FF9999', '#66B2FF', '#99FF99', '#FFCC99'])
+    chart.x, chart.width = x0 + 65, panel_w - 80
+    chart.barLabels.dx = 8
+    
+    return drawing
+
+def chart_flowable(report_data, report_id, render=True):
+    """Return the chart to embed in the PDF, or None if there is no chart image
+    
+    With render=False a raster chart already written for this report is
+    reused. With CHART_OUTPUT 'memory' there is no file to reuse, so the
+    chart is always rendered into a buffer.
+    """
+    from reportlab.platypus import Image
+    from reportlab.lib.units import inch
+    
+    if CHART_MODE == 'vector':
+        return build_chart_drawing(report_data)
+    
+    if CHART_OUTPUT == 'memory':
+        return Image(render_chart_png(report_data, report_id),
+                     width=CHART_EMBED_SIZE[0]*inch, height=CHART_EMBED_SIZE[1]*inch)
+    
+    if render:
+        chart_path = generate_charts(report_data, report_id)
+    else:
+        chart_path = os.path.join(os.environ.get('REPORTS_DIR', './reports'), f'{report_id}_charts.png')
+    if not os.path.exists(chart_path):
+        return None
+    return Image(chart_path, width=CHART_EMBED_SIZE[0]*inch, height=CHART_EMBED_SIZE[1]*inch)
+
+def generate_pdf_report(report_data, report_id, timings=None, out=None, render_chart=True):
+    """Generate PDF report, recording the chart and PDF stage times in timings if given
+    
+    The PDF goes to out (a path or binary file object) if given, otherwise
+    to REPORTS_DIR; where it went is returned. With render_chart=False an
+    existing {report_id}_charts.png is embedded instead of rendering one.
+    """
+    import time
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate
+    
+    pdf_path = out if out is not None else os.path.join(os.environ.get('REPORTS_DIR', './reports'), f'{report_id}.pdf')
     
     # Generate charts first
-    chart_path = generate_charts(report_data, report_id)
+    started = time.perf_counter()
+    chart = chart_flowable(report_data, report_id, render_chart)
+    charts_done = time.perf_counter()
     
     doc = SimpleDocTemplate(pdf_path, pagesize=A4)
-    styles = getSampleStyleSheet()
+    doc.build(build_report_story(report_data, report_id, chart))
+    
+    if timings is not None:
+        timings['charts'] = round((charts_done - started) * 1000, 2)
+        timings['pdf'] = round((time.perf_counter() - charts_done) * 1000, 2)
+    return pdf_path
+
+def stream_pdf_report(report_data, dest):
+    """Build the PDF in memory and send it to stdout ('-') or a Unix socket path
+    
+    Charts are rendered in memory too (or drawn as vectors), so nothing is
+    written to REPORTS_DIR. Returns the number of bytes sent.
+    """
+    import io
+    global CHART_OUTPUT
+    
+    buffer = io.BytesIO()
+    chart_output, CHART_OUTPUT = CHART_OUTPUT, 'memory'
+    try:
+        generate_pdf_report(report_data, report_data['reportId'], out=buffer)
+    finally:
+        CHART_OUTPUT = chart_output
+    
+    data = buffer.getbuffer()
+    if dest == '-':
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    else:
+        import socket
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(dest)
+            sock.sendall(data)
+    return len(data)
+
+def build_report_story(report_data, report_id, chart):
+    """Build the PDF flowables for one report"""
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.units import inch
+    
+    styles, title_style = get_report_styles()
     story = []
     
     # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        alignment=1,  # Center
-        textColor=colors.HexColor('#2E86AB')
-    )
     story.append(Paragraph("Soil Fertility Analysis Report", title_style))
     story.append(Spacer(1, 20))
     
@@ -176,9 +536,9 @@ def generate_pdf_report(report_data, report_id):
     story.append(Spacer(1, 20))
     
     # Charts
-    if os.path.exists(chart_path):
+    if chart is not None:
         story.append(Paragraph("Visual Analysis", styles['Heading2']))
-        story.append(Image(chart_path, width=6*inch, height=5*inch))
+        story.append(chart)
         story.append(Spacer(1, 20))
     
     # Recommendations
@@ -207,88 +567,611 @@ def generate_pdf_report(report_data, report_id):
                 story.append(Paragraph(f"Expected yield: {crop['expected_yield_t_ha']:.1f} tonnes/hectare", styles['Normal']))
             story.append(Spacer(1, 10))
     
-    # Build PDF
-    doc.build(story)
-    
-    return pdf_path
+    return story
 
 def generate_csv_report(report_data, report_id):
     """Generate CSV report"""
+    import csv
     
     reports_dir = os.environ.get('REPORTS_DIR', './reports')
     csv_path = os.path.join(reports_dir, f'{report_id}.csv')
     
-    # Prepare data for CSV
-    data = []
+    if CSV_LAYOUT == 'tidy':
+        with TidyCSVWriter(csv_path, append=False) as writer:
+            writer.write(report_data)
+        return csv_path
     
-    # Basic info
-    data.append(['Report Information', '', '', ''])
-    data.append(['Report ID', report_id, '', ''])
-    data.append(['Generated', datetime.now().strftime('%Y-%m-%d %H:%M:%S'), '', ''])
-    data.append(['Fertility Level', report_data['prediction'].get('fertility_level', 'Unknown'), '', ''])
-    data.append(['Fertility Score', f"{report_data['prediction'].get('fertility_score', 0) * 100:.1f}%", '', ''])
-    data.append(['', '', '', ''])
+    # Rows are written as they are produced
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        
+        # Basic info
+        writer.writerow(['Report Information', '', '', ''])
+        writer.writerow(['Report ID', report_id, '', ''])
+        writer.writerow(['Generated', datetime.now().strftime('%Y-%m-%d %H:%M:%S'), '', ''])
+        writer.writerow(['Fertility Level', report_data['prediction'].get('fertility_level', 'Unknown'), '', ''])
+        writer.writerow(['Fertility Score', f"{report_data['prediction'].get('fertility_score', 0) * 100:.1f}%", '', ''])
+        writer.writerow(['', '', '', ''])
+        
+        # Soil parameters
+        writer.writerow(['Soil Parameters', 'Value', 'Unit', 'Notes'])
+        soil_features = report_data['soil_features']
+        writer.writerow(['pH Level', f"{soil_features['ph']:.2f}", '-', '6.0-7.0 optimal'])
+        writer.writerow(['Nitrogen (N)', f"{soil_features['nitrogen']:.1f}", 'ppm', 'Primary nutrient'])
+        writer.writerow(['Phosphorus (P)', f"{soil_features['phosphorus']:.1f}", 'ppm', 'Root development'])
+        writer.writerow(['Potassium (K)', f"{soil_features['potassium']:.1f}", 'ppm', 'Disease resistance'])
+        writer.writerow(['Organic Matter', f"{soil_features['organic_matter']:.2f}", '%', '2-4% good range'])
+        writer.writerow(['Moisture Content', f"{soil_features['moisture']:.1f}", '%', 'Water holding capacity'])
+        writer.writerow(['Soil Temperature', f"{soil_features['temperature']:.1f}", '°C', 'Affects nutrient availability'])
+        writer.writerow(['Electrical Conductivity', f"{soil_features['ec']:.2f}", 'dS/m', 'Salinity indicator'])
+        writer.writerow(['', '', '', ''])
+        
+        # Fertilizer recommendations
+        writer.writerow(['Fertilizer Recommendations', '', '', ''])
+        writer.writerow(['Fertilizer Name', 'Dosage (kg/ha)', 'Explanation', ''])
+        for fert in report_data['prediction'].get('fertilizer_recommendations', []):
+            writer.writerow([fert['name'], f"{fert['dose_kg_per_hectare']:.1f}", fert['explanation'], ''])
+        writer.writerow(['', '', '', ''])
+        
+        # Crop recommendations
+        writer.writerow(['Crop Recommendations', '', '', ''])
+        writer.writerow(['Crop Name', 'Expected Yield (t/ha)', 'Reason', ''])
+        for crop in report_data['prediction'].get('crop_recommendations', []):
+            yield_str = f"{crop.get('expected_yield_t_ha', 0):.1f}" if crop.get('expected_yield_t_ha', 0) > 0 else 'N/A'
+            writer.writerow([crop['crop'], yield_str, crop['reason'], ''])
     
-    # Soil parameters
-    data.append(['Soil Parameters', 'Value', 'Unit', 'Notes'])
+    return csv_path
+
+def tidy_row(report_data):
+    """Flatten one report into a row of TIDY_CSV_SCHEMA values ('' where missing)"""
+    prediction = report_data['prediction']
     soil_features = report_data['soil_features']
-    data.append(['pH Level', f"{soil_features['ph']:.2f}", '-', '6.0-7.0 optimal'])
-    data.append(['Nitrogen (N)', f"{soil_features['nitrogen']:.1f}", 'ppm', 'Primary nutrient'])
-    data.append(['Phosphorus (P)', f"{soil_features['phosphorus']:.1f}", 'ppm', 'Root development'])
-    data.append(['Potassium (K)', f"{soil_features['potassium']:.1f}", 'ppm', 'Disease resistance'])
-    data.append(['Organic Matter', f"{soil_features['organic_matter']:.2f}", '%', '2-4% good range'])
-    data.append(['Moisture Content', f"{soil_features['moisture']:.1f}", '%', 'Water holding capacity'])
-    data.append(['Soil Temperature', f"{soil_features['temperature']:.1f}", '°C', 'Affects nutrient availability'])
-    data.append(['Electrical Conductivity', f"{soil_features['ec']:.2f}", 'dS/m', 'Salinity indicator'])
-    data.append(['', '', '', ''])
-    
-    # Fertilizer recommendations
-    data.append(['Fertilizer Recommendations', '', '', ''])
-    data.append(['Fertilizer Name', 'Dosage (kg/ha)', 'Explanation', ''])
-    fertilizers = report_data['prediction'].get('fertilizer_recommendations', [])
-    for fert in fertilizers:
-        data.append([fert['name'], f"{fert['dose_kg_per_hectare']:.1f}", fert['explanation'], ''])
-    data.append(['', '', '', ''])
+    location = report_data.get('location') or {}
+    fertilizers = prediction.get('fertilizer_recommendations') or []
+    crops = prediction.get('crop_recommendations') or []
+    values = {
+        'report_id': report_data['reportId'],
+        'timestamp': report_data.get('timestamp'),
+        'fertility_level': prediction.get('fertility_level', 'Unknown'),
+        'fertility_score': prediction.get('fertility_score', 0),
+        'lat': location.get('lat'),
+        'lon': location.get('lon'),
+        'top_fertilizer': fertilizers[0]['name'] if fertilizers else None,
+        'top_crop': crops[0]['crop'] if crops else None,
+    }
+    for name in ('ph', 'nitrogen', 'phosphorus', 'potassium', 'organic_matter', 'moisture', 'temperature', 'ec'):
+        values[name] = soil_features.get(name)
+    return [
+        '' if values[name] is None else kind(values[name])
+        for name, kind in TIDY_CSV_SCHEMA
+    ]
+
+class TidyCSVWriter:
+    """Stream tidy rows to a CSV, one row per report
     
-    # Crop recommendations
-    data.append(['Crop Recommendations', '', '', ''])
-    data.append(['Crop Name', 'Expected Yield (t/ha)', 'Reason', ''])
-    crops = report_data['prediction'].get('crop_recommendations', [])
-    for crop in crops:
-        yield_str = f"{crop.get('expected_yield_t_ha', 0):.1f}" if crop.get('expected_yield_t_ha', 0) > 0 else 'N/A'
-        data.append([crop['crop'], yield_str, crop['reason'], ''])
+    In append mode an existing file keeps its rows and the header is only
+    written to a new or empty file; a file with a different header is
+    refused so rows never end up under the wrong columns.
+    """
     
-    # Create DataFrame and save
-    df = pd.DataFrame(data)
-    df.to_csv(csv_path, index=False, header=False)
+    def __init__(self, path, append=True):
+        import csv
+        
+        self.path = path
+        self.rows = 0
+        write_header = True
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, newline='') as f:
+                header = next(csv.reader(f), [])
+            if header != TIDY_CSV_FIELDS:
+                raise ValueError(f"{path} has a different column layout; expected {','.join(TIDY_CSV_FIELDS)}")
+            write_header = False
+        
+        self._file = open(path, 'a' if append else 'w', newline='')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        if write_header:
+            self._writer.writerow(TIDY_CSV_FIELDS)
     
-    return csv_path
+    def write(self, report_data):
+        """Write one report's row"""
+        self._writer.writerow(tidy_row(report_data))
+        self.rows += 1
+    
+    def close(self):
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+def generate_metadata(report_data, report_id):
+    """Save the report payload as JSON metadata"""
+    reports_dir = os.environ.get('REPORTS_DIR', './reports')
+    metadata_path = os.path.join(reports_dir, f'{report_id}.json')
+    with open(metadata_path, 'w') as f:
+        json.dump(report_data, f, indent=2)
+    return metadata_path
+
+def index_report(report_data, report_id):
+    """Add a located report to the spatial index, if it is enabled"""
+    index = get_spatial_index()
+    if index is not None:
+        from spatial_index import record_from_report
+        record = record_from_report(report_data)
+        if record is not None:
+            index.add([record])
+
+def parse_formats(value):
+    """Parse a comma-separated list of REPORT_FORMATS"""
+    formats = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = sorted(set(formats) - set(REPORT_FORMATS))
+    if unknown or not formats:
+        raise ValueError(f"Unknown report formats: {', '.join(unknown) or value!r} (choose from {', '.join(REPORT_FORMATS)})")
+    return formats
+
+def generate_report(report_data, formats=None):
+    """Generate the requested outputs (default FORMATS) for one report
+    
+    The CSV and metadata JSON do not depend on the chart or the PDF, so
+    they are written on a helper thread while the PDF is built. Stage
+    times are returned in timings_ms.
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    
+    started = time.perf_counter()
+    formats = formats or FORMATS
+    report_id = report_data['reportId']
+    reports_dir = os.environ.get('REPORTS_DIR', './reports')
+    timings = {}
+    reused = []
+    
+    # Only the chart PNG is shared between reports: the PDF and CSV show the report ID and time
+    store = get_report_store()
+    chart_store = store if CHART_OUTPUT == 'file' and CHART_MODE != 'vector' else None
+    if chart_store is not None:
+        from report_store import content_key
+        key = content_key(report_data, {'chart_mode': CHART_MODE, 'chart_dpi': CHART_DPI})
+    
+    def timed(stage, generate):
+        stage_started = time.perf_counter()
+        path = generate(report_data, report_id)
+        timings.setdefault(stage, round((time.perf_counter() - stage_started) * 1000, 2))
+        return path
+    
+    def pdf_stage(report_data, report_id):
+        if chart_store is None:
+            return generate_pdf_report(report_data, report_id, timings)
+        chart_path = os.path.join(reports_dir, f'{report_id}_charts.png')
+        # A rerun of this reportId must not write through a link into the store
+        if os.path.exists(chart_path):
+            os.remove(chart_path)
+        if chart_store.fetch(key, 'chart', chart_path):
+            reused.append('chart')
+            return generate_pdf_report(report_data, report_id, timings, render_chart=False)
+        path = generate_pdf_report(report_data, report_id, timings)
+        chart_store.publish(key, 'chart', chart_path)
+        return path
+    
+    paths = {}
+    try:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = {}
+            if 'csv' in formats:
+                futures['csv_path'] = pool.submit(timed, 'csv', generate_csv_report)
+            if 'json' in formats:
+                futures['metadata_path'] = pool.submit(timed, 'json', generate_metadata)
+            if 'pdf' in formats:
+                paths['pdf_path'] = timed('pdf', pdf_stage)
+            for name, future in futures.items():
+                paths[name] = future.result()
+        if 'json' in formats and get_spatial_index() is not None:
+            timed('index', index_report)
+    except BaseException:
+        # The pool has finished every stage by now; leave no partial report behind
+        remove_report_outputs(report_data, reports_dir, formats)
+        raise
+    
+    if store is not None:
+        store.maybe_evict()
+    
+    timings['total'] = round((time.perf_counter() - started) * 1000, 2)
+    result = {'success': True, 'report_id': report_id}
+    for name in ('pdf_path', 'csv_path', 'metadata_path'):
+        if name in paths:
+            result[name] = paths[name]
+    if reused:
+        result['reused'] = sorted(reused)
+    result['timings_ms'] = timings
+    return result
+
+def remove_report_outputs(report_data, reports_dir, formats):
+    """Delete the files a failed generate_report() run may have written and unindex it"""
+    report_id = report_data['reportId']
+    names = {'pdf': [f'{report_id}.pdf'], 'csv': [f'{report_id}.csv'], 'json': [f'{report_id}.json']}
+    if CHART_OUTPUT == 'file':
+        names['pdf'].append(f'{report_id}_charts.png')
+    for fmt in formats:
+        for name in names[fmt]:
+            try:
+                os.remove(os.path.join(reports_dir, name))
+            except FileNotFoundError:
+                pass
+    if 'json' in formats:
+        unindex_reports([str(report_id)])
+
+def unindex_reports(report_ids):
+    """Drop reports from the spatial index, if it is enabled"""
+    index = get_spatial_index()
+    if index is not None:
+        index.remove(report_ids)
+
+def get_report_store():
+    """Return this process's report artifact store, or None when REPORT_STORE=off"""
+    global _report_store
+    if os.environ.get('REPORT_STORE', 'on') == 'off':
+        return None
+    reports_dir = os.environ.get('REPORTS_DIR', './reports')
+    if _report_store is None or _report_store.reports_dir != reports_dir:
+        from report_store import ReportStore
+        _report_store = ReportStore(
+            reports_dir,
+            max_bytes=int(float(os.environ.get('REPORTS_MAX_MB', '1024')) * 1024 * 1024),
+            max_age=float(os.environ.get('REPORTS_MAX_AGE_DAYS', '30')) * 24 * 3600,
+            on_remove=unindex_reports
+        )
+    return _report_store
+
+def get_spatial_index():
+    """Return this process's spatial index of located reports, or None unless SPATIAL_INDEX=1"""
+    global _spatial_index
+    if os.environ.get('SPATIAL_INDEX', '') in ('', '0', 'off'):
+        return None
+    from spatial_index import SpatialIndex, default_path
+    if _spatial_index is None or _spatial_index.path != default_path():
+        _spatial_index = SpatialIndex()
+    return _spatial_index
+
+def report_settings():
+    """Rendering settings to hand to worker processes"""
+    return {'chart_mode': CHART_MODE, 'chart_output': CHART_OUTPUT, 'csv_layout': CSV_LAYOUT, 'formats': FORMATS}
+
+def apply_settings(settings):
+    """Apply settings from report_settings() in a worker process"""
+    global CHART_MODE, CHART_OUTPUT, CSV_LAYOUT, FORMATS
+    CHART_MODE = settings['chart_mode']
+    CHART_OUTPUT = settings['chart_output']
+    CSV_LAYOUT = settings['csv_layout']
+    FORMATS = settings['formats']
+
+def warm_up():
+    """Import the report libraries and render a throwaway chart and PDF ahead of the first job
+    
+    Building the chart template or styles alone leaves the first real
+    render cold (font loading, backend and encoder setup), so a whole
+    report is built in memory; nothing is written to REPORTS_DIR.
+    """
+    import io
+    global CHART_OUTPUT
+    if 'json' in FORMATS:
+        get_spatial_index()
+    if 'pdf' not in FORMATS:
+        return
+    chart_output, CHART_OUTPUT = CHART_OUTPUT, 'memory'
+    try:
+        generate_pdf_report(WARM_UP_PAYLOAD, WARM_UP_PAYLOAD['reportId'], out=io.BytesIO())
+    finally:
+        CHART_OUTPUT = chart_output
+
+def _worker_main(conn, settings):
+    """Report worker process: warm up, then run jobs from the pipe until told to stop"""
+    apply_settings(settings)
+    warm_up()
+    conn.send({'event': 'ready'})
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        try:
+            result = generate_report(job)
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        conn.send(result)
+
+class ReportWorker:
+    """A warm report worker process and the pipe used to talk to it"""
+    
+    def __init__(self, context):
+        self.context = context
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, report_settings()), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = self.conn.recv().get('event') == 'ready'
+    
+    def run(self, job, timeout):
+        """Run one job; returns None if it did not finish within timeout seconds"""
+        self.conn.send(job)
+        if self.conn.poll(timeout):
+            return self.conn.recv()
+        return None
+    
+    def stop(self, force=False):
+        """Shut the worker down"""
+        if force:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(timeout=5)
+        self.conn.close()
+
+def worker_context():
+    """Multiprocessing context whose workers fork from a process that has already imported the report libraries"""
+    import multiprocessing
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['matplotlib.pyplot', 'seaborn', 'reportlab.platypus'])
+    return context
+
+def serve(workers=2, queue_size=32, timeout=60.0, infile=sys.stdin, outfile=sys.stdout):
+    """Run the report daemon over newline-delimited JSON streams"""
+    import queue
+    import threading
+    
+    context = worker_context()
+    jobs = queue.Queue(maxsize=queue_size)
+    output_lock = threading.Lock()
+    
+    def emit(message):
+        with output_lock:
+            outfile.write(json.dumps(message) + '\n')
+            outfile.flush()
+    
+    def dispatch(worker):
+        while True:
+            job = jobs.get()
+            if job is None:
+                worker.stop()
+                return
+            job_id = job.pop('id', None)
+            try:
+                result = worker.run(job, timeout)
+                error = None if result is not None else f'Report generation timed out after {timeout:g}s'
+            except (EOFError, OSError):
+                # The worker died mid-job (crash, OOM kill); its pipe is closed
+                worker.process.join(timeout=5)
+                error = f'Report worker exited unexpectedly (exit code {worker.process.exitcode})'
+            if error is not None:
+                # Kill the stuck or dead worker and replace it with a warm one
+                worker.stop(force=True)
+                worker = ReportWorker(context)
+                result = {'success': False, 'error': error}
+            if job_id is not None:
+                result['id'] = job_id
+            emit(result)
+    
+    pool = [ReportWorker(context) for _ in range(workers)]
+    threads = [threading.Thread(target=dispatch, args=(worker,), daemon=True) for worker in pool]
+    for thread in threads:
+        thread.start()
+    emit({'event': 'ready', 'workers': workers, 'pid': os.getpid()})
+    
+    # A full queue blocks here, which stops reading stdin (backpressure)
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+        except json.JSONDecodeError:
+            emit({'success': False, 'error': 'Invalid JSON input'})
+            continue
+        if not isinstance(job, dict):
+            emit({'success': False, 'error': 'Report payload must be a JSON object'})
+            continue
+        jobs.put(job)
+    
+    for _ in threads:
+        jobs.put(None)
+    for thread in threads:
+        thread.join()
+
+def read_batch_payloads(source):
+    """Read report payloads from an NDJSON file ('-' for stdin) or a directory of .json files
+    
+    Returns a list of (payload, error) pairs; error is set for unreadable entries.
+    """
+    entries = []
+    if source != '-' and os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(source, name)) as f:
+                    entries.append((json.load(f), None))
+            except (OSError, json.JSONDecodeError) as e:
+                entries.append((None, f'{name}: {e}'))
+        return entries
+    
+    stream = sys.stdin if source == '-' else open(source)
+    try:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                entries.append((json.loads(line), None))
+            except json.JSONDecodeError as e:
+                entries.append((None, f'line {line_number}: {e}'))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    return entries
+
+def _init_batch_worker(settings):
+    """Pool initializer: warm up once per worker process"""
+    apply_settings(settings)
+    warm_up()
+
+def _batch_job(report_data):
+    """Generate one report in a pool worker, returning a result instead of raising"""
+    try:
+        return generate_report(report_data)
+    except Exception as e:
+        return {'success': False, 'report_id': report_data.get('reportId'), 'error': str(e)}
+
+def write_combined_pdf(reports, pdf_path):
+    """Write the reports one after another into a single PDF"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate, PageBreak
+    
+    story = []
+    for report_data in reports:
+        report_id = report_data['reportId']
+        if story:
+            story.append(PageBreak())
+        # Raster charts were already written by the workers
+        story.extend(build_report_story(report_data, report_id, chart_flowable(report_data, report_id, render=False)))
+    SimpleDocTemplate(pdf_path, pagesize=A4).build(story)
+    return pdf_path
+
+def run_batch(source, workers=None, combined_pdf=None, tidy_csv=None, progress_interval=1.0):
+    """Generate reports for every payload in source over a process pool
+    
+    Progress lines go to stderr; the summary is returned. Tidy CSV rows
+    are appended as results arrive.
+    """
+    import time
+    from contextlib import nullcontext
+    from concurrent.futures import ProcessPoolExecutor
+    
+    started = time.perf_counter()
+    entries = read_batch_payloads(source)
+    payloads = [payload for payload, error in entries if error is None]
+    errors = [{'error': error} for _, error in entries if error is not None]
+    # Unreadable entries count as done (and failed) from the start, as in the summary
+    unreadable = len(errors)
+    workers = workers or os.cpu_count() or 1
+    
+    def progress(done, final=False):
+        elapsed = time.perf_counter() - started
+        print(json.dumps({
+            'event': 'done' if final else 'progress',
+            'done': done,
+            'total': len(entries),
+            'failed': len(errors),
+            'elapsed_s': round(elapsed, 2),
+            'reports_per_s': round(done / elapsed, 2) if elapsed else 0.0
+        }), file=sys.stderr, flush=True)
+    
+    succeeded = 0
+    combined = []
+    tidy_writer = TidyCSVWriter(tidy_csv) if tidy_csv else nullcontext()
+    with tidy_writer, ProcessPoolExecutor(max_workers=workers, mp_context=worker_context(),
+                                          initializer=_init_batch_worker, initargs=(report_settings(),)) as executor:
+        # map keeps payload order, so the combined outputs follow the input
+        results = executor.map(_batch_job, payloads, chunksize=max(1, len(payloads) // (workers * 8)))
+        last_progress = time.perf_counter()
+        for done, (payload, result) in enumerate(zip(payloads, results), 1):
+            if result.get('success'):
+                succeeded += 1
+                if tidy_csv:
+                    tidy_writer.write(payload)
+                if combined_pdf:
+                    combined.append(payload)
+            else:
+                errors.append({'report_id': result.get('report_id'), 'error': result.get('error')})
+            if time.perf_counter() - last_progress >= progress_interval:
+                progress(unreadable + done)
+                last_progress = time.perf_counter()
+    progress(len(entries), final=True)
+    
+    summary = {
+        'success': not errors,
+        'reports': len(entries),
+        'succeeded': succeeded,
+        'failed': len(errors),
+        'errors': errors
+    }
+    if combined:
+        summary['combined_pdf'] = write_combined_pdf(combined, combined_pdf)
+    if tidy_csv:
+        summary['tidy_csv'] = tidy_csv
+    
+    elapsed = time.perf_counter() - started
+    summary['elapsed_s'] = round(elapsed, 2)
+    summary['reports_per_s'] = round(succeeded / elapsed, 2) if elapsed else 0.0
+    return summary
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    import argparse
+    
+    def formats_arg(value):
+        try:
+            return parse_formats(value)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    
+    parser = argparse.ArgumentParser(description='Soil fertility report generator')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run as a daemon with warm workers, reading NDJSON report payloads from stdin')
+    parser.add_argument('--batch', metavar='SOURCE',
+                        help="Generate a report for every payload in an NDJSON file ('-' for stdin) or a directory of .json files")
+    parser.add_argument('--combined-pdf', metavar='PATH', help='Batch mode: also write every report into one PDF')
+    parser.add_argument('--tidy-csv', metavar='PATH',
+                        help='Batch mode: also append one CSV row per report to PATH (header written if new)')
+    parser.add_argument('--csv-layout', choices=CSV_LAYOUTS, default=CSV_LAYOUT,
+                        help='Per-report CSV: sectioned report or a single tidy row')
+    parser.add_argument('--workers', type=int,
+                        help='Worker processes (daemon mode default 2, batch mode default one per CPU)')
+    parser.add_argument('--queue-size', type=int, default=32, help='Jobs queued before stdin reads block')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Per-job timeout in seconds')
+    parser.add_argument('--chart-mode', choices=CHART_MODES, default=CHART_MODE,
+                        help='Chart rendering: prebuilt Agg figure, pyplot at 300 dpi, or vector drawing')
+    parser.add_argument('--chart-output', choices=CHART_OUTPUTS, default=CHART_OUTPUT,
+                        help='Write raster charts to REPORTS_DIR or render them in memory only')
+    parser.add_argument('--stream', metavar='DEST',
+                        help="Build the PDF in memory and write it to stdout ('-') or a Unix socket path")
+    parser.add_argument('--evict', action='store_true',
+                        help='Apply the REPORTS_DIR age/size limits now and print what was removed')
+    parser.add_argument('--formats', type=formats_arg, default=FORMATS,
+                        help=f"Comma-separated outputs to write (default {','.join(REPORT_FORMATS)})")
+    return parser.parse_args(argv)
 
 def main():
     """Main function"""
+    args = parse_args()
+    apply_settings({'chart_mode': args.chart_mode, 'chart_output': args.chart_output,
+                    'csv_layout': args.csv_layout, 'formats': args.formats})
+    if args.evict:
+        store = get_report_store()
+        print(json.dumps(dict(store.evict(), success=True) if store else {'success': False, 'error': 'Report store is disabled'}))
+        return
+    if args.serve:
+        serve(args.workers or 2, args.queue_size, args.timeout)
+        return
+    if args.batch:
+        try:
+            summary = run_batch(args.batch, args.workers, args.combined_pdf, args.tidy_csv)
+        except Exception as e:
+            summary = {'success': False, 'error': str(e)}
+        print(json.dumps(summary))
+        if not summary['success']:
+            sys.exit(1)
+        return
+    
     try:
         report_data = read_input()
-        report_id = report_data['reportId']
-        
-        # Generate both PDF and CSV
-        pdf_path = generate_pdf_report(report_data, report_id)
-        csv_path = generate_csv_report(report_data, report_id)
-        
-        # Save metadata
-        reports_dir = os.environ.get('REPORTS_DIR', './reports')
-        metadata_path = os.path.join(reports_dir, f'{report_id}.json')
-        with open(metadata_path, 'w') as f:
-            json.dump(report_data, f, indent=2)
-        
-        # Return success
-        result = {
-            'success': True,
-            'report_id': report_id,
-            'pdf_path': pdf_path,
-            'csv_path': csv_path,
-            'metadata_path': metadata_path
-        }
-        
+        if args.stream:
+            sent = stream_pdf_report(report_data, args.stream)
+            if args.stream != '-':
+                print(json.dumps({'success': True, 'report_id': report_data['reportId'], 'bytes': sent}))
+            return
+        result = generate_report(report_data)
         print(json.dumps(result))
         
     except Exception as e:
@@ -299,4 +1182,4 @@ def main():
         sys.exit(1)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
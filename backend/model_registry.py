@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Versioned model registry.
+train_model.py publishes every trained model as a new version directory
+and predictor.py serves the version named in CURRENT:
+
+  models/
+    CURRENT                         name of the version being served
+    20260101T120000-1a2b3c4d/
+      soil_fertility_model.joblib
+      soil_fertility_model.npz
+      soil_fertility_model.forest
+      metadata.json                 features, classes, metrics, checksums
+
+A version is staged in a hidden directory and renamed into place, and
+CURRENT is replaced atomically, so a reader never sees a partial model.
+A running predictor polls CURRENT and swaps in a new version in the
+background (see predictor.py).
+
+Usage: python3 model_registry.py [list | current | promote VERSION] [--registry DIR]
+"""
+
+import os
+import sys
+import json
+
+CURRENT_FILE = 'CURRENT'
+METADATA_FILE = 'metadata.json'
+DEFAULT_REGISTRY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+def registry_root(root=None):
+    """The registry directory: root, $MODEL_REGISTRY or backend/models"""
+    return root or os.environ.get('MODEL_REGISTRY') or DEFAULT_REGISTRY
+
+def version_dir(version, root=None):
+    """Directory of one version"""
+    return os.path.join(registry_root(root), version)
+
+def current_version(root=None):
+    """The version CURRENT points at, or None if nothing has been published"""
+    try:
+        with open(os.path.join(registry_root(root), CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def read_metadata(version, root=None):
+    """metadata.json of one version"""
+    with open(os.path.join(version_dir(version, root), METADATA_FILE)) as f:
+        return json.load(f)
+
+def list_versions(root=None):
+    """Published versions, oldest first"""
+    root = registry_root(root)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if not name.startswith('.') and os.path.isfile(os.path.join(root, name, METADATA_FILE)))
+
+def file_sha256(path):
+    """SHA-256 of a file, read in blocks"""
+    import hashlib
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def verify(version, root=None):
+    """Names of the version's files whose checksum no longer matches its metadata"""
+    checksums = read_metadata(version, root)['checksums']
+    directory = version_dir(version, root)
+    return [name for name, checksum in checksums.items()
+            if not os.path.exists(os.path.join(directory, name)) or file_sha256(os.path.join(directory, name)) != checksum]
+
+def promote(version, root=None):
+    """Point CURRENT at an existing version"""
+    root = registry_root(root)
+    if not os.path.isfile(os.path.join(root, version, METADATA_FILE)):
+        raise ValueError(f"Unknown model version {version!r}")
+    tmp = os.path.join(root, f'.{CURRENT_FILE}.{os.getpid()}.tmp')
+    with open(tmp, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+def publish(paths, metadata, root=None, make_current=True):
+    """Copy model artifacts into a new version and return its name
+
+    The files are staged and checksummed in a hidden directory that is then
+    renamed into place, so the version appears complete or not at all.
+    metadata is stored with the version, created_at and the checksums added.
+    """
+    import time
+    import shutil
+    import tempfile
+
+    root = registry_root(root)
+    os.makedirs(root, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.staging-', dir=root)
+    try:
+        checksums = {}
+        for path in paths:
+            name = os.path.basename(path)
+            shutil.copyfile(path, os.path.join(staging, name))
+            checksums[name] = file_sha256(os.path.join(staging, name))
+
+        created = time.time()
+        fingerprint = checksums[os.path.basename(paths[0])][:8]
+        version = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(created))}-{fingerprint}"
+        with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+            json.dump(dict(metadata, version=version, created_at=created, checksums=checksums), f, indent=2)
+        # mkdtemp makes the directory 0700; give the version the umask's usual mode so other users can serve it
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(staging, 0o777 & ~umask)
+        os.rename(staging, os.path.join(root, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    if make_current:
+        promote(version, root)
+    return version
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Inspect and promote published model versions')
+    parser.add_argument('command', nargs='?', default='list', choices=['list', 'current', 'promote'])
+    parser.add_argument('version', nargs='?', help='Version to promote')
+    parser.add_argument('--registry', help='Registry directory (default: $MODEL_REGISTRY or backend/models)')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'promote':
+            if not args.version:
+                raise ValueError("promote needs a VERSION")
+            promote(args.version, args.registry)
+            print(json.dumps({'success': True, 'current': args.version}))
+        elif args.command == 'current':
+            print(json.dumps({'current': current_version(args.registry)}))
+        else:
+            current = current_version(args.registry)
+            versions = []
+            for version in list_versions(args.registry):
+                metadata = read_metadata(version, args.registry)
+                versions.append({
+                    'version': version,
+                    'current': version == current,
+                    'created_at': metadata.get('created_at'),
+                    'metrics': metadata.get('metrics', {}),
+                })
+            print(json.dumps({'versions': versions}, indent=2))
+    except (OSError, ValueError) as e:
+        print(json.dumps({'success': False, 'error': str(e)}))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
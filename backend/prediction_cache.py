@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Prediction result cache for predictor.py.
+Results are keyed on the FEATURE_ORDER vector with each feature rounded to a
+configurable number of decimal places, so near-identical readings from
+field devices share an entry.
+
+Two stores with the same interface:
+  PredictionCache        in-process LRU with TTL (server mode)
+  SQLitePredictionCache  on-disk LRU with TTL that outlives one-shot runs
+
+Both drop every entry when the model checksum changes and count hits,
+misses, evictions and expirations.
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Decimal places kept per feature when building cache keys
+DEFAULT_PRECISION = {
+    'N': 1, 'P': 1, 'K': 0, 'pH': 2, 'EC': 2, 'OC': 2,
+    'S': 1, 'Zn': 2, 'Fe': 2, 'Cu': 3, 'Mn': 2, 'B': 2
+}
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TTL = 3600
+
+def load_precision(overrides=None):
+    """Merge per-feature precision overrides (dict or JSON string) into the defaults"""
+    precision = dict(DEFAULT_PRECISION)
+    if isinstance(overrides, str):
+        overrides = json.loads(overrides) if overrides.strip() else {}
+    precision.update({feature: int(digits) for feature, digits in (overrides or {}).items()})
+    return precision
+
+def cache_key(feature_values, feature_order, precision):
+    """Quantize an ordered feature vector into a hashable key"""
+    return tuple(
+        round(float(value), precision.get(feature, 2)) + 0.0  # normalise -0.0
+        for feature, value in zip(feature_order, feature_values)
+    )
+
+class PredictionCache:
+    """In-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.model_checksum = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def set_model_checksum(self, checksum):
+        """Invalidate every entry if the model has changed"""
+        with self._lock:
+            if checksum != self.model_checksum:
+                self._entries.clear()
+                self.model_checksum = checksum
+
+    def get(self, key):
+        """Return a copy of the cached result, or None"""
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        result, expires_at = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(result)
+
+    def put(self, key, result):
+        """Store a result, evicting the least recently used entries"""
+        with self._lock:
+            self._entries[key] = (dict(result), time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def flush(self):
+        """Nothing to persist for the in-process store"""
+
+    def stats(self):
+        """Cache counters"""
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+class SQLitePredictionCache:
+    """On-disk LRU cache with a per-entry TTL, shared by one-shot invocations"""
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        # Server mode may call in from several threads; the lock serialises them
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS predictions (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        ''')
+        self._pending = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def set_model_checksum(self, checksum):
+        """Invalidate every entry if the model has changed"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'model_checksum'").fetchone()
+            if row is None or row[0] != checksum:
+                with self._conn:
+                    self._conn.execute("DELETE FROM predictions")
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (name, value) VALUES ('model_checksum', ?)", (checksum,)
+                    )
+
+    def get(self, key):
+        """Return the cached result, or None"""
+        with self._lock:
+            db_key = json.dumps(key)
+            row = self._conn.execute(
+                "SELECT result, expires_at FROM predictions WHERE key = ?", (db_key,)
+            ).fetchone()
+            if row is None:
+                self._pending["misses"] += 1
+                return None
+
+            now = time.time()
+            if row[1] < now:
+                self._conn.execute("DELETE FROM predictions WHERE key = ?", (db_key,))
+                self._pending["expirations"] += 1
+                self._pending["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE predictions SET last_used = ? WHERE key = ?", (now, db_key))
+            self._pending["hits"] += 1
+            return json.loads(row[0])
+
+    def put(self, key, result):
+        """Store a result; eviction happens on flush()"""
+        with self._lock:
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO predictions (key, result, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (json.dumps(key), json.dumps(result), now + self.ttl, now)
+            )
+
+    def flush(self):
+        """Evict least recently used entries and persist counters"""
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()
+            excess = size - self.max_size
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM predictions WHERE key IN "
+                    "(SELECT key FROM predictions ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self._pending["evictions"] += excess
+
+            for name, count in self._pending.items():
+                if count:
+                    self._conn.execute(
+                        "INSERT INTO counters (name, value) VALUES (?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, count)
+                    )
+            self._pending = dict.fromkeys(self._pending, 0)
+            self._conn.commit()
+
+    def stats(self):
+        """Cache counters, accumulated across invocations"""
+        with self._lock:
+            self.flush()
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM predictions").fetchone()
+            return {
+                "backend": "sqlite",
+                "path": str(self.path),
+                "size": size,
+                "max_size": self.max_size,
+                "hits": counters.get("hits", 0),
+                "misses": counters.get("misses", 0),
+                "evictions": counters.get("evictions", 0),
+                "expirations": counters.get("expirations", 0)
+            }
+
+    def close(self):
+        """Flush and close the database"""
+        with self._lock:
+            self.flush()
+            self._conn.close()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Asyncio front-end for predictor.py --serve that micro-batches requests.
+Single-sample requests that arrive within a short window (window_ms after
+the oldest waiting one, or as soon as max_batch are waiting) are scored
+with one predict_batch call in a worker thread, and each caller gets its
+own result back. While a batch is being scored the next one fills up, so
+batches grow with concurrency instead of the CPU cost per request. The
+window is skipped while traffic is sequential (the last batch held one
+sample), so a lone caller is not delayed.
+
+Requests beyond max_queue waiting samples are shed immediately with an
+"overloaded" error instead of queueing without bound. Control commands and
+{"samples": [...]} requests bypass the batcher but share the model thread.
+
+The wire protocol is predictor.py's newline-delimited JSON. Responses are
+written as soon as they are ready, so pipelined requests on one connection
+can complete out of order: match them by "id".
+
+This module does not import predictor.py; run_gateway() takes its
+handle_request function, so the model is loaded once by the caller.
+"""
+
+import sys
+import json
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WINDOW_MS = 2.0
+DEFAULT_MAX_BATCH = 64
+DEFAULT_MAX_QUEUE = 4096
+# Largest request line accepted (a {"samples": [...]} request can be long)
+LINE_LIMIT = 64 * 1024 * 1024
+OVERLOADED = {"error": "Predictor overloaded, retry later", "overloaded": True}
+
+class MicroBatcher:
+    """Coalesce concurrent single-sample predictions into batched calls"""
+
+    def __init__(self, score_batch, executor, window_ms=DEFAULT_WINDOW_MS,
+                 max_batch=DEFAULT_MAX_BATCH, max_queue=DEFAULT_MAX_QUEUE):
+        self.score_batch = score_batch
+        self.executor = executor
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.requests = 0
+        self.batches = 0
+        self.shed = 0
+        self.largest_batch = 0
+        self._queue = deque()
+        self._last_batch = 0
+        self._wakeup = None
+        self._task = None
+
+    def start(self):
+        """Start the batching loop on the running event loop"""
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop"""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def submit(self, sample):
+        """Score one sample as part of the next batch"""
+        if len(self._queue) >= self.max_queue:
+            self.shed += 1
+            return dict(OVERLOADED)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((loop.time(), sample, future))
+        # Wake the batching loop when it is idle or a full batch is waiting
+        if len(self._queue) == 1 or len(self._queue) >= self.max_batch:
+            self._wakeup.set()
+        return await future
+
+    def stats(self):
+        """Batching counters for the health command"""
+        return {
+            "queued": len(self._queue),
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "shed": self.shed,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # Only hold samples back once concurrent traffic has been seen: a
+            # lone caller gets no batching benefit from the window, just delay.
+            # The window starts when the oldest waiting sample arrived, so
+            # samples that queued up behind the previous batch go straight away.
+            deadline = self._queue[0][0] + self.window
+            if self._last_batch > 1 and len(self._queue) < self.max_batch and deadline > loop.time():
+                self._wakeup.clear()
+                timer = loop.call_at(deadline, self._wakeup.set)
+                await self._wakeup.wait()
+                timer.cancel()
+
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            self.requests += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self._last_batch = len(batch)
+            try:
+                results = await loop.run_in_executor(self.executor, self.score_batch, [s for _, s, _ in batch])
+            except Exception as e:
+                results = [{"error": f"Unexpected error: {str(e)}"}] * len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+class Gateway:
+    """Answer predictor.py server-mode requests through a MicroBatcher"""
+
+    def __init__(self, handle_request, window_ms=DEFAULT_WINDOW_MS,
+                 max_batch=DEFAULT_MAX_BATCH, max_queue=DEFAULT_MAX_QUEUE, on_result=None):
+        self.handle_request = handle_request
+        # Called with (request, response) for each batched single-sample request, on the model thread
+        self.on_result = on_result
+        # One model thread: batches and direct requests never run concurrently
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='predict')
+        self.batcher = MicroBatcher(self._score_batch, self.executor, window_ms, max_batch, max_queue)
+
+    def _score_batch(self, samples):
+        response = self.handle_request({"samples": samples})
+        results = response["results"]
+        if "timings" in response:
+            timings = dict(response["timings"], batch_size=len(samples))
+            results = [dict(result, timings=timings) for result in results]
+        return results
+
+    async def answer(self, line):
+        """Response to one request line"""
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError:
+            return {"error": "Invalid JSON input"}
+        if not isinstance(request, dict):
+            return {"error": "Request must be a JSON object"}
+
+        try:
+            if 'cmd' in request or 'samples' in request:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(self.executor, self.handle_request, request)
+                if request.get('cmd') == 'health':
+                    response["gateway"] = self.batcher.stats()
+            else:
+                response = await self.batcher.submit(request.get('features', request))
+                if self.on_result is not None:
+                    await asyncio.get_running_loop().run_in_executor(self.executor, self.on_result, request, response)
+        except Exception as e:
+            response = {"error": f"Unexpected error: {str(e)}"}
+
+        if 'id' in request:
+            response = dict(response, id=request['id'])
+        return response
+
+    async def serve_connection(self, reader, write):
+        """Answer every line from reader concurrently until it is closed"""
+        pending = set()
+
+        async def respond(line):
+            write((json.dumps(await self.answer(line)) + '\n').encode('utf-8'))
+
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # Over LINE_LIMIT; the rest of the stream cannot be framed
+                write((json.dumps({"error": "Request too large"}) + '\n').encode('utf-8'))
+                break
+            if not line:
+                break
+            if not line.strip():
+                continue
+            task = asyncio.create_task(respond(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def serve_stdio(self, ready):
+        """Serve stdin/stdout"""
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader(limit=LINE_LIMIT)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        stdout = sys.stdout.buffer
+
+        def write(data):
+            stdout.write(data)
+            stdout.flush()
+
+        write((json.dumps(ready) + '\n').encode('utf-8'))
+        await self.serve_connection(reader, write)
+
+    async def serve_socket(self, socket_path, ready):
+        """Serve a Unix socket until cancelled"""
+        import os
+
+        async def handle(reader, writer):
+            try:
+                await self.serve_connection(reader, writer.write)
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = await asyncio.start_unix_server(handle, socket_path, limit=LINE_LIMIT)
+        print(json.dumps(dict(ready, socket=socket_path)), flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+    async def run(self, socket_path=None, ready=None):
+        """Serve stdin/stdout, or socket_path if given"""
+        ready = ready or {"event": "ready"}
+        self.batcher.start()
+        try:
+            if socket_path is None:
+                await self.serve_stdio(ready)
+            else:
+                await self.serve_socket(socket_path, ready)
+        finally:
+            await self.batcher.stop()
+            self.executor.shutdown(wait=False)
+
+def run_gateway(handle_request, socket_path=None, ready=None, **options):
+    """Run a Gateway around handle_request until the input closes (or forever on a socket)"""
+    asyncio.run(Gateway(handle_request, **options).run(socket_path, ready))
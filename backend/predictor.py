@@ -21,113 +21,899 @@ Expected input JSON format:
 
 Output format:
 {"prediction": "Medium", "confidence": 0.85}
+
+Server mode (--serve) keeps the model loaded and answers newline-delimited
+JSON requests on stdin/stdout, or on a Unix socket with --socket PATH.
+Each line is either a soil features object (optionally wrapped as
+{"id": ..., "features": {...}}) or a control command:
+{"cmd": "health"} or {"cmd": "ready"}. The "id" field is echoed back.
+With --spatial-index, a wrapped request that also carries "location":
+{"lat": ..., "lon": ...} (and optionally a "sample_id") is added to the
+spatial index in spatial_index.py once it has been scored.
+A request of the form {"samples": [...]} is scored as one batch.
+With --batch-window-ms (or PREDICTOR_BATCH_WINDOW_MS) the server runs the
+asyncio gateway in prediction_gateway.py instead: concurrent single-sample
+requests are scored together and answered as they finish (match by "id").
+
+Batch mode: pass a JSON array instead of an object, or --batch PATH with a
+CSV, NDJSON or JSON array file. Output is one JSON result per input line.
+
+Binary mode (--binary) answers frames of raw float32 rows with class
+indices and a probability matrix instead of JSON (see binary_protocol.py),
+on stdin/stdout or on the --socket path.
+
+Models are served from the registry in model_registry.py when one has been
+published: the version named in its CURRENT file is loaded, and the
+long-lived modes check CURRENT every --reload-interval seconds and swap a
+newly promoted version in without dropping requests. --shadow VERSION also
+scores traffic with another version off the request path and reports how
+often it agrees with the served model under {"cmd": "health"}.
+
+Instrumentation (--timings or PREDICTOR_TIMINGS=1) adds a "timings" object
+with per-stage milliseconds and RSS high-water marks to each result (batch
+runs print it as a final {"timings": ...} line). In server mode
+{"cmd": "metrics"} returns Prometheus text with the accumulated stage times.
 """
 
+import os
 import sys
 import json
-import joblib
-import numpy as np
+import time
 from pathlib import Path
 
-# Feature order - MUST match training order
-FEATURE_ORDER = ['N', 'P', 'K', 'pH', 'EC', 'OC', 'S', 'Zn', 'Fe', 'Cu', 'Mn', 'B']
+# numpy, the model engines and the server/batch helpers are imported by the
+# code paths that need them, so short-lived invocations (and their error
+# paths) only pay for what they use. See benchmark_startup.py.
+
+# Feature order and ranges are shared with training
+from feature_schema import FEATURES, FEATURE_ORDER, SCHEMA_VERSION, validate_batch
+
+JOBLIB_MODEL_PATH = Path(__file__).parent / 'soil_fertility_model.joblib'
+ARRAYS_MODEL_PATH = Path(__file__).parent / 'soil_fertility_model.npz'
+MMAP_MODEL_PATH = Path(__file__).parent / 'soil_fertility_model.forest'
+
+# Published model versions (model_registry.py). The version named in CURRENT
+# is served; without one, the artifacts next to this script are.
+REGISTRY_DIR = os.environ.get('MODEL_REGISTRY') or str(Path(__file__).parent / 'models')
+# Seconds between checks of CURRENT in the long-lived modes; 0 disables hot reload
+RELOAD_INTERVAL = float(os.environ.get('PREDICTOR_RELOAD_INTERVAL') or 5)
+# Registry version scored alongside the served model for comparison only
+SHADOW_VERSION = os.environ.get('PREDICTOR_SHADOW_VERSION')
+# Batches waiting for the shadow model beyond which new ones are not shadowed
+SHADOW_MAX_PENDING = 8
+# Add server requests that carry a "location" to the spatial index (spatial_index.py)
+SPATIAL_INDEX = os.environ.get('PREDICTOR_SPATIAL_INDEX', '') not in ('', '0', 'off')
 
-def load_model():
-    """Load the trained model"""
-    model_path = Path(__file__).parent / 'soil_fertility_model.joblib'
+# Inference engine: "joblib" (sklearn), "arrays" (forest_engine .npz),
+# "mmap" (forest_engine artifact shared between workers via the page cache)
+# or "auto" (the first of mmap, arrays, joblib whose file exists)
+ENGINE = os.environ.get('PREDICTOR_ENGINE', 'auto')
+
+# Prediction cache: "off", "memory" (in-process LRU, the server default) or
+# "sqlite" (on-disk, shared by one-shot invocations); see prediction_cache.py
+CACHE_MODE = os.environ.get('PREDICTION_CACHE')
+CACHE_PATH = os.environ.get('PREDICTION_CACHE_PATH', str(Path(__file__).parent / 'prediction_cache.sqlite3'))
+
+# Micro-batching window for server mode; 0 answers each request on its own
+BATCH_WINDOW_MS = float(os.environ.get('PREDICTOR_BATCH_WINDOW_MS') or 0)
+
+_model = None
+_model_version = None
+_reloads = {"succeeded": 0, "failed": 0, "last_error": None}
+# Version that last failed to load; not retried until CURRENT names another one
+_rejected_version = None
+_shadow = None
+_spatial = None
+_cache = None
+_started_at = time.time()
+_requests_served = 0
+
+# Opt-in per-stage timings; when off, each stage boundary is a single None check
+TIMINGS = os.environ.get('PREDICTOR_TIMINGS', '') not in ('', '0', 'off')
+STAGES = ('startup', 'imports', 'load_model', 'validate', 'forest', 'format', 'cache')
+# stage: [total seconds, count] across timed requests (server metrics)
+_stage_totals = {}
+
+def _max_rss_mb():
+    """Peak resident set size of this process so far"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def _process_age_ms():
+    """Milliseconds since the interpreter process started (Linux, clock-tick resolution), or None"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 (starttime); the command name in field 2 may contain spaces
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return round((uptime - start_ticks / os.sysconf('SC_CLK_TCK')) * 1000, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StageTimer:
+    """Wall time and RSS high-water mark per stage of one request"""
+    
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.stages_ms = {}
+        self.rss_mb = {}
+    
+    def mark(self, stage):
+        """Close the current stage: everything since the previous mark counts towards stage"""
+        now = time.perf_counter()
+        self.stages_ms[stage] = self.stages_ms.get(stage, 0.0) + (now - self._last) * 1000
+        self.rss_mb[stage] = _max_rss_mb()
+        self._last = now
+    
+    def finish(self):
+        """Return the timings object and add the stages to the server totals"""
+        for stage, ms in self.stages_ms.items():
+            total = _stage_totals.setdefault(stage, [0.0, 0])
+            total[0] += ms / 1000
+            total[1] += 1
+        return {
+            "stages_ms": {stage: round(ms, 3) for stage, ms in self.stages_ms.items()},
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "rss_high_water_mb": self.rss_mb
+        }
+
+def request_timer():
+    """A StageTimer when instrumentation is on, else None"""
+    return StageTimer() if TIMINGS else None
+
+def metrics_text():
+    """Prometheus text exposition of the server counters and stage times"""
+    lines = [
+        "# HELP predictor_requests_total Samples scored by this process.",
+        "# TYPE predictor_requests_total counter",
+        f"predictor_requests_total {_requests_served}",
+        "# HELP predictor_uptime_seconds Seconds since the predictor started.",
+        "# TYPE predictor_uptime_seconds gauge",
+        f"predictor_uptime_seconds {time.time() - _started_at:.3f}",
+        "# HELP predictor_max_rss_bytes Peak resident set size.",
+        "# TYPE predictor_max_rss_bytes gauge",
+        f"predictor_max_rss_bytes {int(_max_rss_mb() * 1024 * 1024)}",
+        "# HELP predictor_stage_seconds Time spent per prediction stage (with instrumentation on).",
+        "# TYPE predictor_stage_seconds summary",
+    ]
+    for stage in sorted(_stage_totals, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+        seconds, count = _stage_totals[stage]
+        lines.append(f'predictor_stage_seconds_sum{{stage="{stage}"}} {seconds:.6f}')
+        lines.append(f'predictor_stage_seconds_count{{stage="{stage}"}} {count}')
+    stats = cache_stats()
+    if stats is not None:
+        lines += ["# HELP predictor_cache_events_total Prediction cache events.",
+                  "# TYPE predictor_cache_events_total counter"]
+        for event in ('hits', 'misses', 'evictions', 'expirations'):
+            lines.append(f'predictor_cache_events_total{{event="{event}"}} {stats[event]}')
+    lines += ["# HELP predictor_model_reloads_total Hot reloads of the registry's CURRENT version.",
+              "# TYPE predictor_model_reloads_total counter"]
+    for outcome in ('succeeded', 'failed'):
+        lines.append(f'predictor_model_reloads_total{{outcome="{outcome}"}} {_reloads[outcome]}')
+    if _shadow is not None:
+        shadow = _shadow.stats()
+        lines += ["# HELP predictor_shadow_rows_total Rows scored by the shadow model.",
+                  "# TYPE predictor_shadow_rows_total counter",
+                  f'predictor_shadow_rows_total{{version="{shadow["version"]}"}} {shadow["rows"]}',
+                  "# HELP predictor_shadow_agreed_rows_total Shadow rows labelled like the served model.",
+                  "# TYPE predictor_shadow_agreed_rows_total counter",
+                  f'predictor_shadow_agreed_rows_total{{version="{shadow["version"]}"}} {_shadow.agreed}',
+                  "# HELP predictor_shadow_skipped_rows_total Rows not shadowed because the shadow backlog was full.",
+                  "# TYPE predictor_shadow_skipped_rows_total counter",
+                  f'predictor_shadow_skipped_rows_total{{version="{shadow["version"]}"}} {shadow["skipped"]}',
+                  "# HELP predictor_shadow_forest_seconds Forest time over the shadowed rows, per model.",
+                  "# TYPE predictor_shadow_forest_seconds counter",
+                  f'predictor_shadow_forest_seconds{{model="served"}} {_shadow.primary_seconds:.6f}',
+                  f'predictor_shadow_forest_seconds{{model="shadow"}} {_shadow.shadow_seconds:.6f}']
+    return '\n'.join(lines) + '\n'
+
+def model_directory():
+    """(version, directory) of the model to serve: the registry's CURRENT, else the backend directory"""
+    from model_registry import current_version
+    version = current_version(REGISTRY_DIR)
+    if version is None:
+        return None, Path(__file__).parent
+    return version, Path(REGISTRY_DIR) / version
+
+def open_model(directory, version=None, timer=None):
+    """Load the model artifact in directory with the configured engine
     
+    The returned model carries source_path and version attributes; raises
+    FileNotFoundError when the engine's artifact is not there.
+    """
+    directory = Path(directory)
+    paths = {engine: directory / path.name for engine, path in
+             (('mmap', MMAP_MODEL_PATH), ('arrays', ARRAYS_MODEL_PATH), ('joblib', JOBLIB_MODEL_PATH))}
+    engine = ENGINE
+    if engine == 'auto':
+        engine = 'mmap' if paths['mmap'].exists() else 'arrays' if paths['arrays'].exists() else 'joblib'
+    model_path = paths.get(engine, paths['joblib'])
     if not model_path.exists():
+        if engine == 'joblib' and (directory / 'soil_fertility_model.full.joblib').exists():
+            raise ValueError("This model serves a compaction variant (train_model.py --compact-apply); "
+                             "use the mmap or arrays engine")
+        raise FileNotFoundError(model_path)
+    
+    if engine == 'mmap':
+        from forest_engine import ArrayForest
+        if timer:
+            timer.mark('imports')
+        model = ArrayForest.load_mmap(model_path, FEATURE_ORDER)
+    elif engine == 'arrays':
+        from forest_engine import ArrayForest
+        if timer:
+            timer.mark('imports')
+        model = ArrayForest.load(model_path)
+    else:
+        import joblib
+        if timer:
+            timer.mark('imports')
+        model = joblib.load(model_path)
+    model.source_path = model_path
+    model.version = version
+    return model
+
+def load_model(timer=None):
+    """Load the trained model (cached for the lifetime of the process, or until a reload)"""
+    global _model, _model_version
+    if _model is not None:
+        return _model
+    
+    try:
+        version, directory = model_directory()
+        # A registry version gets the same checksum and schema checks as a hot reload
+        _model = open_version(version, timer) if version is not None else open_model(directory, timer=timer)
+        _model_version = version
+        return _model
+    except FileNotFoundError:
         print(json.dumps({
             "error": "Model file not found. Please run train_model.py first."
         }))
         sys.exit(1)
+    except Exception as e:
+        print(json.dumps({
+            "error": f"Failed to load model: {str(e)}"
+        }))
+        sys.exit(1)
+
+def model_checksum(model=None):
+    """Checksum of a loaded model's artifact (the served model by default)"""
+    model = model or load_model()
+    checksum = getattr(model, 'checksum', None)
+    if checksum is None:
+        import hashlib
+        with open(model.source_path, 'rb') as f:
+            checksum = hashlib.sha256(f.read()).hexdigest()
+        # Kept on the model so a reloaded model never shares the old checksum
+        model.checksum = checksum
+    return checksum
+
+def open_version(version, timer=None):
+    """Load a registry version after checking its files and feature schema"""
+    from model_registry import read_metadata, verify, version_dir
+    metadata = read_metadata(version, REGISTRY_DIR)
+    if metadata.get('features', FEATURE_ORDER) != FEATURE_ORDER:
+        raise ValueError(f"Model version {version} was trained on features {metadata['features']}")
+    if metadata.get('schema_version', SCHEMA_VERSION) != SCHEMA_VERSION:
+        raise ValueError(f"Model version {version} uses feature schema {metadata['schema_version']}, "
+                         f"this predictor uses {SCHEMA_VERSION}")
+    corrupt = verify(version, REGISTRY_DIR)
+    if corrupt:
+        raise ValueError(f"Model version {version} failed checksum verification: {corrupt}")
+    model = open_model(version_dir(version, REGISTRY_DIR), version, timer)
+    # Score one row so a broken artifact fails here rather than on live traffic
+    import numpy as np
+    model.predict_proba(np.array([[spec.min for spec in FEATURES]]))
+    return model
+
+def reload_model():
+    """Swap in the registry's CURRENT version if it changed; returns the new version or None
     
+    The new model is loaded and verified before the swap. Requests already
+    running keep the model reference they started with, and the old model is
+    released once they finish.
+    """
+    global _model, _model_version, _rejected_version
+    from model_registry import current_version
+    version = current_version(REGISTRY_DIR)
+    if version is None or version in (_model_version, _rejected_version):
+        return None
     try:
-        return joblib.load(model_path)
+        model = open_version(version)
+    except Exception as e:
+        _rejected_version = version
+        _reloads["failed"] += 1
+        _reloads["last_error"] = f"{version}: {str(e)}"
+        raise
+    _model, _model_version = model, version
+    _reloads["succeeded"] += 1
+    return version
+
+def start_reloader(interval=None):
+    """Check CURRENT every interval seconds on a daemon thread"""
+    interval = RELOAD_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return None
+    import threading
+    
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                version = reload_model()
+            except Exception as e:
+                print(f"Model reload failed: {str(e)}", file=sys.stderr, flush=True)
+                continue
+            if version is not None:
+                print(f"Reloaded model version {version}", file=sys.stderr, flush=True)
+    
+    thread = threading.Thread(target=run, name='model-reloader', daemon=True)
+    thread.start()
+    return thread
+
+class ShadowScorer:
+    """Score live rows with a second model version off the request path and compare
+    
+    Rows are handed to a single background thread; when more than
+    SHADOW_MAX_PENDING batches are waiting, new batches are skipped instead
+    of queueing behind the live traffic.
+    """
+    
+    def __init__(self, version):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        self.version = version
+        self.model = open_version(version)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shadow')
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.rows = 0
+        self.agreed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.primary_seconds = 0.0
+        self.shadow_seconds = 0.0
+    
+    def submit(self, X, labels, primary_seconds):
+        """Queue rows the served model labelled in primary_seconds for shadow scoring"""
+        with self.lock:
+            if self.pending >= SHADOW_MAX_PENDING:
+                self.skipped += len(X)
+                return
+            self.pending += 1
+        self.executor.submit(self._score, X, labels, primary_seconds)
+    
+    def _score(self, X, labels, primary_seconds):
+        import numpy as np
+        try:
+            started = time.perf_counter()
+            proba = self.model.predict_proba(X)
+            self.shadow_seconds += time.perf_counter() - started
+            self.primary_seconds += primary_seconds
+            shadow_labels = np.asarray(self.model.classes_).astype(str)[np.argmax(proba, axis=1)]
+            self.rows += len(X)
+            self.agreed += int(np.count_nonzero(shadow_labels == np.asarray(labels).astype(str)))
+        except Exception:
+            self.errors += 1
+        finally:
+            with self.lock:
+                self.pending -= 1
+    
+    def stats(self):
+        """Agreement and latency counters for the health and metrics commands"""
+        return {
+            "version": self.version,
+            "rows": self.rows,
+            "agreement": round(self.agreed / self.rows, 4) if self.rows else None,
+            "primary_ms_per_row": round(self.primary_seconds * 1000 / self.rows, 4) if self.rows else None,
+            "shadow_ms_per_row": round(self.shadow_seconds * 1000 / self.rows, 4) if self.rows else None,
+            "pending": self.pending,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+def start_shadow(version):
+    """Score traffic with version in the background; exits with a JSON error if it cannot be loaded"""
+    global _shadow
+    try:
+        _shadow = ShadowScorer(version)
     except Exception as e:
         print(json.dumps({
-            "error": f"Failed to load model: {str(e)}"
+            "error": f"Failed to load shadow model {version}: {str(e)}"
         }))
         sys.exit(1)
 
+def configure_cache(mode):
+    """Set up the prediction cache for this process"""
+    global _cache
+    if _cache is not None and hasattr(_cache, 'close'):
+        _cache.close()
+    _cache = None
+    if mode in (None, 'off'):
+        return
+    
+    from prediction_cache import (
+        PredictionCache, SQLitePredictionCache, DEFAULT_MAX_SIZE, DEFAULT_TTL, load_precision
+    )
+    max_size = int(os.environ.get('PREDICTION_CACHE_SIZE', DEFAULT_MAX_SIZE))
+    ttl = float(os.environ.get('PREDICTION_CACHE_TTL', DEFAULT_TTL))
+    if mode == 'sqlite':
+        _cache = SQLitePredictionCache(CACHE_PATH, max_size=max_size, ttl=ttl)
+    else:
+        _cache = PredictionCache(max_size=max_size, ttl=ttl)
+    _cache.precision = load_precision(os.environ.get('PREDICTION_CACHE_PRECISION'))
+
+def cache_stats():
+    """Prediction cache counters, or None when caching is off"""
+    return _cache.stats() if _cache is not None else None
+
+def configure_spatial_index(enabled):
+    """Open the spatial index (SPATIAL_INDEX_PATH, else REPORTS_DIR/spatial_index.sqlite3) if enabled"""
+    global _spatial
+    _spatial = None
+    if enabled:
+        from spatial_index import SpatialIndex
+        _spatial = SpatialIndex()
+
+def index_prediction(request, response):
+    """Record a located single-sample result in the spatial index; failures are logged, not returned"""
+    if _spatial is None or 'location' not in request or 'prediction' not in response:
+        return
+    from spatial_index import record_from_prediction
+    import uuid
+    from datetime import datetime, timezone
+    try:
+        record = record_from_prediction(request.get('sample_id') or uuid.uuid4().hex, request.get('features', request),
+                                        response, request['location'], datetime.now(timezone.utc).isoformat())
+        if record is not None:
+            _spatial.add([record])
+    except Exception as e:
+        print(f"Spatial index update failed: {str(e)}", file=sys.stderr, flush=True)
+
 def validate_input(soil_data):
     """Validate input soil features"""
-    errors = []
+    return validate_batch([soil_data])[1][0]
+
+def format_prediction(classes, prediction_proba):
+    """Build the result object for one row of class probabilities"""
+    import numpy as np
+    best = int(np.argmax(prediction_proba))
+    
+    # Get class probabilities
+    probabilities = {str(cls): float(prob) for cls, prob in zip(classes, prediction_proba)}
+    
+    return {
+        "prediction": str(classes[best]),
+        "confidence": round(float(prediction_proba[best]), 3),
+        "probabilities": probabilities
+    }
+
+def predict_batch(samples, timer=None):
+    """Make fertility predictions for many samples with a single forest pass
+    
+    Returns one result per sample, in input order. Samples that fail
+    validation get an error result instead of failing the whole batch.
+    Stage times are recorded on timer (a StageTimer) if given.
+    """
+    import numpy as np
+    if timer:
+        timer.mark('imports')
+    model = load_model(timer)
+    if timer:
+        timer.mark('load_model')
+    results = [None] * len(samples)
+    row_indices = []
+    row_keys = []
     
-    # Check all required features are present
-    missing_features = [f for f in FEATURE_ORDER if f not in soil_data]
-    if missing_features:
-        errors.append(f"Missing features: {missing_features}")
+    if _cache is not None:
+        from prediction_cache import cache_key
+        _cache.set_model_checksum(model_checksum(model))
     
-    # Validate ranges
-    if 'pH' in soil_data:
-        if not (3.0 <= soil_data['pH'] <= 10.0):
-            errors.append("pH must be between 3.0 and 10.0")
+    # Validate the whole batch at once, before touching the model
+    X, errors = validate_batch(samples)
+    for i, validation_errors in enumerate(errors):
+        if validation_errors:
+            results[i] = {
+                "error": "Input validation failed",
+                "details": validation_errors
+            }
+            continue
+        
+        if _cache is not None:
+            key = cache_key(X[i], FEATURE_ORDER, _cache.precision)
+            cached = _cache.get(key)
+            if cached is not None:
+                results[i] = cached
+                continue
+            row_keys.append(key)
+        
+        row_indices.append(i)
     
-    if 'EC' in soil_data:
-        if not (0.0 <= soil_data['EC'] <= 10.0):
-            errors.append("EC must be between 0.0 and 10.0 dS/m")
+    if timer:
+        timer.mark('validate')
     
-    # Check for negative values (except pH)
-    for feature in FEATURE_ORDER:
-        if feature != 'pH' and feature in soil_data:
-            if soil_data[feature] < 0:
-                errors.append(f"{feature} cannot be negative")
+    if not row_indices:
+        if _cache is not None:
+            _cache.flush()
+        return results
     
-    return errors
+    try:
+        # One predict_proba over the whole matrix; the class is its argmax
+        started = time.perf_counter()
+        prediction_proba = model.predict_proba(X[row_indices])
+        forest_seconds = time.perf_counter() - started
+    except Exception as e:
+        for i in row_indices:
+            results[i] = {"error": f"Prediction failed: {str(e)}"}
+        return results
+    if timer:
+        timer.mark('forest')
+    
+    classes = model.classes_
+    if _shadow is not None:
+        _shadow.submit(X[row_indices], np.asarray(classes)[np.argmax(prediction_proba, axis=1)], forest_seconds)
+    for i, proba in zip(row_indices, prediction_proba):
+        results[i] = format_prediction(classes, proba)
+    if timer:
+        timer.mark('format')
+    
+    if _cache is not None:
+        for i, key in zip(row_indices, row_keys):
+            _cache.put(key, results[i])
+        _cache.flush()
+        if timer:
+            timer.mark('cache')
+    
+    return results
 
-def predict_fertility(soil_data):
+def predict_matrix(X, timer=None):
+    """Score a float matrix in FEATURE_ORDER without building per-sample results
+    
+    Returns (classes, indices, proba, errors): the predicted class index per
+    row (-1 where the row fails the feature schema), the class probability
+    matrix (NaN rows there) and the schema errors by row index. The
+    prediction cache is not consulted.
+    """
+    import numpy as np
+    from feature_schema import matrix_errors
+    if timer:
+        timer.mark('imports')
+    model = load_model(timer)
+    if timer:
+        timer.mark('load_model')
+    
+    errors = matrix_errors(X)
+    classes = model.classes_
+    indices = np.full(len(X), -1, dtype=np.int32)
+    proba = np.full((len(X), len(classes)), np.nan, dtype=np.float32)
+    valid = np.ones(len(X), dtype=bool)
+    valid[list(errors)] = False
+    if timer:
+        timer.mark('validate')
+    
+    started = time.perf_counter()
+    # An empty frame has nothing to score (sklearn refuses 0 rows)
+    if len(X) and valid.all():
+        proba[:] = model.predict_proba(X)
+    elif valid.any():
+        proba[valid] = model.predict_proba(X[valid])
+    indices[valid] = np.argmax(proba[valid], axis=1)
+    if timer:
+        timer.mark('forest')
+    if _shadow is not None and valid.any():
+        _shadow.submit(X[valid], np.asarray(classes)[indices[valid]], time.perf_counter() - started)
+    return classes, indices, proba, errors
+
+def predict_fertility(soil_data, timer=None):
     """Make fertility prediction"""
-    model = load_model()
+    return predict_batch([soil_data], timer)[0]
+
+def _csv_value(value):
+    """Convert a CSV cell to a float where possible"""
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def read_samples(source, fmt=None):
+    """Read a batch of samples from a JSON array, NDJSON or CSV file
     
-    # Validate input
-    validation_errors = validate_input(soil_data)
-    if validation_errors:
-        return {
-            "error": "Input validation failed",
-            "details": validation_errors
-        }
+    Lines that cannot be parsed are kept as None so that results still
+    line up with the input.
+    """
+    if fmt is None:
+        suffix = Path(source).suffix.lower() if source != '-' else ''
+        fmt = {'.csv': 'csv', '.json': 'json'}.get(suffix, 'ndjson')
     
+    infile = sys.stdin if source == '-' else open(source, newline='')
     try:
-        # Extract features in correct order
-        features = [soil_data[feature] for feature in FEATURE_ORDER]
-        features_array = np.array(features).reshape(1, -1)
+        if fmt == 'json':
+            samples = json.load(infile)
+            if not isinstance(samples, list):
+                raise ValueError("JSON batch input must be an array of samples")
+            return samples
         
-        # Make prediction
-        prediction = model.predict(features_array)[0]
-        prediction_proba = model.predict_proba(features_array)[0]
-        
-        # Get confidence (max probability)
-        confidence = float(np.max(prediction_proba))
-        
-        # Get class probabilities
-        classes = model.classes_
-        probabilities = {cls: float(prob) for cls, prob in zip(classes, prediction_proba)}
+        if fmt == 'csv':
+            import csv
+            # Empty cells are treated as missing features
+            return [
+                {key: _csv_value(value) for key, value in row.items() if key and value not in (None, '')}
+                for row in csv.DictReader(infile)
+            ]
         
+        samples = []
+        for line in infile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                samples.append(json.loads(line))
+            except json.JSONDecodeError:
+                samples.append(None)
+        return samples
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+
+def write_results(results, outfile=sys.stdout):
+    """Write one JSON result per line"""
+    for result in results:
+        outfile.write(json.dumps(result) + '\n')
+    outfile.flush()
+
+def handle_request(request):
+    """Handle a single server-mode request"""
+    global _requests_served
+    
+    cmd = request.get('cmd')
+    if cmd == 'health':
         return {
-            "prediction": prediction,
-            "confidence": round(confidence, 3),
-            "probabilities": probabilities
+            "status": "ok",
+            "pid": os.getpid(),
+            "uptime": round(time.time() - _started_at, 3),
+            "requests": _requests_served,
+            "cache": cache_stats(),
+            "model_version": _model_version,
+            "reloads": dict(_reloads),
+            "shadow": _shadow.stats() if _shadow is not None else None
         }
+    if cmd == 'ready':
+        return {"ready": _model is not None}
+    if cmd == 'metrics':
+        return {"metrics": metrics_text()}
+    if cmd is not None:
+        return {"error": f"Unknown command: {cmd}"}
+    
+    if 'samples' in request:
+        samples = request['samples']
+        if not isinstance(samples, list):
+            return {"error": "samples must be a JSON array"}
+        _requests_served += len(samples)
+        timer = request_timer()
+        response = {"results": predict_batch(samples, timer)}
+    else:
+        _requests_served += 1
+        timer = request_timer()
+        response = predict_fertility(request.get('features', request), timer)
+        index_prediction(request, response)
+    
+    if timer:
+        # Copy first: a single prediction may be the dict held by the cache
+        response = dict(response, timings=timer.finish())
+    return response
+
+def serve_stream(infile, outfile):
+    """Answer newline-delimited JSON requests until the input is closed"""
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
         
-    except Exception as e:
-        return {
-            "error": f"Prediction failed: {str(e)}"
-        }
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError:
+            response = {"error": "Invalid JSON input"}
+        else:
+            if isinstance(request, dict):
+                try:
+                    response = handle_request(request)
+                except Exception as e:
+                    response = {"error": f"Unexpected error: {str(e)}"}
+                if 'id' in request:
+                    # Copy: the response may be the prediction cache's stored result
+                    response = dict(response, id=request['id'])
+            else:
+                response = {"error": "Request must be a JSON object"}
+        
+        outfile.write(json.dumps(response) + '\n')
+        outfile.flush()
+
+def serve(socket_path=None, **gateway_options):
+    """Run the long-lived predictor with the model loaded once (and hot-reloaded from the registry)"""
+    load_model()
+    start_reloader()
+    
+    if BATCH_WINDOW_MS > 0:
+        from prediction_gateway import run_gateway
+        run_gateway(handle_request, socket_path, {"event": "ready", "pid": os.getpid()},
+                    window_ms=BATCH_WINDOW_MS, on_result=index_prediction if _spatial is not None else None,
+                    **gateway_options)
+        return
+    
+    if socket_path is None:
+        print(json.dumps({"event": "ready", "pid": os.getpid()}), flush=True)
+        serve_stream(sys.stdin, sys.stdout)
+        return
+    
+    import io
+    import socketserver
+    
+    class SocketHandler(socketserver.StreamRequestHandler):
+        """Serve one Unix socket connection"""
+        def handle(self):
+            infile = io.TextIOWrapper(self.rfile, encoding='utf-8')
+            outfile = io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True)
+            serve_stream(infile, outfile)
+    
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, SocketHandler) as server:
+        print(json.dumps({"event": "ready", "pid": os.getpid(), "socket": socket_path}), flush=True)
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+def serve_binary(socket_path=None):
+    """Answer binary frames (binary_protocol.py) with the model loaded once"""
+    from binary_protocol import serve_binary as serve_frames
+    load_model()
+    start_reloader()
+    
+    def predict_frame(X):
+        global _requests_served
+        _requests_served += len(X)
+        return predict_matrix(X)
+    
+    if socket_path is None:
+        serve_frames(sys.stdin.buffer, sys.stdout.buffer, predict_frame, len(FEATURE_ORDER), SCHEMA_VERSION)
+        return
+    
+    import socketserver
+    
+    class SocketHandler(socketserver.StreamRequestHandler):
+        """Serve one Unix socket connection"""
+        def handle(self):
+            serve_frames(self.rfile, self.wfile, predict_frame, len(FEATURE_ORDER), SCHEMA_VERSION)
+    
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    with socketserver.ThreadingUnixStreamServer(socket_path, SocketHandler) as server:
+        print(json.dumps({"event": "ready", "pid": os.getpid(), "socket": socket_path}), flush=True)
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(socket_path)
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Soil fertility ML predictor')
+    parser.add_argument('input', nargs='?', help='JSON soil features (read from stdin if omitted)')
+    parser.add_argument('--batch', metavar='PATH',
+                        help='Score a batch file of samples (CSV, NDJSON or JSON array; - for stdin)')
+    parser.add_argument('--format', choices=['csv', 'ndjson', 'json'],
+                        help='Batch file format (default: from the file extension)')
+    parser.add_argument('--engine', choices=['auto', 'joblib', 'arrays', 'mmap'],
+                        help='Inference engine (default: $PREDICTOR_ENGINE or auto)')
+    parser.add_argument('--cache', choices=['off', 'memory', 'sqlite'],
+                        help='Prediction cache (default: $PREDICTION_CACHE, else memory when serving, off otherwise)')
+    parser.add_argument('--cache-stats', action='store_true', help='Print the on-disk prediction cache counters and exit')
+    parser.add_argument('--serve', action='store_true',
+                        help='Keep the model loaded and answer newline-delimited JSON requests')
+    parser.add_argument('--socket', help='Unix socket path for server mode (default: stdin/stdout)')
+    parser.add_argument('--binary', action='store_true',
+                        help='Answer binary float32 frames (see binary_protocol.py) instead of JSON')
+    parser.add_argument('--batch-window-ms', type=float,
+                        help='Micro-batch concurrent server requests arriving within this window '
+                             '(default: $PREDICTOR_BATCH_WINDOW_MS, else off)')
+    parser.add_argument('--max-batch', type=int, help='Largest micro-batch (default: 64)')
+    parser.add_argument('--max-queue', type=int,
+                        help='Waiting samples beyond which requests are shed as overloaded (default: 4096)')
+    parser.add_argument('--reload-interval', type=float,
+                        help='Seconds between checks for a newly promoted registry version '
+                             '(default: $PREDICTOR_RELOAD_INTERVAL, else 5; 0 disables)')
+    parser.add_argument('--shadow', metavar='VERSION',
+                        help='Also score server traffic with this registry version and report agreement '
+                             '(default: $PREDICTOR_SHADOW_VERSION)')
+    parser.add_argument('--spatial-index', action='store_true',
+                        help='Add server requests with a "location" to the spatial index (or $PREDICTOR_SPATIAL_INDEX=1)')
+    parser.add_argument('--timings', action='store_true',
+                        help='Add per-stage timings and RSS high-water marks to the output (or $PREDICTOR_TIMINGS=1)')
+    return parser.parse_args(argv)
 
 def main():
     """Main function to handle input/output"""
+    global ENGINE, TIMINGS, BATCH_WINDOW_MS, RELOAD_INTERVAL
+    args = parse_args()
+    if args.engine:
+        ENGINE = args.engine
+    if args.batch_window_ms is not None:
+        BATCH_WINDOW_MS = args.batch_window_ms
+    if args.reload_interval is not None:
+        RELOAD_INTERVAL = args.reload_interval
+    if args.timings:
+        TIMINGS = True
+    
+    timer = request_timer()
+    if timer:
+        # Interpreter start up to here, including argument parsing
+        startup_ms = _process_age_ms()
+        if startup_ms is not None:
+            timer.stages_ms['startup'] = startup_ms
+    
+    cache_mode = args.cache or CACHE_MODE or ('memory' if args.serve else 'off')
+    if args.cache_stats:
+        configure_cache('sqlite')
+        print(json.dumps(cache_stats()))
+        return
+    configure_cache(cache_mode)
+    
+    shadow_version = args.shadow or SHADOW_VERSION
+    if shadow_version and (args.serve or args.binary):
+        start_shadow(shadow_version)
+    if args.serve:
+        configure_spatial_index(args.spatial_index or SPATIAL_INDEX)
+    
+    if args.binary:
+        try:
+            serve_binary(args.socket)
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    if args.serve:
+        try:
+            gateway_options = {'max_batch': args.max_batch, 'max_queue': args.max_queue}
+            serve(args.socket, **{k: v for k, v in gateway_options.items() if v is not None})
+        except KeyboardInterrupt:
+            pass
+        return
+    
+    if args.batch:
+        try:
+            samples = read_samples(args.batch, args.format)
+        except (OSError, ValueError) as e:
+            print(json.dumps({"error": f"Failed to read batch input: {str(e)}"}))
+            sys.exit(1)
+        write_results(predict_batch(samples, timer))
+        if timer:
+            write_results([{"timings": timer.finish()}])
+        return
+    
     try:
         # Read from stdin or command line argument
-        if len(sys.argv) > 1:
+        if args.input is not None:
             # JSON string as command line argument
-            input_data = json.loads(sys.argv[1])
+            input_data = json.loads(args.input)
         else:
             # Read from stdin
             input_data = json.load(sys.stdin)
         
+        # A JSON array is scored as a batch, one result per line
+        if isinstance(input_data, list):
+            write_results(predict_batch(input_data, timer))
+            if timer:
+                write_results([{"timings": timer.finish()}])
+            return
+        
         # Make prediction
-        result = predict_fertility(input_data)
+        result = predict_fertility(input_data, timer)
+        if timer:
+            result = dict(result, timings=timer.finish())
         
         # Output result as JSON
         print(json.dumps(result))
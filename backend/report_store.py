@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store for report charts, and the size/age limits of REPORTS_DIR.
+generate_report.py keys each chart on a hash of its report's canonicalized
+soil_features, prediction and location plus the chart settings. A repeat
+request under a new reportId gets a hard link to the stored chart PNG, which
+holds no report ID, instead of re-rendering it. The PDF and CSV show the
+report ID and generation time, so they are always written fresh.
+
+Layout: REPORTS_DIR/store/<sha256><suffix>. Report files in REPORTS_DIR are
+links to these objects, so a stored object is unreferenced once its link
+count drops to 1.
+
+evict() keeps REPORTS_DIR within an age and a size limit. It removes whole
+reports (all their files), oldest first, then drops unreferenced store
+objects. Disk usage is counted once per inode, so linked reports are not
+double counted.
+"""
+
+import os
+import json
+import fcntl
+import time
+import shutil
+import hashlib
+
+# Bump when the rendered output changes so old artifacts are not reused
+STORE_VERSION = 2
+SUFFIXES = {'pdf': '.pdf', 'csv': '.csv', 'chart': '_charts.png', 'json': '.json'}
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+DEFAULT_EVICT_INTERVAL = 300
+
+def _canonical(value):
+    """Normalize numbers so 45 and 45.0 hash the same"""
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+def content_key(report_data, settings):
+    """SHA-256 of the report content and the settings that affect its rendering"""
+    content = {
+        'version': STORE_VERSION,
+        'soil_features': report_data.get('soil_features'),
+        'prediction': report_data.get('prediction'),
+        'location': report_data.get('location'),
+        'settings': settings,
+    }
+    canonical = json.dumps(_canonical(content), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def report_id_of(filename):
+    """Report ID a file in REPORTS_DIR belongs to, or None"""
+    for suffix in sorted(SUFFIXES.values(), key=len, reverse=True):
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return None
+
+def _link(src, dest):
+    """Atomically point dest at src's content, by hard link where possible"""
+    tmp = f'{dest}.{os.getpid()}.tmp'
+    try:
+        os.link(src, tmp)
+    except OSError:
+        # Cross-device or no hard link support
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dest)
+
+class ReportStore:
+    """Content-addressed report artifacts with age- and size-based eviction"""
+
+    def __init__(self, reports_dir, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE,
+                 evict_interval=DEFAULT_EVICT_INTERVAL, on_remove=None):
+        self.reports_dir = reports_dir
+        # Called with the IDs of the reports each evict() removed (e.g. to unindex them)
+        self.on_remove = on_remove
+        self.root = os.path.join(reports_dir, 'store')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_interval = evict_interval
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key, fmt):
+        """Path of a stored object"""
+        return os.path.join(self.root, f'{key}{SUFFIXES[fmt]}')
+
+    def fetch(self, key, fmt, dest):
+        """Link the stored object to dest; returns False if it is not stored"""
+        try:
+            _link(self.path(key, fmt), dest)
+        except FileNotFoundError:
+            return False
+        # Links share the inode, so this also marks the stored object as recently used
+        os.utime(dest)
+        return True
+
+    def publish(self, key, fmt, src):
+        """Add a freshly rendered artifact to the store"""
+        if not os.path.exists(src):
+            return
+        try:
+            os.link(src, self.path(key, fmt))
+        except FileExistsError:
+            # Another worker rendered the same content first
+            pass
+        except OSError:
+            shutil.copy2(src, self.path(key, fmt))
+
+    def evict(self, now=None):
+        """Remove expired reports, then the oldest ones while over max_bytes
+
+        Store objects that only the removed reports referenced go with them;
+        other unreferenced objects are dropped once expired or while still
+        over max_bytes. The removed report IDs are passed to on_remove.
+        Returns what was removed and the bytes in use.
+        """
+        now = now or time.time()
+        # Another process may be evicting the same files: anything that
+        # disappears between listing and removal is treated as already gone
+        reports = {}
+        for entry in os.scandir(self.reports_dir):
+            report_id = report_id_of(entry.name) if entry.is_file() else None
+            if report_id is None:
+                continue
+            try:
+                stat = os.stat(entry.path)
+            except FileNotFoundError:
+                continue
+            files, newest = reports.get(report_id, ([], 0.0))
+            files.append((entry.path, stat.st_ino))
+            reports[report_id] = (files, max(newest, stat.st_mtime))
+
+        objects = {}
+        # Space is only freed when an inode's last link goes
+        sizes, links = {}, {}
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.endswith('.tmp') and not entry.name.startswith('.'):
+                try:
+                    stat = os.stat(entry.path)
+                except FileNotFoundError:
+                    continue
+                objects[stat.st_ino] = (entry.path, stat.st_mtime)
+                sizes[stat.st_ino] = stat.st_size
+                links[stat.st_ino] = stat.st_nlink
+        for files, _ in reports.values():
+            for path, _ in files:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                sizes[stat.st_ino] = stat.st_size
+                links[stat.st_ino] = stat.st_nlink
+        usage = sum(sizes.values())
+
+        def unlink(path, inode):
+            nonlocal usage
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            if inode not in links:
+                return
+            links[inode] -= 1
+            if links[inode] == 0:
+                usage -= sizes[inode]
+
+        removed, removed_objects = [], 0
+        for report_id, (files, newest) in sorted(reports.items(), key=lambda item: item[1][1]):
+            if now - newest <= self.max_age and usage <= self.max_bytes:
+                break
+            for path, inode in files:
+                unlink(path, inode)
+                if links.get(inode) == 1 and inode in objects:
+                    unlink(objects.pop(inode)[0], inode)
+                    removed_objects += 1
+            removed.append(report_id)
+
+        for inode, (path, mtime) in sorted(objects.items(), key=lambda item: item[1][1]):
+            if links.get(inode) == 1 and (now - mtime > self.max_age or usage > self.max_bytes):
+                unlink(path, inode)
+                removed_objects += 1
+
+        if removed and self.on_remove is not None:
+            self.on_remove(removed)
+        return {'removed_reports': len(removed), 'removed_objects': removed_objects, 'bytes_in_use': usage}
+
+    def maybe_evict(self):
+        """Run evict() if it has not run in the last evict_interval seconds (across processes)
+
+        The marker is checked and touched under an exclusive lock, so only
+        one process evicts per interval.
+        """
+        marker = os.path.join(self.root, '.last_eviction')
+        with open(marker, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process is checking or evicting right now
+                return None
+            try:
+                stat = os.fstat(f.fileno())
+                # A marker that was just created is empty: no eviction has run yet
+                if stat.st_size and time.time() - stat.st_mtime < self.evict_interval:
+                    return None
+                f.truncate(0)
+                f.write('.')
+                f.flush()
+                os.utime(marker)
+                return self.evict()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Spatial index over location-tagged predictions and report metadata.
+Dashboards query it instead of rescanning every {report_id}.json.
+
+Each sample (a report's location, fertility level and N/P/K, or a
+predictor result with a location) is stored with the grid cell it falls in:
+cells are CELL_DEGREES x CELL_DEGREES squares of latitude/longitude, keyed
+by (floor(lat / size), floor(lon / size)). Per-cell aggregates (sample
+count, per-class counts, N/P/K sums) are updated in the same transaction as
+every insert, replace or removal, so they never need a rescan.
+
+  nearest(lat, lon, n)      searches outwards from the point's cell until
+                            no unvisited cell can hold a closer sample
+  distribution(bbox)        class counts and mean N/P/K: cells fully inside
+                            the box come from the aggregates, only the
+                            partly covered edge cells read samples
+  cells(bbox)               the per-cell aggregates, e.g. for a heat map
+
+Layout: one SQLite file (SPATIAL_INDEX_PATH, default
+REPORTS_DIR/spatial_index.sqlite3) in WAL mode, so dashboards can read
+while report workers write. nearest() searches across the antimeridian;
+a bbox must have west <= east.
+
+Usage:
+  python3 spatial_index.py rebuild [REPORTS_DIR]
+  python3 spatial_index.py add FILE                 (NDJSON records or report payloads; - for stdin)
+  python3 spatial_index.py nearest LAT LON [-n N]
+  python3 spatial_index.py bbox SOUTH WEST NORTH EAST [--cells]
+"""
+
+import os
+import sys
+import json
+import math
+import sqlite3
+import threading
+
+# Grid cell size in degrees (0.1 is about 11 km north-south)
+DEFAULT_CELL_DEGREES = 0.1
+NUTRIENTS = ('N', 'P', 'K')
+# Report payloads name the nutrients differently from the model features
+REPORT_NUTRIENTS = {'N': 'nitrogen', 'P': 'phosphorus', 'K': 'potassium'}
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def default_path():
+    """SPATIAL_INDEX_PATH, else spatial_index.sqlite3 in REPORTS_DIR"""
+    return os.environ.get('SPATIAL_INDEX_PATH') or os.path.join(
+        os.environ.get('REPORTS_DIR', './reports'), 'spatial_index.sqlite3')
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def _number(value):
+    """value as a float, or None when it is missing or not a finite number"""
+    if type(value) not in (int, float) or not math.isfinite(value):
+        return None
+    return float(value)
+
+def record_from_report(report_data):
+    """Index record for a report payload, or None when it has no location"""
+    location = report_data.get('location') or {}
+    lat, lon = _number(location.get('lat')), _number(location.get('lon'))
+    if lat is None or lon is None:
+        return None
+    soil_features = report_data.get('soil_features') or {}
+    record = {
+        'id': str(report_data['reportId']),
+        'kind': 'report',
+        'lat': lat,
+        'lon': lon,
+        'fertility': (report_data.get('prediction') or {}).get('fertility_level'),
+        'timestamp': report_data.get('timestamp'),
+    }
+    for nutrient, name in REPORT_NUTRIENTS.items():
+        record[nutrient] = _number(soil_features.get(name))
+    return record
+
+def record_from_prediction(sample_id, features, result, location, timestamp=None):
+    """Index record for one predictor result, or None when it has no usable location or prediction"""
+    lat, lon = _number((location or {}).get('lat')), _number((location or {}).get('lon'))
+    if lat is None or lon is None or 'prediction' not in result:
+        return None
+    record = {'id': str(sample_id), 'kind': 'prediction', 'lat': lat, 'lon': lon,
+              'fertility': result['prediction'], 'timestamp': timestamp}
+    for nutrient in NUTRIENTS:
+        record[nutrient] = _number(features.get(nutrient))
+    return record
+
+def _aggregate(classes, sums, counts, samples):
+    """Summary object from class counts and nutrient sums/counts"""
+    return {
+        'samples': samples,
+        'classes': dict(sorted(classes.items())),
+        'mean': {nutrient: round(sums[nutrient] / counts[nutrient], 3) if counts[nutrient] else None
+                 for nutrient in NUTRIENTS},
+    }
+
+class SpatialIndex:
+    """Grid-bucketed SQLite index of located samples with incremental per-cell aggregates"""
+
+    def __init__(self, path=None, cell_degrees=None):
+        self.path = path or default_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Report daemon threads share one index; the lock serialises them
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # In WAL mode this still never corrupts the index; a crash can only lose the last commits
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS samples (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                cell_row INTEGER NOT NULL,
+                cell_col INTEGER NOT NULL,
+                fertility TEXT,
+                n REAL,
+                p REAL,
+                k REAL,
+                timestamp TEXT
+            );
+            CREATE INDEX IF NOT EXISTS samples_cell ON samples (cell_row, cell_col);
+            CREATE TABLE IF NOT EXISTS cells (
+                cell_row INTEGER NOT NULL,
+                cell_col INTEGER NOT NULL,
+                fertility TEXT NOT NULL,
+                samples INTEGER NOT NULL,
+                n_sum REAL NOT NULL, n_count INTEGER NOT NULL,
+                p_sum REAL NOT NULL, p_count INTEGER NOT NULL,
+                k_sum REAL NOT NULL, k_count INTEGER NOT NULL,
+                PRIMARY KEY (cell_row, cell_col, fertility)
+            );
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+        ''')
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'cell_degrees'").fetchone()
+            if row is None:
+                self.cell_degrees = float(cell_degrees or os.environ.get('SPATIAL_CELL_DEGREES') or DEFAULT_CELL_DEGREES)
+                self._conn.execute("INSERT INTO meta (name, value) VALUES ('cell_degrees', ?)", (repr(self.cell_degrees),))
+            else:
+                self.cell_degrees = float(row[0])
+                if cell_degrees is not None and float(cell_degrees) != self.cell_degrees:
+                    raise ValueError(f"{self.path} uses {self.cell_degrees} degree cells; delete it and rebuild to change the size")
+
+    def cell_of(self, lat, lon):
+        """(row, col) of the grid cell holding a point"""
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def _apply(self, rows, sign):
+        """Add (sign=1) or subtract (sign=-1) sample rows from the cell aggregates"""
+        for cell_row, cell_col, fertility, n, p, k in rows:
+            values = [sign]
+            for value in (n, p, k):
+                values += [sign * value if value is not None else 0.0, sign if value is not None else 0]
+            self._conn.execute(
+                "INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(cell_row, cell_col, fertility) DO UPDATE SET "
+                "samples = samples + excluded.samples, "
+                "n_sum = n_sum + excluded.n_sum, n_count = n_count + excluded.n_count, "
+                "p_sum = p_sum + excluded.p_sum, p_count = p_count + excluded.p_count, "
+                "k_sum = k_sum + excluded.k_sum, k_count = k_count + excluded.k_count",
+                (cell_row, cell_col, fertility or 'Unknown', *values)
+            )
+
+    def _remove(self, ids):
+        """Delete samples by id and take them out of the aggregates (caller holds the transaction)"""
+        removed = 0
+        for sample_id in ids:
+            rows = self._conn.execute(
+                "SELECT cell_row, cell_col, fertility, n, p, k FROM samples WHERE id = ?", (sample_id,)
+            ).fetchall()
+            if rows:
+                self._apply(rows, -1)
+                self._conn.execute("DELETE FROM samples WHERE id = ?", (sample_id,))
+                removed += 1
+        return removed
+
+    def add(self, records):
+        """Insert or replace records (dicts with id, kind, lat, lon, fertility, N, P, K, timestamp)
+
+        A record whose id is already indexed replaces the old one, so
+        regenerating a report does not count it twice. Returns the number added.
+        """
+        rows = []
+        for record in records:
+            cell_row, cell_col = self.cell_of(record['lat'], record['lon'])
+            rows.append((str(record['id']), record.get('kind', 'prediction'), record['lat'], record['lon'],
+                         cell_row, cell_col, record.get('fertility'),
+                         record.get('N'), record.get('P'), record.get('K'), record.get('timestamp')))
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._remove([row[0] for row in rows])
+            self._conn.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._apply([row[4:10] for row in rows], 1)
+            self._conn.execute("DELETE FROM cells WHERE samples <= 0")
+        return len(rows)
+
+    def remove(self, ids):
+        """Drop samples by id (e.g. evicted reports); returns the number removed"""
+        with self._lock, self._conn:
+            removed = self._remove(ids)
+            self._conn.execute("DELETE FROM cells WHERE samples <= 0")
+        return removed
+
+    def nearest(self, lat, lon, n=10, max_km=None):
+        """The n samples closest to a point, nearest first, each with distance_km"""
+        cell_row, cell_col = self.cell_of(lat, lon)
+        # Past this many rows either side the search block covers every latitude
+        max_radius = math.ceil(180 / self.cell_degrees)
+        radius = 1
+        with self._lock:
+            while True:
+                cols = self._col_radius(lat, radius)
+                rows = []
+                for col0, col1 in self._col_ranges(cell_col - cols, cell_col + cols):
+                    rows += self._conn.execute(
+                        "SELECT id, kind, lat, lon, fertility, n, p, k, timestamp FROM samples "
+                        "WHERE cell_row BETWEEN ? AND ? AND cell_col BETWEEN ? AND ?",
+                        (cell_row - radius, cell_row + radius, col0, col1)
+                    ).fetchall()
+                found = sorted((haversine_km(lat, lon, row[2], row[3]), row) for row in rows)
+                if max_km is not None:
+                    found = [item for item in found if item[0] <= max_km]
+                # No sample outside the searched block is closer than reach_km
+                reach_km = radius * self.cell_degrees * KM_PER_DEGREE
+                if (len(found) >= n and found[n - 1][0] <= reach_km) or radius >= max_radius \
+                        or (max_km is not None and reach_km >= max_km):
+                    break
+                radius *= 2
+        return [
+            {'id': row[0], 'kind': row[1], 'lat': row[2], 'lon': row[3], 'fertility': row[4],
+             'N': row[5], 'P': row[6], 'K': row[7], 'timestamp': row[8], 'distance_km': round(distance, 3)}
+            for distance, row in found[:n]
+        ]
+
+    def _col_radius(self, lat, radius):
+        """Columns to search either side of lat so that any sample beyond them is
+        at least radius cells of latitude away"""
+        all_cols = math.ceil(360 / self.cell_degrees)
+        # Distance to the meridian dlon away: sin(d / R) = cos(lat) * sin(dlon)
+        reach = math.radians(min(90.0, radius * self.cell_degrees))
+        ratio = math.sin(reach) / max(math.cos(math.radians(lat)), 1e-12)
+        if ratio >= 1:
+            return all_cols
+        return min(all_cols, math.ceil(math.degrees(math.asin(ratio)) / self.cell_degrees))
+
+    def _col_ranges(self, col0, col1):
+        """Split a column range that runs past +/-180 degrees into ranges on the grid"""
+        first = math.floor(-180 / self.cell_degrees)
+        count = math.ceil(360 / self.cell_degrees)
+        if col1 - col0 + 1 >= count:
+            return [(first, first + count - 1)]
+        # Shift the start onto the grid; the end may then run past the east edge
+        shift = (col0 - first) // count * count
+        col0, col1 = col0 - shift, col1 - shift
+        if col1 < first + count:
+            return [(col0, col1)]
+        return [(col0, first + count - 1), (first, col1 - count)]
+
+    def _inner_cells(self, south, west, north, east):
+        """Row/column range of the cells lying entirely inside a bbox (may be empty)"""
+        size = self.cell_degrees
+        return math.ceil(south / size), math.floor(north / size) - 1, math.ceil(west / size), math.floor(east / size) - 1
+
+    def distribution(self, south, west, north, east):
+        """Sample count, class counts and mean N/P/K of every sample inside a bbox"""
+        if south > north or west > east:
+            raise ValueError("bbox must be south <= north and west <= east")
+        row0, row1, col0, col1 = self._inner_cells(south, west, north, east)
+        classes = {}
+        sums = dict.fromkeys(NUTRIENTS, 0.0)
+        counts = dict.fromkeys(NUTRIENTS, 0)
+        samples = 0
+        with self._lock:
+            # Whole cells: precomputed aggregates
+            for fertility, total, n_sum, n_count, p_sum, p_count, k_sum, k_count in self._conn.execute(
+                "SELECT fertility, SUM(samples), SUM(n_sum), SUM(n_count), SUM(p_sum), SUM(p_count), "
+                "SUM(k_sum), SUM(k_count) FROM cells "
+                "WHERE cell_row BETWEEN ? AND ? AND cell_col BETWEEN ? AND ? GROUP BY fertility",
+                (row0, row1, col0, col1)
+            ):
+                classes[fertility] = classes.get(fertility, 0) + total
+                samples += total
+                for nutrient, value, count in zip(NUTRIENTS, (n_sum, p_sum, k_sum), (n_count, p_count, k_count)):
+                    sums[nutrient] += value
+                    counts[nutrient] += count
+
+            # Edge cells: only the samples that fall inside the bbox
+            edge_row0, edge_col0 = self.cell_of(south, west)
+            edge_row1, edge_col1 = self.cell_of(north, east)
+            for fertility, n, p, k in self._conn.execute(
+                "SELECT fertility, n, p, k FROM samples "
+                "WHERE cell_row BETWEEN ? AND ? AND cell_col BETWEEN ? AND ? "
+                "AND lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? "
+                "AND NOT (cell_row BETWEEN ? AND ? AND cell_col BETWEEN ? AND ?)",
+                (edge_row0, edge_row1, edge_col0, edge_col1, south, north, west, east, row0, row1, col0, col1)
+            ):
+                fertility = fertility or 'Unknown'
+                classes[fertility] = classes.get(fertility, 0) + 1
+                samples += 1
+                for nutrient, value in zip(NUTRIENTS, (n, p, k)):
+                    if value is not None:
+                        sums[nutrient] += value
+                        counts[nutrient] += 1
+        return dict(_aggregate(classes, sums, counts, samples), bbox=[south, west, north, east])
+
+    def cells(self, south, west, north, east):
+        """Aggregates of every non-empty cell that overlaps a bbox"""
+        row0, col0 = self.cell_of(south, west)
+        row1, col1 = self.cell_of(north, east)
+        grid = {}
+        with self._lock:
+            for cell_row, cell_col, fertility, total, n_sum, n_count, p_sum, p_count, k_sum, k_count in self._conn.execute(
+                "SELECT cell_row, cell_col, fertility, samples, n_sum, n_count, p_sum, p_count, k_sum, k_count "
+                "FROM cells WHERE cell_row BETWEEN ? AND ? AND cell_col BETWEEN ? AND ?",
+                (row0, row1, col0, col1)
+            ):
+                cell = grid.setdefault((cell_row, cell_col), [{}, dict.fromkeys(NUTRIENTS, 0.0), dict.fromkeys(NUTRIENTS, 0), 0])
+                cell[0][fertility] = total
+                cell[3] += total
+                for nutrient, value, count in zip(NUTRIENTS, (n_sum, p_sum, k_sum), (n_count, p_count, k_count)):
+                    cell[1][nutrient] += value
+                    cell[2][nutrient] += count
+        size = self.cell_degrees
+        return [
+            dict(_aggregate(*grid[key]), cell=list(key),
+                 bbox=[round(key[0] * size, 9), round(key[1] * size, 9),
+                       round((key[0] + 1) * size, 9), round((key[1] + 1) * size, 9)])
+            for key in sorted(grid)
+        ]
+
+    def stats(self):
+        """Sample and cell counts"""
+        with self._lock:
+            (samples,) = self._conn.execute("SELECT COUNT(*) FROM samples").fetchone()
+            (cells,) = self._conn.execute("SELECT COUNT(DISTINCT cell_row || ',' || cell_col) FROM cells").fetchone()
+        return {'samples': samples, 'cells': cells, 'cell_degrees': self.cell_degrees}
+
+    def rebuild(self, reports_dir):
+        """Index every {report_id}.json in reports_dir and recount the cell aggregates
+
+        For the first migration or a repair. Reports already indexed are
+        replaced; samples whose files have since been evicted are kept.
+        """
+        records = []
+        skipped = 0
+        for name in sorted(os.listdir(reports_dir)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(reports_dir, name)) as f:
+                    report_data = json.load(f)
+                record = record_from_report(report_data) if isinstance(report_data, dict) and 'reportId' in report_data else None
+            except (OSError, json.JSONDecodeError):
+                record = None
+            if record is None:
+                skipped += 1
+            else:
+                records.append(record)
+        indexed = self.add(records)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cells")
+            self._apply(self._conn.execute("SELECT cell_row, cell_col, fertility, n, p, k FROM samples").fetchall(), 1)
+        return {'indexed': indexed, 'skipped': skipped}
+
+    def close(self):
+        self._conn.close()
+
+def read_records(source):
+    """Index records from an NDJSON file ('-' for stdin): report payloads or records with id/lat/lon"""
+    stream = sys.stdin if source == '-' else open(source)
+    try:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"line {line_number}: {e}")
+            if not isinstance(entry, dict):
+                raise ValueError(f"line {line_number}: expected a JSON object")
+            if 'reportId' in entry:
+                record = record_from_report(entry)
+            elif _number(entry.get('lat')) is not None and _number(entry.get('lon')) is not None and 'id' in entry:
+                record = dict(entry, kind=entry.get('kind', 'prediction'))
+            else:
+                record = None
+            if record is not None:
+                yield record
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Spatial index over located predictions and reports')
+    parser.add_argument('--index', help='Index file (default: $SPATIAL_INDEX_PATH or REPORTS_DIR/spatial_index.sqlite3)')
+    parser.add_argument('--cell-degrees', type=float, help=f'Grid cell size for a new index (default: {DEFAULT_CELL_DEGREES})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild = commands.add_parser('rebuild', help='Index every report JSON in a directory and recount the cells')
+    rebuild.add_argument('reports_dir', nargs='?', default=os.environ.get('REPORTS_DIR', './reports'))
+    add = commands.add_parser('add', help='Index NDJSON records or report payloads')
+    add.add_argument('source')
+    nearest = commands.add_parser('nearest', help='Closest samples to a point')
+    nearest.add_argument('lat', type=float)
+    nearest.add_argument('lon', type=float)
+    nearest.add_argument('-n', type=int, default=10)
+    nearest.add_argument('--max-km', type=float)
+    bbox = commands.add_parser('bbox', help='Fertility distribution inside a bounding box')
+    for name in ('south', 'west', 'north', 'east'):
+        bbox.add_argument(name, type=float)
+    bbox.add_argument('--cells', action='store_true', help='Per-cell aggregates instead of one total')
+    commands.add_parser('stats', help='Sample and cell counts')
+    args = parser.parse_args()
+
+    try:
+        index = SpatialIndex(args.index, args.cell_degrees)
+        if args.command == 'rebuild':
+            result = dict(index.rebuild(args.reports_dir), success=True)
+        elif args.command == 'add':
+            result = {'success': True, 'indexed': index.add(list(read_records(args.source)))}
+        elif args.command == 'nearest':
+            result = {'samples': index.nearest(args.lat, args.lon, args.n, args.max_km)}
+        elif args.command == 'bbox' and args.cells:
+            result = {'cells': index.cells(args.south, args.west, args.north, args.east)}
+        elif args.command == 'bbox':
+            result = index.distribution(args.south, args.west, args.north, args.east)
+        else:
+            result = index.stats()
+        print(json.dumps(result))
+    except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+        print(json.dumps({'success': False, 'error': str(e)}))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
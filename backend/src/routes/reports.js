@@ -1,11 +1,15 @@
 const express = require('express');
 const { spawn } = require('child_process');
+const readline = require('readline');
 const path = require('path');
 const fs = require('fs').promises;
 const router = express.Router();
 
 // Ensure reports directory exists
 const REPORTS_DIR = process.env.REPORTS_DIR || './reports';
+// Warm workers in the `generate_report.py --serve` daemon; 0 spawns a process per report
+const REPORT_WORKERS = parseInt(process.env.REPORT_WORKERS || '2', 10);
+const REPORT_TIMEOUT_S = 60;
 
 async function ensureReportsDir() {
   try {
@@ -37,7 +41,7 @@ router.post('/report', async (req, res) => {
     };
 
     // Call Python report generator
-    const reportPaths = await generateReportWithPython(reportData);
+    const reportPaths = await generateReport(reportData);
     
     res.json({
       success: true,
@@ -127,6 +131,80 @@ router.get('/report/:id/download/:format?', async (req, res) => {
   }
 });
 
+// Long-lived report daemon, started on first use
+let reportDaemon = null;
+let nextReportJob = 1;
+
+function startReportDaemon() {
+  const pythonScript = path.join(__dirname, '../../generate_report.py');
+  const daemon = {
+    process: spawn('python3', [pythonScript, '--serve', '--workers', String(REPORT_WORKERS),
+      '--timeout', String(REPORT_TIMEOUT_S)], {
+      stdio: ['pipe', 'pipe', 'pipe']
+    }),
+    ready: false,
+    pending: new Map()
+  };
+
+  const lines = readline.createInterface({ input: daemon.process.stdout });
+  lines.on('line', (line) => {
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch (error) {
+      console.error('Failed to parse report daemon output:', line);
+      return;
+    }
+
+    if (message.event === 'ready') {
+      daemon.ready = true;
+      return;
+    }
+
+    const request = daemon.pending.get(message.id);
+    if (!request) return;
+    daemon.pending.delete(message.id);
+    delete message.id;
+    if (message.success) {
+      request.resolve(message);
+    } else {
+      request.reject(new Error(message.error));
+    }
+  });
+
+  daemon.process.stderr.on('data', (data) => {
+    daemon.stderr = data.toString();
+  });
+
+  daemon.process.on('close', (code) => {
+    for (const request of daemon.pending.values()) {
+      request.reject(new Error(`Report daemon exited with code ${code}: ${daemon.stderr || ''}`));
+    }
+    daemon.pending.clear();
+    if (reportDaemon === daemon) reportDaemon = null;
+  });
+
+  return daemon;
+}
+
+async function generateReport(reportData) {
+  if (REPORT_WORKERS > 0 && !reportDaemon) {
+    reportDaemon = startReportDaemon();
+  }
+  if (!reportDaemon || !reportDaemon.ready) {
+    // Daemon disabled or still warming up - fall back to a one-shot process
+    return generateReportWithPython(reportData);
+  }
+
+  const daemon = reportDaemon;
+  const id = nextReportJob++;
+  return new Promise((resolve, reject) => {
+    // The daemon enforces the per-job timeout and answers with an error
+    daemon.pending.set(id, { resolve, reject });
+    daemon.process.stdin.write(JSON.stringify({ ...reportData, id }) + '\n');
+  });
+}
+
 async function generateReportWithPython(reportData) {
   return new Promise((resolve, reject) => {
     const pythonScript = path.join(__dirname, '../../generate_report.py');
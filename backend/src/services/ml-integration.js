@@ -1,29 +1,124 @@
 // ML Integration service for calling Python predictor
 const { spawn } = require('child_process');
+const readline = require('readline');
 const path = require('path');
 
+const POOL_SIZE = parseInt(process.env.ML_WORKERS || '2', 10);
+const REQUEST_TIMEOUT_MS = 30000;
+
 class MLIntegration {
   constructor() {
     this.pythonScript = path.join(__dirname, '../../predictor.py');
+    this.workers = [];
+    this.nextWorker = 0;
+    this.nextRequestId = 1;
+  }
+
+  toModelInput(soilFeatures) {
+    // Convert soil features to ML model format
+    return {
+      N: soilFeatures.nitrogen,
+      P: soilFeatures.phosphorus,
+      K: soilFeatures.potassium,
+      pH: soilFeatures.ph,
+      EC: soilFeatures.ec,
+      OC: soilFeatures.organic_matter,
+      S: soilFeatures.sulfur || 10,
+      Zn: soilFeatures.zinc || 0.6,
+      Fe: soilFeatures.iron || 3.5,
+      Cu: soilFeatures.copper || 0.25,
+      Mn: soilFeatures.manganese || 2.8,
+      B: soilFeatures.boron || 0.4
+    };
+  }
+
+  // Start a pool of long-lived `predictor.py --serve` workers
+  startWorkers(size = POOL_SIZE) {
+    while (this.workers.length < size) {
+      this.workers.push(this.spawnWorker());
+    }
+  }
+
+  spawnWorker() {
+    const worker = {
+      process: spawn('python3', [this.pythonScript, '--serve'], {
+        stdio: ['pipe', 'pipe', 'pipe']
+      }),
+      ready: false,
+      pending: new Map()
+    };
+
+    const lines = readline.createInterface({ input: worker.process.stdout });
+    lines.on('line', (line) => {
+      let message;
+      try {
+        message = JSON.parse(line);
+      } catch (error) {
+        console.error('Failed to parse predictor worker output:', line);
+        return;
+      }
+
+      if (message.event === 'ready') {
+        worker.ready = true;
+        return;
+      }
+
+      const request = worker.pending.get(message.id);
+      if (!request) return;
+      worker.pending.delete(message.id);
+      clearTimeout(request.timer);
+      delete message.id;
+      request.resolve(message);
+    });
+
+    worker.process.stderr.on('data', (data) => {
+      worker.stderr = data.toString();
+    });
+
+    worker.process.on('close', (code) => {
+      worker.ready = false;
+      for (const request of worker.pending.values()) {
+        clearTimeout(request.timer);
+        request.reject(new Error(`Predictor worker exited with code ${code}: ${worker.stderr || ''}`));
+      }
+      worker.pending.clear();
+      this.workers = this.workers.filter(w => w !== worker);
+    });
+
+    return worker;
+  }
+
+  async callWarmPredictor(soilFeatures) {
+    const readyWorkers = this.workers.filter(w => w.ready);
+    if (!readyWorkers.length) {
+      // No warm worker yet - fall back to a one-shot process
+      return this.callPythonPredictor(soilFeatures);
+    }
+
+    const worker = readyWorkers[this.nextWorker++ % readyWorkers.length];
+    const id = this.nextRequestId++;
+
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        worker.pending.delete(id);
+        reject(new Error('Python predictor timeout'));
+      }, REQUEST_TIMEOUT_MS);
+
+      worker.pending.set(id, { resolve, reject, timer });
+      worker.process.stdin.write(JSON.stringify({ id, features: this.toModelInput(soilFeatures) }) + '\n');
+    });
+  }
+
+  stopWorkers() {
+    for (const worker of this.workers) {
+      worker.process.stdin.end();
+    }
+    this.workers = [];
   }
 
   async callPythonPredictor(soilFeatures) {
     return new Promise((resolve, reject) => {
-      // Convert soil features to ML model format
-      const mlInput = {
-        N: soilFeatures.nitrogen,
-        P: soilFeatures.phosphorus,
-        K: soilFeatures.potassium,
-        pH: soilFeatures.ph,
-        EC: soilFeatures.ec,
-        OC: soilFeatures.organic_matter,
-        S: soilFeatures.sulfur || 10,
-        Zn: soilFeatures.zinc || 0.6,
-        Fe: soilFeatures.iron || 3.5,
-        Cu: soilFeatures.copper || 0.25,
-        Mn: soilFeatures.manganese || 2.8,
-        B: soilFeatures.boron || 0.4
-      };
+      const mlInput = this.toModelInput(soilFeatures);
 
       const pythonProcess = spawn('python3', [this.pythonScript], {
         stdio: ['pipe', 'pipe', 'pipe']
@@ -64,9 +159,9 @@ class MLIntegration {
       setTimeout(() => {
         pythonProcess.kill();
         reject(new Error('Python script timeout'));
-      }, 30000);
+      }, REQUEST_TIMEOUT_MS);
     });
   }
 }
 
-module.exports = MLIntegration;
\ No newline at end of file
+module.exports = MLIntegration;
@@ -3,98 +3,416 @@
 Train a machine learning model for soil fertility prediction.
 This script creates synthetic training data and trains a RandomForest classifier.
 
-Feature order: ['N', 'P', 'K', 'pH', 'EC', 'OC', 'S', 'Zn', 'Fe', 'Cu', 'Mn', 'B']
+Feature order and ranges: feature_schema.FEATURES (shared with predictor.py)
 Output: Fertility class (Low, Medium, High)
 """
 
+import os
+import json
+import time
+import argparse
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
-import matplotlib.pyplot as plt
+from forest_engine import ArrayForest, export_forest, save_forest, save_forest_mmap
+from feature_schema import FEATURE_ORDER, valid_rows
 
-# Feature order - CRITICAL: predictor.py must use same order
-FEATURE_ORDER = ['N', 'P', 'K', 'pH', 'EC', 'OC', 'S', 'Zn', 'Fe', 'Cu', 'Mn', 'B']
+FERTILITY_CLASSES = ['Low', 'Medium', 'High']
+CLASS_PROBABILITIES = [0.3, 0.4, 0.3]
 
-def generate_synthetic_data(n_samples=2000):
+# Per-class feature mean and standard deviation, in FEATURE_ORDER
+CLASS_MEANS = {
+    # High fertility: higher NPK and organic carbon, near optimal pH
+    'High':   [70, 30, 180, 6.8, 1.2, 3.5, 15, 1.0, 5.0, 0.4, 4.0, 0.6],
+    'Medium': [45, 20, 120, 6.2, 0.8, 2.2, 10, 0.6, 3.5, 0.25, 2.8, 0.4],
+    'Low':    [25, 12, 70, 5.8, 0.4, 1.2, 6, 0.3, 2.0, 0.15, 1.5, 0.2],
+}
+CLASS_STDS = {
+    'High':   [15, 8, 30, 0.4, 0.3, 0.8, 3, 0.2, 1.0, 0.1, 0.8, 0.1],
+    'Medium': [12, 6, 25, 0.6, 0.3, 0.6, 2, 0.2, 1.2, 0.08, 0.6, 0.1],
+    'Low':    [8, 4, 20, 0.8, 0.2, 0.4, 2, 0.1, 0.8, 0.05, 0.4, 0.05],
+}
+
+LABEL_COLUMN = 'fertility_class'
+DEFAULT_TRAIN_CHUNK = 100_000
+DEFAULT_TREES_PER_CHUNK = 10
+# Rows kept back from the streamed chunks for evaluation and the export parity check
+HOLDOUT_MAX_ROWS = 100_000
+# Reservoir sample size per class, and the rows drawn from it for a chunk missing that class
+CLASS_RESERVE_ROWS = 10_000
+CLASS_PAD_ROWS = 1000
+
+# Served artifacts, written to the working directory and published to the model registry
+MODEL_FILES = ('soil_fertility_model.joblib', 'soil_fertility_model.npz', 'soil_fertility_model.forest')
+# Full forest kept for --resume when a compaction variant is served instead; the
+# joblib engine refuses to serve it, since it would disagree with the array engines
+FULL_MODEL_FILE = 'soil_fertility_model.full.joblib'
+
+# Physical constraints applied column-wise after sampling
+FEATURE_LOWER = [0, 0, 0, 3.5, 0.1, 0.1, 0, 0, 0, 0, 0, 0]
+FEATURE_UPPER = [np.inf, np.inf, np.inf, 9.5] + [np.inf] * 8
+
+def generate_synthetic_block(rng, n_samples):
+    """Draw one block of samples: class labels plus a (n_samples, 12) feature matrix"""
+    class_index = rng.choice(len(FERTILITY_CLASSES), size=n_samples, p=CLASS_PROBABILITIES)
+    
+    # Scale one standard normal matrix by each row's class mean/std
+    means = np.array([CLASS_MEANS[c] for c in FERTILITY_CLASSES])
+    stds = np.array([CLASS_STDS[c] for c in FERTILITY_CLASSES])
+    features = rng.standard_normal((n_samples, len(FEATURE_ORDER)))
+    features *= stds[class_index]
+    features += means[class_index]
+    
+    np.clip(features, FEATURE_LOWER, FEATURE_UPPER, out=features)
+    return features, np.array(FERTILITY_CLASSES)[class_index]
+
+def iter_synthetic_chunks(n_samples, chunk_size=1_000_000, seed=42):
+    """Yield (features, labels) chunks with independent, reproducible streams
+    
+    Each chunk gets its own child of SeedSequence(seed), so chunks can be
+    generated in any order or in parallel and still give the same data for
+    a given seed and chunk size.
+    """
+    n_chunks = max(1, -(-n_samples // chunk_size))
+    for i, child in enumerate(np.random.SeedSequence(seed).spawn(n_chunks)):
+        size = min(chunk_size, n_samples - i * chunk_size)
+        yield generate_synthetic_block(np.random.default_rng(child), size)
+
+def generate_synthetic_data(n_samples=2000, seed=42):
     """Generate synthetic soil fertility data for training"""
-    np.random.seed(42)
+    features, labels = next(iter_synthetic_chunks(n_samples, chunk_size=max(n_samples, 1), seed=seed))
+    df = pd.DataFrame(features, columns=FEATURE_ORDER)
+    df['fertility_class'] = labels
+    return df
+
+def write_synthetic_data(path, n_samples, chunk_size=1_000_000, seed=42):
+    """Write synthetic data to .npy or Parquet in chunks without holding it all in memory
     
-    data = []
+    For .npy the features go to PATH and the labels to PATH with a
+    _labels.npy suffix; Parquet needs pyarrow.
+    """
+    path = str(path)
+    chunks = iter_synthetic_chunks(n_samples, chunk_size, seed)
     
-    for _ in range(n_samples):
-        # Generate correlated soil features
-        fertility_level = np.random.choice(['Low', 'Medium', 'High'], p=[0.3, 0.4, 0.3])
-        
-        if fertility_level == 'High':
-            # High fertility soils
-            N = np.random.normal(70, 15)  # Higher nitrogen
-            P = np.random.normal(30, 8)   # Higher phosphorus
-            K = np.random.normal(180, 30) # Higher potassium
-            pH = np.random.normal(6.8, 0.4) # Near optimal pH
-            EC = np.random.normal(1.2, 0.3) # Moderate conductivity
-            OC = np.random.normal(3.5, 0.8) # Higher organic carbon
-            S = np.random.normal(15, 3)   # Adequate sulfur
-            Zn = np.random.normal(1.0, 0.2) # Good zinc
-            Fe = np.random.normal(5.0, 1.0) # Good iron
-            Cu = np.random.normal(0.4, 0.1) # Adequate copper
-            Mn = np.random.normal(4.0, 0.8) # Good manganese
-            B = np.random.normal(0.6, 0.1)  # Adequate boron
-            
-        elif fertility_level == 'Medium':
-            # Medium fertility soils
-            N = np.random.normal(45, 12)
-            P = np.random.normal(20, 6)
-            K = np.random.normal(120, 25)
-            pH = np.random.normal(6.2, 0.6)
-            EC = np.random.normal(0.8, 0.3)
-            OC = np.random.normal(2.2, 0.6)
-            S = np.random.normal(10, 2)
-            Zn = np.random.normal(0.6, 0.2)
-            Fe = np.random.normal(3.5, 1.2)
-            Cu = np.random.normal(0.25, 0.08)
-            Mn = np.random.normal(2.8, 0.6)
-            B = np.random.normal(0.4, 0.1)
-            
-        else:  # Low fertility
-            # Low fertility soils
-            N = np.random.normal(25, 8)
-            P = np.random.normal(12, 4)
-            K = np.random.normal(70, 20)
-            pH = np.random.normal(5.8, 0.8)
-            EC = np.random.normal(0.4, 0.2)
-            OC = np.random.normal(1.2, 0.4)
-            S = np.random.normal(6, 2)
-            Zn = np.random.normal(0.3, 0.1)
-            Fe = np.random.normal(2.0, 0.8)
-            Cu = np.random.normal(0.15, 0.05)
-            Mn = np.random.normal(1.5, 0.4)
-            B = np.random.normal(0.2, 0.05)
+    if path.endswith('.npy'):
+        labels_path = path[:-len('.npy')] + '_labels.npy'
+        X = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(n_samples, len(FEATURE_ORDER)))
+        y = np.lib.format.open_memmap(labels_path, mode='w+', dtype='<U6', shape=(n_samples,))
+        start = 0
+        for features, labels in chunks:
+            X[start:start + len(labels)] = features
+            y[start:start + len(labels)] = labels
+            start += len(labels)
+        X.flush()
+        y.flush()
+        return [path, labels_path]
+    
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Writing Parquet requires pyarrow (pip install pyarrow)")
         
-        # Apply constraints and add some noise
-        N = max(0, N)
-        P = max(0, P)
-        K = max(0, K)
-        pH = np.clip(pH, 3.5, 9.5)
-        EC = max(0.1, EC)
-        OC = max(0.1, OC)
-        S = max(0, S)
-        Zn = max(0, Zn)
-        Fe = max(0, Fe)
-        Cu = max(0, Cu)
-        Mn = max(0, Mn)
-        B = max(0, B)
+        writer = None
+        try:
+            for features, labels in chunks:
+                columns = {name: features[:, j] for j, name in enumerate(FEATURE_ORDER)}
+                columns['fertility_class'] = labels
+                table = pa.table(columns)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+        return [path]
+    
+    raise ValueError(f"Unsupported output format for {path} (use .npy or .parquet)")
+
+def iter_dataset_chunks(path, chunk_size=DEFAULT_TRAIN_CHUNK):
+    """Yield (features, labels) chunks of a CSV, Parquet or .npy dataset as float32
+    
+    CSV and Parquet files need the FEATURE_ORDER columns plus LABEL_COLUMN;
+    .npy is the layout written by write_synthetic_data. Only one chunk is
+    held in memory at a time.
+    """
+    path = str(path)
+    
+    if path.endswith('.npy'):
+        X = np.load(path, mmap_mode='r')
+        y = np.load(path[:-len('.npy')] + '_labels.npy', mmap_mode='r')
+        for start in range(0, len(y), chunk_size):
+            yield np.asarray(X[start:start + chunk_size], dtype=np.float32), np.asarray(y[start:start + chunk_size])
+        return
+    
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Reading Parquet requires pyarrow (pip install pyarrow)")
         
-        data.append([N, P, K, pH, EC, OC, S, Zn, Fe, Cu, Mn, B, fertility_level])
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=FEATURE_ORDER + [LABEL_COLUMN]):
+            features = np.empty((batch.num_rows, len(FEATURE_ORDER)), dtype=np.float32)
+            for j, name in enumerate(FEATURE_ORDER):
+                features[:, j] = batch.column(name).to_numpy(zero_copy_only=False)
+            yield features, batch.column(LABEL_COLUMN).to_numpy(zero_copy_only=False).astype(str)
+        return
+    
+    if path.endswith(('.csv', '.csv.gz')):
+        reader = pd.read_csv(path, chunksize=chunk_size, usecols=FEATURE_ORDER + [LABEL_COLUMN],
+                             dtype={name: np.float32 for name in FEATURE_ORDER})
+        for frame in reader:
+            yield frame[FEATURE_ORDER].to_numpy(dtype=np.float32), frame[LABEL_COLUMN].astype(str).to_numpy()
+        return
+    
+    raise ValueError(f"Unsupported dataset format for {path} (use .csv, .parquet or .npy)")
+
+def export_model_arrays(model, filename, mmap_filename, X_check):
+    """Export the forest as flat node arrays and check parity with sklearn"""
+    arrays = export_forest(model, FEATURE_ORDER)
+    save_forest(arrays, filename)
+    save_forest_mmap(arrays, mmap_filename)
+    
+    # The array engine must reproduce predict_proba before we ship it
+    expected = model.predict_proba(X_check)
+    max_diff = 0.0
+    for forest in (ArrayForest.load(filename), ArrayForest.load_mmap(mmap_filename, FEATURE_ORDER)):
+        actual = forest.predict_proba(X_check)
+        max_diff = max(max_diff, float(np.max(np.abs(expected - actual))))
+        if not np.allclose(expected, actual, atol=1e-9):
+            raise RuntimeError(f"Array forest export does not match predict_proba (max diff {max_diff:.2e})")
+    
+    return max_diff
+
+# Hyperparameters of the production model
+DEFAULT_PARAMS = {
+    'n_estimators': 100,
+    'max_depth': 10,
+    'min_samples_split': 5,
+    'min_samples_leaf': 2,
+}
+
+# Grid explored by --search
+SEARCH_GRID = {
+    'n_estimators': [25, 50, 100],
+    'max_depth': [6, 10, None],
+    'min_samples_split': [2, 5],
+    'min_samples_leaf': [1, 2, 4],
+}
+
+# Accuracy given up per millisecond of array-engine time for 1,000 rows
+DEFAULT_LATENCY_WEIGHT = 0.001
+LATENCY_ROWS = 1000
+
+_search_data = None
+
+def _init_search_worker(X, y):
+    """Keep the training split in each search worker"""
+    global _search_data
+    _search_data = (X, y)
+
+def _rss_kb(field):
+    """VmRSS or VmHWM of this process in kB from /proc/self/status, or None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _start_peak_rss():
+    """Reset the RSS high-water mark where possible and return the RSS it is measured from, in kB
+    
+    Forked workers inherit the fork server's ru_maxrss, so the high-water
+    mark is cleared through /proc/self/clear_refs on Linux. Elsewhere the
+    inherited ru_maxrss is the baseline, and only growth above it shows.
+    """
+    import resource
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _rss_kb('VmRSS')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _peak_rss_kb():
+    """RSS high-water mark in kB since _start_peak_rss()"""
+    import resource
+    return _rss_kb('VmHWM') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def evaluate_candidate(params, cv=5, random_state=42):
+    """Cross-validate one hyperparameter set and measure its cost
+    
+    peak_rss_delta_mb is the candidate's peak memory above the worker's
+    RSS when the task started. Also records wall-clock time, CV accuracy,
+    serialized model size and array-engine latency.
+    """
+    import pickle
+    from sklearn.model_selection import cross_val_score
+    
+    X, y = _search_data
+    baseline_kb = _start_peak_rss()
+    started = time.perf_counter()
+    model = RandomForestClassifier(random_state=random_state, n_jobs=1, **params)
+    scores = cross_val_score(model, X, y, cv=cv, scoring='accuracy', n_jobs=1)
+    model.fit(X, y)
+    wall_s = time.perf_counter() - started
+    peak_rss_kb = max(_peak_rss_kb() - baseline_kb, 0)
+    
+    # Latency is measured on the engine predictor.py serves with
+    forest = ArrayForest.from_arrays(export_forest(model, FEATURE_ORDER))
+    X_latency = np.resize(X, (LATENCY_ROWS, X.shape[1]))
+    forest.predict_proba(X_latency)
+    latency_s = min(_timed(forest.predict_proba, X_latency) for _ in range(5))
+    
+    return {
+        'params': params,
+        'cv_accuracy': float(scores.mean()),
+        'cv_accuracy_std': float(scores.std()),
+        'wall_s': round(wall_s, 3),
+        'peak_rss_delta_mb': round(peak_rss_kb / 1024, 1),
+        'model_size_kb': round(len(pickle.dumps(model)) / 1024, 1),
+        'n_nodes': int(sum(tree.tree_.node_count for tree in model.estimators_)),
+        'latency_ms_per_1k': round(latency_s * 1000 * 1000 / LATENCY_ROWS, 3),
+    }
+
+def _timed(fn, *args):
+    """Wall-clock seconds for one call"""
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+def search_hyperparameters(X, y, grid=None, cv=5, workers=None, latency_weight=DEFAULT_LATENCY_WEIGHT,
+                           random_state=42):
+    """Evaluate every grid candidate across a process pool
+    
+    Candidates are ranked by objective = cv_accuracy - latency_weight *
+    latency_ms_per_1k, so a smaller, faster forest wins over a slightly
+    more accurate one.
+    """
+    import multiprocessing
+    from itertools import product
+    from concurrent.futures import ProcessPoolExecutor
+    
+    grid = grid or SEARCH_GRID
+    candidates = [dict(zip(grid, values)) for values in product(*grid.values())]
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    
+    # One worker process per candidate keeps one candidate's memory from
+    # inflating the next one's; the fork server preloads the heavy imports so new workers start quickly
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(['numpy', 'pandas', 'sklearn.ensemble', 'sklearn.model_selection'])
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, max_tasks_per_child=1,
+                             initializer=_init_search_worker, initargs=(X, y)) as pool:
+        results = list(pool.map(evaluate_candidate, candidates, [cv] * len(candidates),
+                                [random_state] * len(candidates)))
+    
+    for result in results:
+        result['objective'] = round(result['cv_accuracy'] - latency_weight * result['latency_ms_per_1k'], 5)
+    return sorted(results, key=lambda r: r['objective'], reverse=True)
+
+def compact_model(model, X_test, y_test, keep_trees=None, random_state=42):
+    """Report accuracy, size and latency of every compaction variant
+    
+    The held-out split is halved: trees are ranked on one half and every
+    variant is scored on the other, against the full forest.
+    """
+    from compact_model import compaction_report, DEFAULT_KEEP_TREES
+    
+    X_select, X_eval, y_select, y_eval = train_test_split(
+        X_test.to_numpy(), y_test.to_numpy(), test_size=0.5, random_state=random_state, stratify=y_test
+    )
+    # Unlabelled transfer set for distillation, labelled by the full forest
+    X_transfer = generate_synthetic_data(20000, seed=7)[FEATURE_ORDER].to_numpy()
+    
+    report = compaction_report(
+        model, export_forest(model, FEATURE_ORDER), X_select, y_select, X_eval, y_eval,
+        keep_trees=keep_trees or DEFAULT_KEEP_TREES, X_transfer=X_transfer
+    )
     
-    return pd.DataFrame(data, columns=FEATURE_ORDER + ['fertility_class'])
+    print("\nCompaction report (held-out evaluation half):")
+    print(pd.DataFrame({name: metrics for name, (_, metrics) in report.items()}).T.to_string())
+    with open('compaction_report.json', 'w') as f:
+        json.dump({name: metrics for name, (_, metrics) in report.items()}, f, indent=2)
+    print("Compaction report saved to compaction_report.json")
+    
+    return report
+
+def write_atomically(path, write):
+    """Call write(tmp_path), then rename the result over path so readers never see a partial file"""
+    root, ext = os.path.splitext(path)
+    tmp = f'{root}.{os.getpid()}.tmp{ext}'
+    write(tmp)
+    os.replace(tmp, path)
+
+def save_model(model, X_check):
+    """Write the joblib model, the array artifacts and feature_order.txt"""
+    model_filename = MODEL_FILES[0]
+    write_atomically(model_filename, lambda tmp: joblib.dump(model, tmp))
+    if os.path.exists(FULL_MODEL_FILE):
+        # Left over from a run that served a compaction variant
+        os.remove(FULL_MODEL_FILE)
+    print(f"\nModel saved as {model_filename}")
+    
+    # Export flat node arrays for the sklearn-free predictor engine
+    arrays_filename, mmap_filename = MODEL_FILES[1:]
+    tmp_arrays, tmp_mmap = [f'{root}.{os.getpid()}.tmp{ext}' for root, ext in map(os.path.splitext, MODEL_FILES[1:])]
+    max_diff = export_model_arrays(model, tmp_arrays, tmp_mmap, X_check)
+    os.replace(tmp_arrays, arrays_filename)
+    os.replace(tmp_mmap, mmap_filename)
+    print(f"Forest arrays saved as {arrays_filename} and {mmap_filename} (parity max diff {max_diff:.2e})")
+    
+    # Save feature order for reference
+    with open('feature_order.txt', 'w') as f:
+        f.write('\n'.join(FEATURE_ORDER))
+    print("Feature order saved to feature_order.txt")
+    
+    return arrays_filename, mmap_filename
+
+def publish_model(model, metrics, registry=None, files=MODEL_FILES, n_trees=None):
+    """Publish the saved artifacts as a new model registry version and make it current
+    
+    n_trees is the size of the served forest (a compaction variant may be
+    smaller than model).
+    """
+    from model_registry import publish
+    from feature_schema import SCHEMA_VERSION
+    
+    params = model.get_params()
+    version = publish(list(files), {
+        'features': FEATURE_ORDER,
+        'schema_version': SCHEMA_VERSION,
+        'classes': [str(c) for c in model.classes_],
+        'n_trees': n_trees or len(model.estimators_),
+        'params': {name: params[name] for name in DEFAULT_PARAMS},
+        'metrics': metrics,
+    }, registry)
+    print(f"Published model version {version}")
+    return version
 
-def train_model():
-    """Train the soil fertility prediction model"""
+def train_model(n_samples=2000, params=None, search=False, workers=None,
+                latency_weight=DEFAULT_LATENCY_WEIGHT, compact=False, compact_apply=None,
+                keep_trees=None, publish=True, registry=None, random_state=42):
+    """Train the soil fertility prediction model and publish it to the model registry
+    
+    random_state seeds the synthetic data, the train/test split, the search
+    and the forest, so a run is reproducible.
+    """
     print("Generating synthetic training data...")
-    df = generate_synthetic_data(2000)
+    df = generate_synthetic_data(n_samples, seed=random_state)
+    
+    # Only train on rows the predictor would accept
+    valid = valid_rows(df[FEATURE_ORDER].to_numpy())
+    if not valid.all():
+        print(f"Dropping {int((~valid).sum())} rows outside the feature schema")
+        df = df[valid]
     
     # Features and target
     X = df[FEATURE_ORDER]
@@ -106,20 +424,30 @@ def train_model():
     
     # Split the data
     X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
+        X, y, test_size=0.2, random_state=random_state, stratify=y
     )
     
+    params = dict(params or DEFAULT_PARAMS)
+    if search:
+        print("\nSearching hyperparameters...")
+        started = time.perf_counter()
+        results = search_hyperparameters(X_train, y_train, workers=workers, latency_weight=latency_weight,
+                                         random_state=random_state)
+        print(f"Evaluated {len(results)} candidates in {time.perf_counter() - started:.1f}s")
+        print(pd.DataFrame([{**r['params'], **{k: v for k, v in r.items() if k != 'params'}}
+                            for r in results]).head(10).to_string(index=False))
+        with open('hyperparameter_search.json', 'w') as f:
+            json.dump(results, f, indent=2)
+        print("Search results saved to hyperparameter_search.json")
+        params = results[0]['params']
+    
     # Train RandomForest classifier
-    print("\nTraining RandomForest classifier...")
-    model = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=10,
-        min_samples_split=5,
-        min_samples_leaf=2,
-        random_state=42
-    )
+    print(f"\nTraining RandomForest classifier with {params}...")
+    model = RandomForestClassifier(random_state=random_state, n_jobs=-1, **params)
     
     model.fit(X_train, y_train)
+    # Fit on every core, but serve single-threaded: per-request thread pools cost more than they save
+    model.set_params(n_jobs=None)
     
     # Evaluate the model
     y_pred = model.predict(X_test)
@@ -139,18 +467,259 @@ def train_model():
     print("\nFeature Importance:")
     print(feature_importance)
     
-    # Save the model
-    model_filename = 'soil_fertility_model.joblib'
-    joblib.dump(model, model_filename)
-    print(f"\nModel saved as {model_filename}")
+    arrays_filename, mmap_filename = save_model(model, X_test.to_numpy())
+    served_files, served_trees = MODEL_FILES, len(model.estimators_)
     
-    # Save feature order for reference
-    with open('feature_order.txt', 'w') as f:
-        f.write('\n'.join(FEATURE_ORDER))
-    print("Feature order saved to feature_order.txt")
+    if compact or compact_apply:
+        report = compact_model(model, X_test, y_test, keep_trees, random_state)
+        if compact_apply:
+            if compact_apply not in report:
+                raise ValueError(f"Unknown compaction variant {compact_apply!r}; choose from {list(report)}")
+            # Only the array engines can serve the variant; the full forest is kept for --resume
+            # under another name so the joblib engine cannot serve a different model
+            arrays = report[compact_apply][0]
+            write_atomically(arrays_filename, lambda tmp: save_forest(arrays, tmp))
+            write_atomically(mmap_filename, lambda tmp: save_forest_mmap(arrays, tmp))
+            os.replace(MODEL_FILES[0], FULL_MODEL_FILE)
+            served_files, served_trees = (FULL_MODEL_FILE,) + MODEL_FILES[1:], len(arrays['roots'])
+            print(f"Compaction variant {compact_apply!r} saved as {arrays_filename} and {mmap_filename} "
+                  f"({served_trees} trees); full forest kept as {FULL_MODEL_FILE}")
+    
+    if publish:
+        metrics = {'accuracy': round(float(accuracy), 4), 'train_rows': len(y_train), 'test_rows': len(y_test)}
+        if compact_apply:
+            metrics['compaction'] = compact_apply
+        publish_model(model, metrics, registry, served_files, served_trees)
     
     return model, feature_importance
 
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class ClassReservoir:
+    """Uniform reservoir sample (Algorithm R) of up to size training rows per class"""
+    
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self._rows = {}
+    
+    def add(self, features, labels):
+        """Offer every row of a chunk to its class's sample"""
+        for label in np.unique(labels):
+            rows = features[labels == label]
+            if label not in self._rows:
+                self._rows[label] = [np.empty((self.size, rows.shape[1]), dtype=rows.dtype), 0, 0]
+            sample, filled, seen = self._rows[label]
+            take = min(self.size - filled, len(rows))
+            sample[filled:filled + take] = rows[:take]
+            # Row number t (0-based) replaces a random slot with probability size / (t + 1)
+            slots = self.rng.integers(0, np.arange(seen + take, seen + len(rows)) + 1)
+            keep = slots < self.size
+            sample[slots[keep]] = rows[take:][keep]
+            self._rows[label][1:] = [filled + take, seen + len(rows)]
+    
+    def covers(self, classes):
+        """True once every class has at least one row"""
+        return all(label in self._rows for label in classes)
+    
+    def sample(self, label, n):
+        """Up to n rows of one class drawn without replacement, with their labels"""
+        sample, filled, _ = self._rows[label]
+        rows = sample[self.rng.choice(filled, size=min(n, filled), replace=False)]
+        return rows, np.full(len(rows), label)
+
+class SpillFile:
+    """Temporary on-disk buffer of float32 training rows and their class indices"""
+    
+    def __init__(self, classes, n_features):
+        import tempfile
+        self.classes = np.asarray(classes)
+        self.n_features = n_features
+        self._features = tempfile.TemporaryFile()
+        self._labels = tempfile.TemporaryFile()
+    
+    def append(self, features, labels):
+        self._features.write(np.ascontiguousarray(features, dtype=np.float32).tobytes())
+        self._labels.write(np.searchsorted(self.classes, labels).astype(np.uint16).tobytes())
+    
+    def replay(self, chunk_size):
+        """Yield the spilled (features, labels) in order, chunk_size rows at a time"""
+        self._features.seek(0)
+        self._labels.seek(0)
+        while True:
+            labels = np.frombuffer(self._labels.read(chunk_size * 2), dtype=np.uint16)
+            if not len(labels):
+                return
+            features = np.frombuffer(self._features.read(len(labels) * self.n_features * 4), dtype=np.float32)
+            yield features.reshape(len(labels), self.n_features), self.classes[labels]
+    
+    def close(self):
+        self._features.close()
+        self._labels.close()
+
+def train_streaming(path, chunk_size=DEFAULT_TRAIN_CHUNK, trees_per_chunk=DEFAULT_TREES_PER_CHUNK,
+                    params=None, resume=None, holdout=0.1, seed=42, publish=True, registry=None):
+    """Train the forest chunk by chunk from a dataset on disk
+    
+    Each chunk adds trees_per_chunk trees fitted on that chunk (warm_start
+    with a growing n_estimators), so memory is bounded by the chunk size
+    rather than the dataset. resume extends an existing joblib model with
+    the new data instead of starting from scratch. A holdout fraction of
+    every chunk (up to HOLDOUT_MAX_ROWS rows) is kept back for evaluation.
+    Every fit must see every class: rows read before each class has
+    appeared are spilled to a temporary file and replayed once it has, and
+    a chunk missing a class borrows CLASS_PAD_ROWS rows drawn from a
+    per-class reservoir sample (see ClassReservoir).
+    """
+    params = {k: v for k, v in (params or DEFAULT_PARAMS).items() if k != 'n_estimators'}
+    if resume:
+        model = joblib.load(resume)
+        model.set_params(warm_start=True, n_jobs=-1)
+        print(f"Extending {resume} ({len(model.estimators_)} trees)")
+    else:
+        model = RandomForestClassifier(random_state=seed, n_jobs=-1, warm_start=True,
+                                       n_estimators=trees_per_chunk, **params)
+    # Every fit must see the same classes, or the new trees' outputs would not line up
+    classes = set(map(str, model.classes_)) if resume else set(FERTILITY_CLASSES)
+    
+    rng = np.random.default_rng(seed)
+    held_X, held_y = [], []
+    n_held = n_trained = n_dropped = n_spilled = n_chunks = 0
+    reservoir = ClassReservoir(CLASS_RESERVE_ROWS, rng)
+    spill = None
+    
+    def fit_chunk(features, labels):
+        nonlocal n_trained, n_chunks
+        n_rows = len(labels)
+        missing = sorted(classes - set(np.unique(labels)))
+        if missing:
+            # Every fit needs every class: lend the chunk a random sample of the missing ones
+            borrowed = [reservoir.sample(label, CLASS_PAD_ROWS) for label in missing]
+            features = np.concatenate([features] + [X for X, _ in borrowed])
+            labels = np.concatenate([labels] + [y for _, y in borrowed])
+        if hasattr(model, 'estimators_'):
+            model.set_params(n_estimators=len(model.estimators_) + trees_per_chunk)
+        model.fit(features, labels)
+        n_trained += n_rows
+        n_chunks += 1
+        print(f"Chunk {n_chunks}: {n_rows} rows{f' (+{len(labels) - n_rows} borrowed)' if missing else ''}, "
+              f"{len(model.estimators_)} trees, peak RSS {peak_rss_mb():.1f} MB")
+    
+    started = time.perf_counter()
+    for features, labels in iter_dataset_chunks(path, chunk_size):
+        unknown = set(np.unique(labels)) - classes
+        if unknown:
+            raise ValueError(f"Unknown {LABEL_COLUMN} values {sorted(unknown)}; expected {sorted(classes)}")
+        
+        valid = valid_rows(features)
+        n_dropped += int((~valid).sum())
+        features, labels = features[valid], labels[valid]
+        
+        test = rng.random(len(labels)) < holdout
+        if n_held < HOLDOUT_MAX_ROWS and test.any():
+            room = HOLDOUT_MAX_ROWS - n_held
+            held_X.append(features[test][:room])
+            held_y.append(labels[test][:room])
+            n_held += len(held_y[-1])
+        features, labels = features[~test], labels[~test]
+        X_last = features
+        
+        reservoir.add(features, labels)
+        if not reservoir.covers(classes):
+            # Until every class has appeared, rows wait on disk rather than in memory
+            if spill is None:
+                spill = SpillFile(sorted(classes), features.shape[1])
+            spill.append(features, labels)
+            n_spilled += len(labels)
+            continue
+        if spill is not None:
+            print(f"Replaying {n_spilled} rows spilled to disk before every class had appeared")
+            for spilled_features, spilled_labels in spill.replay(chunk_size):
+                fit_chunk(spilled_features, spilled_labels)
+            spill.close()
+            spill = None
+        fit_chunk(features, labels)
+    
+    if spill is not None:
+        spill.close()
+    if not n_chunks:
+        raise ValueError(f"{path} does not contain every class in {sorted(classes)}")
+    model.set_params(n_jobs=None)
+    
+    print(f"\nTrained {len(model.estimators_)} trees on {n_trained} rows in "
+          f"{time.perf_counter() - started:.1f}s ({n_dropped} rows outside the feature schema dropped)")
+    
+    metrics = {'train_rows': n_trained}
+    if n_held:
+        X_test, y_test = np.concatenate(held_X), np.concatenate(held_y)
+        y_pred = model.predict(X_test)
+        metrics.update(accuracy=round(float(accuracy_score(y_test, y_pred)), 4), test_rows=n_held)
+        print(f"Holdout accuracy ({n_held} rows): {metrics['accuracy']:.3f}")
+        print(classification_report(y_test, y_pred))
+        X_check = X_test[:LATENCY_ROWS]
+    else:
+        X_check = X_last[:LATENCY_ROWS]
+    
+    save_model(model, X_check)
+    if publish:
+        publish_model(model, metrics, registry)
+    summary = {
+        'rows': n_trained,
+        'chunks': n_chunks,
+        'trees': len(model.estimators_),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+    print(f"Peak RSS: {summary['peak_rss_mb']} MB")
+    return model, summary
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Train the soil fertility model')
+    parser.add_argument('--generate-data', metavar='PATH',
+                        help='Only write synthetic data to PATH (.npy or .parquet) and exit')
+    parser.add_argument('--samples', type=int, default=2000, help='Number of synthetic samples')
+    parser.add_argument('--chunk-size', type=int,
+                        help=f'Rows per chunk (default: 1000000 generated, {DEFAULT_TRAIN_CHUNK} with --train-data)')
+    parser.add_argument('--train-data', metavar='PATH',
+                        help='Train chunk by chunk from a CSV, Parquet or .npy dataset instead of synthetic data')
+    parser.add_argument('--trees-per-chunk', type=int, default=DEFAULT_TREES_PER_CHUNK,
+                        help='Trees added per chunk with --train-data')
+    parser.add_argument('--resume', metavar='MODEL',
+                        help='Add --train-data trees to an existing joblib model instead of starting over')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Random seed for data generation, splits, the search and the forest')
+    parser.add_argument('--search', action='store_true',
+                        help='Cross-validated hyperparameter search across a process pool before training')
+    parser.add_argument('--workers', type=int, help='Search worker processes (default: all cores)')
+    parser.add_argument('--compact', action='store_true',
+                        help='Report tree pruning, quantization and distillation trade-offs after training')
+    parser.add_argument('--compact-apply', metavar='VARIANT',
+                        help='Serve a compaction variant (e.g. prune-25, quantized, distilled) from the array artifacts')
+    parser.add_argument('--keep-trees', type=lambda v: [int(k) for k in v.split(',')],
+                        help='Comma-separated tree counts for the prune-K variants (default: 10,25,50)')
+    parser.add_argument('--registry', metavar='DIR',
+                        help='Model registry to publish to (default: $MODEL_REGISTRY or backend/models)')
+    parser.add_argument('--no-publish', action='store_true', help='Do not publish the model to the registry')
+    parser.add_argument('--latency-weight', type=float, default=DEFAULT_LATENCY_WEIGHT,
+                        help='Accuracy traded per ms of inference time for 1,000 rows')
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    model, importance = train_model()
-    print("\nTraining completed successfully!")
\ No newline at end of file
+    args = parse_args()
+    if args.generate_data:
+        paths = write_synthetic_data(args.generate_data, args.samples, args.chunk_size or 1_000_000, args.seed)
+        print(f"Wrote {args.samples} synthetic samples to {', '.join(paths)}")
+    elif args.train_data:
+        train_streaming(args.train_data, args.chunk_size or DEFAULT_TRAIN_CHUNK, args.trees_per_chunk,
+                        resume=args.resume, seed=args.seed, publish=not args.no_publish, registry=args.registry)
+        print("\nTraining completed successfully!")
+    else:
+        model, importance = train_model(args.samples, search=args.search, workers=args.workers,
+                                        latency_weight=args.latency_weight, compact=args.compact,
+                                        compact_apply=args.compact_apply, keep_trees=args.keep_trees,
+                                        publish=not args.no_publish, registry=args.registry,
+                                        random_state=args.seed)
+        print("\nTraining completed successfully!")
\ No newline at end of file